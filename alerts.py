@@ -0,0 +1,331 @@
+'''
+alert rules evaluated on every sample record, with constant state per rule whatever the run length:
+
+    threshold   field <op> value held for for_secs, e.g. signal < -75 dBm for 10 s
+    percentile  the p-th percentile of field over window_secs <op> value, e.g. p95 latency over 30 s > 50 ms
+    drop        field under (1 - ratio) x its run median for for_secs, e.g. throughput dropped 50%
+
+a rule notifies once when it starts firing and once when it is resolved; notifications are sent
+by Alert_notifier in its own thread, a slow or dead endpoint never holds up sampling
+'''
+
+import math
+import json
+import queue
+import operator
+import threading
+from time import monotonic
+from collections import Counter, deque
+
+from config import config
+from stats import P2_quantile
+
+operators = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+class Window_histogram:
+    '''
+    counts of log-spaced buckets (about 1% wide) over the last window_secs, kept in slices which
+    expire as a whole, so memory and a percentile query don't grow with the sample rate
+    '''
+
+    step = math.log(1.01)
+
+    def __init__(self, window_secs, slices=10):
+        self.slice_secs = window_secs / slices
+        self.slice_count = slices
+        self.slices = deque()
+        self.total = Counter()
+        self.count = 0
+
+    def bucket(self, value):
+        return int(math.copysign(math.log1p(abs(value)) / self.step, value))
+
+    def bucket_value(self, bucket):
+        # middle of the bucket, the sign is carried by the index
+        return math.copysign(math.expm1((abs(bucket) + 0.5) * self.step), bucket)
+
+    def add(self, value, ts):
+        index = int(ts // self.slice_secs)
+        self.expire(index)
+        if not self.slices or self.slices[-1][0] != index:
+            self.slices.append((index, Counter()))
+
+        bucket = self.bucket(value)
+        self.slices[-1][1][bucket] += 1
+        self.total[bucket] += 1
+        self.count += 1
+
+    def expire(self, index):
+        while self.slices and self.slices[0][0] <= index - self.slice_count:
+            _, counts = self.slices.popleft()
+            self.total.subtract(counts)
+            self.count -= sum(counts.values())
+            for bucket in [bucket for bucket, count in self.total.items() if count <= 0]:
+                del self.total[bucket]
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = p / 100 * (self.count - 1)
+        seen = 0
+        for bucket in sorted(self.total):
+            seen += self.total[bucket]
+            if seen > rank:
+                return round(self.bucket_value(bucket), 3)
+
+
+class Alert_rule:
+    '''
+    fires once its condition held for for_secs, is resolved when the condition is false again
+    '''
+
+    kind = 'threshold'
+
+    def __init__(self, name, field, op='>', value=0, for_secs=0):
+        self.name = name
+        self.field = field
+        self.op_name = op
+        self.op = operators[op]
+        self.threshold = value
+        self.for_secs = for_secs
+
+        self.since = None
+        self.firing = False
+        self.last = None
+
+    def observe(self, value, ts):
+        '''
+        what the condition is checked on, None while there is not enough data
+        '''
+        return value
+
+    def holds(self, observed):
+        return self.op(observed, self.threshold)
+
+    def describe(self):
+        held = f' for {self.for_secs} s' if self.for_secs else ''
+        return f'{self.field} {self.op_name} {self.threshold}{held}'
+
+    def update(self, value, ts):
+        '''
+        'firing' or 'resolved' on a change of state, else None
+        '''
+        observed = self.observe(value, ts)
+        if observed is None:
+            return None
+        self.last = observed
+
+        if self.holds(observed):
+            if self.since is None:
+                self.since = ts
+            if not self.firing and ts - self.since >= self.for_secs:
+                self.firing = True
+                return 'firing'
+        else:
+            self.since = None
+            if self.firing:
+                self.firing = False
+                return 'resolved'
+        return None
+
+    def alert(self, state):
+        return {
+            'rule': self.name,
+            'state': state,
+            'field': self.field,
+            'value': round(self.last, 3),
+            'threshold': self.threshold,
+            'condition': self.describe(),
+        }
+
+
+class Percentile_rule(Alert_rule):
+
+    kind = 'percentile'
+
+    def __init__(self, name, field, op='>', value=0, p=95, window_secs=30, min_samples=5, for_secs=0):
+        super().__init__(name, field, op, value, for_secs)
+        self.p = p
+        self.window_secs = window_secs
+        self.min_samples = min_samples
+        self.histogram = Window_histogram(window_secs)
+
+    def observe(self, value, ts):
+        self.histogram.add(value, ts)
+        if self.histogram.count < self.min_samples:
+            return None
+        return self.histogram.percentile(self.p)
+
+    def describe(self):
+        return f'p{self.p} {self.field} over {self.window_secs} s {self.op_name} {self.threshold}'
+
+
+class Drop_rule(Alert_rule):
+
+    kind = 'drop'
+
+    def __init__(self, name, field, ratio=0.5, for_secs=5, min_samples=10):
+        super().__init__(name, field, '<', None, for_secs)
+        self.ratio = ratio
+        self.min_samples = min_samples
+        self.median = P2_quantile(0.5)
+
+    def observe(self, value, ts):
+        # compared with the median of the samples before it
+        baseline = self.median.value
+        self.median.add(value)
+        if self.median.count <= self.min_samples or not baseline:
+            return None
+        self.threshold = round(baseline * (1 - self.ratio), 3)
+        return value
+
+    def describe(self):
+        held = f' for {self.for_secs} s' if self.for_secs else ''
+        return f'{self.field} dropped {self.ratio:.0%} below the run median{held}'
+
+
+rule_kinds = {
+    'threshold': Alert_rule,
+    'percentile': Percentile_rule,
+    'drop': Drop_rule,
+}
+
+
+def make_rule(spec):
+    '''
+    rule of a config dict: {'kind': ..., 'name': ..., 'field': ..., and the arguments of the kind}
+    '''
+    spec = dict(spec)
+    return rule_kinds[spec.pop('kind', 'threshold')](**spec)
+
+
+class Alert_engine:
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.fired = 0
+
+    def evaluate(self, fields, ts):
+        alerts = []
+        for rule in self.rules:
+            value = fields.get(rule.field)
+            if value is None:
+                continue
+            state = rule.update(value, ts)
+            if state is not None:
+                self.fired += state == 'firing'
+                alerts.append(rule.alert(state))
+        return alerts
+
+
+class Alert_notifier:
+    '''
+    alerts are queued without blocking and posted to a webhook in batches from one thread;
+    within a batch the same (interface, rule, state) collapses into the latest one, a rule of an interface
+    notifies at most once every min_interval secs and the next one counts what was held back,
+    a resolved alert is only sent after its firing one was
+    '''
+
+    _stop = object()
+
+    def __init__(self, url, batch_secs=config['alert_batch_secs'], min_interval=config['alert_min_interval_secs'],
+                 queue_size=config['alert_queue_size'], timeout=config['alert_timeout_secs']):
+        self.url = url
+        self.batch_secs = batch_secs
+        self.min_interval = min_interval
+        self.timeout = timeout
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.last_sent = {}
+        self.held = Counter()
+        self.notified = set()
+        self.sent = 0
+        self.suppressed = 0
+        self.dropped = 0
+        self.failures = 0
+
+        self.thread = threading.Thread(target=self.loop, name='alert_notifier', daemon=True)
+        self.thread.start()
+
+    def notify(self, alert):
+        try:
+            self.queue.put_nowait(alert)
+        except queue.Full:
+            self.dropped += 1
+
+    def loop(self):
+        stopping = False
+        while not stopping:
+            first = self.queue.get()
+            if first is self._stop:
+                return
+            batch = [first]
+            deadline = monotonic() + self.batch_secs
+            while True:
+                timeout = deadline - monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    alert = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if alert is self._stop:
+                    stopping = True
+                    break
+                batch.append(alert)
+            self.send(self.admit(batch))
+
+    def admit(self, batch):
+        latest = {}
+        for alert in batch:
+            latest[(alert.get('interface'), alert['rule'], alert['state'])] = alert
+
+        admitted = []
+        now = monotonic()
+        for (interface, rule, state), alert in latest.items():
+            key = (interface, rule)
+            if state == 'resolved':
+                if key in self.notified:
+                    self.notified.discard(key)
+                    admitted.append(alert)
+                continue
+            if key in self.last_sent and now - self.last_sent[key] < self.min_interval:
+                self.held[key] += 1
+                self.suppressed += 1
+                continue
+            self.last_sent[key] = now
+            self.notified.add(key)
+            if self.held[key]:
+                alert['suppressed'] = self.held.pop(key)
+            admitted.append(alert)
+        return admitted
+
+    def send(self, alerts):
+        if not alerts:
+            return
+        try:
+            import requests
+            response = requests.post(self.url, data=json.dumps({'alerts': alerts}),
+                                     headers={'Content-Type': 'application/json'}, timeout=self.timeout)
+            response.raise_for_status()
+            self.sent += len(alerts)
+        except Exception as e:
+            self.failures += 1
+            print(f'==> alert notify failed: {e.__class__} {e}')
+
+    def close(self, timeout=None):
+        if not self.thread.is_alive():
+            return
+        try:
+            self.queue.put(self._stop, timeout=1)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            print(f'==> alert webhook still busy after {timeout} secs, {self.queue.qsize()} alerts left.')
@@ -0,0 +1,145 @@
+import asyncio
+import shlex
+from time import monotonic
+from functools import partial
+
+from go_wifi_test import Wifi_test_logger
+from profiler import profiler
+from config import config
+
+
+class Async_wifi_test_logger(Wifi_test_logger):
+    '''
+    ping, iperf, link sampling and db flushing as tasks of one asyncio event loop instead of threads,
+    blocking calls (link sampling, in-process probers, db writes) go through asyncio.to_thread
+    '''
+
+    # the flush task drains the writer queue
+    writer_thread = False
+
+    async def read_lines(self, stream, handle_line):
+        async for line in stream:
+            handle_line(line.decode('utf8', errors='replace').rstrip('\r\n'))
+
+    async def keep_running_async(self, producer, name):
+        # keep_running() of the event loop
+        while True:
+            try:
+                await producer()
+            except Exception as e:
+                if not self.daemon:
+                    raise
+                print(f'==> {name} error: {e.__class__} {e}')
+            if not self.daemon:
+                return
+            print(f'==> {name} exited, restarting in {config["producer_restart_delay"]} secs.')
+            await asyncio.sleep(config['producer_restart_delay'])
+
+    async def run_ping(self):
+        runner = self.make_ping_runner()
+
+        if runner.engine != 'ping':
+            prober = runner.make_prober()
+            try:
+                runner.stats = await asyncio.to_thread(prober.run)
+            finally:
+                prober.stop()
+            self.report_ping_stats(runner.stats)
+            return
+
+        cmd = runner.build_cmd()
+        print(f'==> ping cmd send: \n\t{cmd}\n')
+        with profiler.stage('ping_spawn'):
+            child = await asyncio.create_subprocess_exec(*shlex.split(cmd), stdout=asyncio.subprocess.PIPE,
+                                                         stderr=asyncio.subprocess.STDOUT)
+        try:
+            await self.read_lines(child.stdout, runner.handle_line)
+            await child.wait()
+        finally:
+            if child.returncode is None:
+                child.terminate()
+                await child.wait()
+        runner.finish()
+        self.report_ping_stats(runner.stats)
+
+    async def run_iperf(self, runner):
+        json_mode = await asyncio.to_thread(runner.resolve_output_mode) == 'json'
+
+        cmd = f'{runner.build_cmd()} --json-stream' if json_mode else runner.build_cmd()
+        print(f'==> iperf cmd send: \n\t{cmd}\n')
+        with profiler.stage('iperf_spawn'):
+            child = await asyncio.create_subprocess_exec(*shlex.split(cmd), stdout=asyncio.subprocess.PIPE,
+                                                         stderr=asyncio.subprocess.STDOUT)
+        try:
+            if json_mode:
+                buffer = ''
+                while chunk := await child.stdout.read(65536):
+                    buffer = runner.feed_json(buffer + chunk.decode('utf8', errors='replace'))
+            else:
+                await self.read_lines(child.stdout, runner.handle_line)
+            await child.wait()
+        finally:
+            if child.returncode is None:
+                child.terminate()
+                await child.wait()
+
+    async def run_sampler(self):
+        async for _ in self.scheduler.ticks_async():
+            # a sample writes log files and may wait on a netlink reply or the iw binary, never on the loop
+            await asyncio.to_thread(self.sample_once)
+            self.roll_summary()
+
+    async def flush_pending(self):
+        if self.writer is None:
+            return
+        while batch := self.writer.drain(self.writer.batch_size):
+            await asyncio.to_thread(self.writer.flush, batch)
+
+    async def run_flusher(self):
+        if self.writer is None:
+            return
+        loop = asyncio.get_running_loop()
+        while True:
+            deadline = loop.time() + self.writer.flush_interval
+            while self.writer.pending < self.writer.batch_size and loop.time() < deadline:
+                await asyncio.sleep(0.1)
+            await self.flush_pending()
+
+    async def wait_for_producers_async(self, timeout=config['producer_warmup_secs']):
+        deadline = monotonic() + timeout
+        while not self.producers_ready() and monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+    async def run_async(self):
+        self.get_wifi_link_status()
+
+        if self.roam_tracker is not None:
+            self.roam_tracker.start()
+        if self.scan_cache is not None:
+            self.scan_cache.start()
+        producers = [asyncio.create_task(self.keep_running_async(self.run_ping, 'ping'))]
+        if not self.no_iperf:
+            for runner in self.make_iperf_runners():
+                producers.append(asyncio.create_task(
+                    self.keep_running_async(partial(self.run_iperf, runner), f'iperf port {runner.port}')))
+        flusher = asyncio.create_task(self.run_flusher())
+
+        try:
+            await self.wait_for_producers_async()
+            await self.run_sampler()
+        finally:
+            for task in producers + [flusher]:
+                task.cancel()
+            await asyncio.gather(*producers, flusher, return_exceptions=True)
+
+        self.finish()
+
+    def close_writer(self):
+        # no writer thread: land what the flush task left before closing
+        if self.writer is not None and self.owns_writer:
+            while batch := self.writer.drain(self.writer.batch_size):
+                self.writer.flush(batch)
+        super().close_writer()
+
+    def run(self):
+        asyncio.run(self.run_async())
@@ -0,0 +1,179 @@
+#!/usr/bin/python3
+
+import json
+import gzip
+import argparse
+import threading
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from config import config
+from line_protocol import to_line_protocol
+import binlog
+
+
+def iter_records(file, offset=0):
+    '''
+    stream (end_offset, record) of a json-lines or binary log from byte offset,
+    the offsets of a gzipped log rotated away count uncompressed bytes
+    '''
+    if Path(file).suffix == binlog.suffix:
+        reader = binlog.Binlog_reader(file)
+        yield from reader.iter_with_offset(offset)
+        reader.close()
+        return
+
+    opener = gzip.open if Path(file).suffix == '.gz' else open
+    with opener(file, 'rb') as f:
+        f.seek(offset)
+        for nol, line in enumerate(f, start=1):
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                yield offset, json.loads(line)
+            except Exception as e:
+                print(f'==> \tskipping line {nol} of {file}:')
+                print(f'==> \t\t{e.__class__}, {e}')
+
+
+def iter_chunks(file, offset, chunk_size):
+    chunk = []
+    for offset, record in iter_records(file, offset):
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk, offset
+            chunk = []
+    if chunk:
+        yield chunk, offset
+
+
+class Checkpoint:
+    '''
+    byte offset of a log file already sent, one small file per log
+    '''
+
+    def __init__(self, folder, file):
+        self.file = Path(file)
+        self.path = Path(folder).joinpath(f'{self.file.name}.offset')
+
+    def load(self):
+        try:
+            offset = int(self.path.read_text())
+        except (FileNotFoundError, ValueError):
+            return 0
+        # compressed logs are never appended to, their offsets exceed the file size
+        if self.file.suffix == '.gz':
+            return offset
+        # file rewritten since last run
+        return offset if offset <= self.file.stat().st_size else 0
+
+    def save(self, offset):
+        tmp_file = self.path.with_suffix('.tmp')
+        tmp_file.write_text(str(offset))
+        tmp_file.replace(self.path)
+
+
+_local = threading.local()
+
+
+def _send_chunk(db_params, chunk):
+    # one client per send thread, reused for every chunk
+    if not hasattr(_local, 'db_cli'):
+        from influxdb import InfluxDBClient
+        _local.db_cli = InfluxDBClient(**db_params, gzip=True)
+    _local.db_cli.write_points(to_line_protocol(chunk), protocol='line')
+    return len(chunk)
+
+
+def backfill_file(file, db_params, checkpoint_folder, chunk_size, send_threads):
+    '''
+    runs in a worker process: stream one file and send its chunks concurrently,
+    the checkpoint only moves past chunks which are sent and all chunks before them
+    '''
+    checkpoint = Checkpoint(checkpoint_folder, file)
+    offset = checkpoint.load()
+    if offset:
+        print(f'==> resuming {file} from byte {offset}.')
+
+    sent = 0
+    in_flight = deque()
+
+    def ack_done(wait_all=False):
+        nonlocal sent
+        while in_flight and (wait_all or in_flight[0][0].done()):
+            future, end_offset = in_flight.popleft()
+            sent += future.result()
+            checkpoint.save(end_offset)
+
+    with ThreadPoolExecutor(max_workers=send_threads) as pool:
+        try:
+            for chunk, end_offset in iter_chunks(file, offset, chunk_size):
+                # bound memory to send_threads chunks in flight
+                while len(in_flight) >= send_threads:
+                    in_flight[0][0].result()
+                    ack_done()
+                in_flight.append((pool.submit(_send_chunk, db_params, chunk), end_offset))
+                ack_done()
+            ack_done(wait_all=True)
+        except Exception as e:
+            print(f'==> backfill of {file} stopped at {sent} records: {e.__class__} {e}')
+            return str(file), sent, False
+
+    print(f'==> {file}: {sent} records sent.')
+    return str(file), sent, True
+
+
+def log_files(f_object):
+    f_object = Path(f_object)
+    if f_object.is_dir():
+        return sorted(file for file in f_object.iterdir() if file.is_file() and file.name[:3] == 'log'
+                      and file.suffix not in ('.tmp', binlog.strings_suffix))
+    return [f_object]
+
+
+def backfill(f_object, db_params, checkpoint_folder, workers=config['backfill_workers'],
+             chunk_size=config['backfill_chunk_size'], send_threads=config['backfill_send_threads']):
+    checkpoint_folder = Path(checkpoint_folder)
+    if not checkpoint_folder.exists():
+        checkpoint_folder.mkdir(parents=True)
+
+    files = log_files(f_object)
+    print(f'==> backfilling {len(files)} files with {workers} processes.')
+
+    total = 0
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(backfill_file, file, db_params, checkpoint_folder, chunk_size, send_threads)
+                   for file in files]
+        for future in futures:
+            file, sent, ok = future.result()
+            total += sent
+            if not ok:
+                failed.append(file)
+
+    print(f'==> backfill done, {total} records sent.')
+    if failed:
+        print(f'==> {len(failed)} files not finished, run again to resume: {failed}')
+    return total, failed
+
+
+if __name__ == '__main__':
+    from influxdb_logger import Influxdb_logger
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', type=str,
+                        help='log file or folder of log files')
+    parser.add_argument('-w', '--workers', default=config['backfill_workers'], type=int,
+                        help='number of parsing processes')
+    parser.add_argument('-c', '--chunk_size', default=config['backfill_chunk_size'], type=int,
+                        help='records per write request')
+    parser.add_argument('-s', '--send_threads', default=config['backfill_send_threads'], type=int,
+                        help='concurrent write requests per file')
+    args = parser.parse_args()
+
+    logger = Influxdb_logger()
+    logger.backfill(Path(args.path), workers=args.workers, chunk_size=args.chunk_size,
+                    send_threads=args.send_threads)
+    logger.close_writer()
@@ -0,0 +1,134 @@
+import threading
+import queue
+from time import monotonic
+
+
+overflow_policies = ('block', 'drop_oldest', 'drop_newest')
+
+
+class Batch_writer:
+    '''
+    one long-lived thread draining a bounded queue of points,
+    a batch is flushed through send() when it reaches batch_size or flush_interval secs passed
+    '''
+
+    _stop = object()
+
+    def __init__(self, send, batch_size, flush_interval, queue_size, overflow_policy='drop_oldest', start=True):
+        '''
+        start=False leaves flushing to the caller, see drain()
+        '''
+        if overflow_policy not in overflow_policies:
+            raise ValueError(f'unknown overflow policy: {overflow_policy}')
+
+        self.send = send
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.is_flushing = False
+        self.last_flush_secs = None
+
+        self.thread = None
+        if start:
+            self.thread = threading.Thread(target=self.loop, name='batch_writer', daemon=True)
+            self.thread.start()
+
+    def put(self, point):
+        if self.overflow_policy == 'block':
+            # backpressure: the producer waits for the db
+            self.queue.put(point)
+            return
+
+        try:
+            self.queue.put_nowait(point)
+            return
+        except queue.Full:
+            pass
+
+        if self.overflow_policy == 'drop_oldest':
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(point)
+            except queue.Full:
+                pass
+        self.dropped += 1
+
+    def put_many(self, points):
+        for point in points:
+            self.put(point)
+
+    def flush(self, batch):
+        self.is_flushing = True
+        start = monotonic()
+        try:
+            self.send(batch)
+        except Exception as e:
+            print(f'==> batch writer error: {e.__class__} {e}')
+        finally:
+            self.last_flush_secs = monotonic() - start
+            self.is_flushing = False
+
+    def loop(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    point = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if point is self._stop:
+                    stopping = True
+                    break
+                batch.append(point)
+
+            if stopping:
+                # drain what is left before exit
+                while True:
+                    try:
+                        point = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if point is not self._stop:
+                        batch.append(point)
+
+            for i in range(0, len(batch), self.batch_size):
+                self.flush(batch[i:i + self.batch_size])
+
+    def drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    @property
+    def pending(self):
+        return self.queue.qsize()
+
+    def close(self, timeout=None):
+        if self.thread is None:
+            return
+        # sentinel bypasses the overflow policy
+        while True:
+            try:
+                self.queue.put(self._stop, timeout=1)
+                break
+            except queue.Full:
+                if not self.thread.is_alive():
+                    return
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            print(f'==> db writer still busy after {timeout} secs, {self.pending} records left.')
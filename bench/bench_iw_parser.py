@@ -0,0 +1,42 @@
+#!/usr/bin/python3
+'''
+time iw_parser on the recorded iw outputs in bench/fixtures/iw:
+
+    python3 bench/bench_iw_parser.py -n 20000
+'''
+
+import sys
+import argparse
+import timeit
+from pathlib import Path
+
+bench_folder = Path(__file__).resolve().parent
+sys.path.insert(0, str(bench_folder.parent))
+
+from iw_parser import parse_iw_info, parse_station
+
+parsers = {
+    'info': parse_iw_info,
+    'link': parse_station,
+    'station': parse_station,
+}
+
+
+def corpus():
+    for path in sorted(bench_folder.joinpath('fixtures', 'iw').glob('*.txt')):
+        scenario, _, kind = path.stem.rpartition('_')
+        yield scenario, kind, path.read_text()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number', default=20000, type=int,
+                        help='parses per fixture')
+    args = parser.parse_args()
+
+    print(f'{"fixture":<24}{"fields":>8}{"us/parse":>10}{"parses/s":>12}')
+    for scenario, kind, text in corpus():
+        parse = parsers[kind]
+        fields = sum(value is not None for value in parse(text).values())
+        secs = min(timeit.repeat(lambda: parse(text), number=args.number, repeat=3))
+        print(f'{scenario + "_" + kind:<24}{fields:>8}{secs / args.number * 1e6:>10.2f}{args.number / secs:>12.0f}')
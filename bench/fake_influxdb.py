@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+
+import re
+import gzip
+import json
+import random
+import argparse
+import threading
+from time import sleep, time_ns
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+timestamp_pattern = re.compile(rb' (\d{16,19})$')
+# rollups of the logger (e.g. wifi_test_10s) are written when their window closes, not when sampled
+rollup_pattern = re.compile(rb'^[^, ]+_\d+[smhd][, ]')
+
+
+class Fake_influxdb:
+    '''
+    local stand-in for the influxdb 1.x http write api,
+    every write waits latency (+ up to jitter) secs and fails with probability fail_rate,
+    the age of each sample point on arrival is kept as end-to-end write latency
+    '''
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, fail_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+        self.writes = 0
+        self.failures = 0
+        self.points = 0
+        self.point_ages_ms = []
+        # client (ip, port) of every write, one per connection kept alive
+        self.clients = set()
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), Fake_influxdb_handler)
+        self.httpd.fake_db = self
+        self.port = self.httpd.server_address[1]
+        self.thread = None
+
+    def write(self, body, client=None):
+        '''
+        return the http status of a write request
+        '''
+        with self.lock:
+            self.clients.add(client)
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            fail = self.random.random() < self.fail_rate
+        sleep(delay)
+
+        with self.lock:
+            self.writes += 1
+            if fail:
+                self.failures += 1
+                return 500
+            now_ns = time_ns()
+            for line in body.splitlines():
+                if not line.strip():
+                    continue
+                self.points += 1
+                match = timestamp_pattern.search(line.rstrip())
+                if match and not rollup_pattern.match(line):
+                    self.point_ages_ms.append((now_ns - int(match.group(1))) / 1e6)
+        return 204
+
+    def stats(self):
+        with self.lock:
+            ages = sorted(self.point_ages_ms)
+        result = {'writes': self.writes, 'failures': self.failures, 'points': self.points,
+                  'connections': len(self.clients)}
+        if ages:
+            result.update({
+                'write_latency_ms_p50': round(ages[len(ages) // 2], 3),
+                'write_latency_ms_p95': round(ages[min(len(ages) - 1, int(len(ages) * 0.95))], 3),
+                'write_latency_ms_max': round(ages[-1], 3),
+            })
+        return result
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='fake_influxdb', daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class Fake_influxdb_handler(BaseHTTPRequestHandler):
+
+    # keep-alive, as influxdb
+    protocol_version = 'HTTP/1.1'
+
+    def reply(self, status, body=b''):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return body
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/ping':
+            self.reply(204)
+        elif path == '/stats':
+            self.reply(200, json.dumps(self.server.fake_db.stats()).encode())
+        elif path == '/query':
+            self.reply(200, b'{"results": [{"statement_id": 0}]}')
+        else:
+            self.reply(404)
+
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        body = self.read_body()
+        if path == '/write':
+            status = self.server.fake_db.write(body, self.client_address)
+            self.reply(status, b'' if status == 204 else b'{"error": "injected failure"}')
+        elif path == '/query':
+            self.reply(200, b'{"results": [{"statement_id": 0}]}')
+        else:
+            self.reply(404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--port', default=8086, type=int,
+                        help='listen port')
+    parser.add_argument('--latency', default=0.0, type=float,
+                        help='secs every write waits')
+    parser.add_argument('--jitter', default=0.0, type=float,
+                        help='extra random secs every write waits, up to')
+    parser.add_argument('--fail_rate', default=0.0, type=float,
+                        help='share of writes answered with http 500')
+    args = parser.parse_args()
+
+    db = Fake_influxdb(args.port, args.latency, args.jitter, args.fail_rate)
+    print(f'==> fake influxdb on http://127.0.0.1:{db.port}, GET /stats for counters')
+    try:
+        db.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(db.stats()))
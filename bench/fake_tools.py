@@ -0,0 +1,244 @@
+'''
+fake iw / ping / iperf3 replaying the recorded outputs in bench/fixtures,
+installed as bench/fakebin/{iw,ping,iperf3} and put first in PATH by run_bench.py
+
+env:
+    BENCH_SCENARIO  iw fixture set: wifi5, wifi6, 2g or disconnected (default wifi5)
+    BENCH_SPEED     replay speed factor of ping / iperf3, 2 prints twice as fast (default 1)
+    BENCH_TRAFFIC   Mbit/s the station counters of iw advance by, rx and a tenth of it tx (default 0)
+    BENCH_ROAM      secs between roams of iw to the other of two bssids, each preceded by
+                    BENCH_ROAM_GAP secs (default 0.3) not connected (default 0: no roams)
+'''
+
+import os
+import re
+import sys
+import json
+import math
+from time import monotonic, sleep
+from pathlib import Path
+
+fixtures = Path(__file__).resolve().parent.joinpath('fixtures')
+
+scenarios = ('wifi5', 'wifi6', '2g', 'disconnected')
+
+
+def scenario():
+    return os.environ.get('BENCH_SCENARIO', 'wifi5')
+
+
+def speed():
+    return float(os.environ.get('BENCH_SPEED', '1'))
+
+
+def traffic():
+    return float(os.environ.get('BENCH_TRAFFIC', '0'))
+
+
+def roam_period():
+    return float(os.environ.get('BENCH_ROAM', '0'))
+
+
+def roam_gap():
+    return float(os.environ.get('BENCH_ROAM_GAP', '0.3'))
+
+
+def option(args, flag, cast, default):
+    if flag in args and args.index(flag) + 1 < len(args):
+        return cast(args[args.index(flag) + 1])
+    return default
+
+
+def emit(line):
+    sys.stdout.write(f'{line}\n')
+    sys.stdout.flush()
+
+
+def paced(count, interval):
+    '''
+    yield 0..count-1 on absolute deadlines of interval / speed secs
+    '''
+    period = interval / speed()
+    start = monotonic()
+    for i in range(count):
+        wait = start + i * period - monotonic()
+        if wait > 0:
+            sleep(wait)
+        yield i
+
+
+iw_commands = {
+    ('info',): 'info',
+    ('link',): 'link',
+    ('station', 'dump'): 'station',
+    ('scan',): 'scan',
+    ('scan', 'dump'): 'scan',
+}
+
+
+def fake_iw(args):
+    # iw <dev> info|link|station dump
+    fixture = iw_commands.get(tuple(args[1:]))
+    if fixture is None:
+        emit(f'fake iw: unsupported command: {" ".join(args)}')
+        return 1
+    now = monotonic()
+    name = scenario()
+    if roam_period() and now % roam_period() < roam_gap():
+        name = 'disconnected'
+    if fixture == 'scan':
+        # the same neighbors in every scenario
+        sys.stdout.write(fixtures.joinpath('iw', 'scan.txt').read_text())
+        return 0
+    text = fixtures.joinpath('iw', f'{name}_{fixture}.txt').read_text()
+    if traffic():
+        text = advance_counters(text, now)
+    if roam_period() and int(now / roam_period()) % 2:
+        text = roam_bssid(text)
+    sys.stdout.write(text)
+    return 0
+
+
+def roam_bssid(text):
+    # the other AP: last octet of the bssid + 1
+    def other(match):
+        bssid = match.group(2)
+        return f'{match.group(1)}{bssid[:-2]}{(int(bssid[-2:], 16) + 1) % 256:02x}'
+
+    return re.sub(r'^((?:Connected to|Station) )([0-9a-fA-F:]{17})', other, text, flags=re.MULTILINE)
+
+
+def advance_counters(text, secs):
+    '''
+    move the cumulative counters of a station fixture as if traffic() flowed for secs,
+    the clock is system wide so consecutive fake iw processes see growing counters
+    '''
+    rx_bytes = int(secs * traffic() * 1e6 / 8)
+    added = {
+        'rx bytes': rx_bytes,
+        'tx bytes': rx_bytes // 10,
+        'rx packets': rx_bytes // 1400,
+        'tx packets': rx_bytes // 14000,
+        'tx retries': rx_bytes // 140000,
+    }
+
+    def add(match):
+        return f'{match.group(1)}{int(match.group(2)) + added[match.group(1).strip().rstrip(":")]}'
+
+    text = re.sub(r'^(\t(?:rx|tx) (?:bytes|packets|retries):\s*)(\d+)', add, text, flags=re.MULTILINE)
+    # link output: 'RX: 1482393321 bytes (1098231 packets)'
+    return re.sub(r'^\t(RX|TX): (\d+) bytes \((\d+) packets\)',
+                  lambda m: f'\t{m.group(1)}: {int(m.group(2)) + added[m.group(1).lower() + " bytes"]} bytes '
+                            f'({int(m.group(3)) + added[m.group(1).lower() + " packets"]} packets)',
+                  text, flags=re.MULTILINE)
+
+
+def fake_ping(args):
+    # ping <ip> -Q <tos> [-w <secs>] -i <interval> [-I <dev>]
+    host = args[0]
+    interval = option(args, '-i', float, 1.0)
+    duration = option(args, '-w', float, 0)
+    replies = [line for line in fixtures.joinpath('ping.txt').read_text().splitlines() if 'icmp_seq=' in line]
+
+    count = math.ceil(duration / interval) if duration else sys.maxsize
+    emit(f'PING {host} ({host}) 56(84) bytes of data.')
+    times = []
+    try:
+        for i in paced(count, interval):
+            line = replies[i % len(replies)]
+            times.append(float(re.search(r'time=([0-9.]*)', line).group(1)))
+            emit(re.sub(r'icmp_seq=\d+', f'icmp_seq={i + 1}', line.replace('192.168.50.1', host)))
+    except KeyboardInterrupt:
+        pass
+
+    avg = sum(times) / len(times) if times else 0.0
+    mdev = math.sqrt(sum((t - avg) ** 2 for t in times) / len(times)) if times else 0.0
+    emit('')
+    emit(f'--- {host} ping statistics ---')
+    emit(f'{len(times)} packets transmitted, {len(times)} received, 0% packet loss, time {int(len(times) * interval * 1000)}ms')
+    if times:
+        emit(f'rtt min/avg/max/mdev = {min(times):.3f}/{avg:.3f}/{max(times):.3f}/{mdev:.3f} ms')
+    return 0
+
+
+# share of the recorded rate the downlink of --bidir gets
+bidir_reverse_share = 0.8
+
+
+def split_interval(event, parallel, bidir):
+    '''
+    a recorded single stream interval as -P parallel streams, plus the downlink of --bidir
+    '''
+    data = event['data']
+    stream, total = data['streams'][0], data['sum']
+    streams = []
+    for sender, share in ((True, 1.0), (False, bidir_reverse_share))[:2 if bidir else 1]:
+        for k in range(parallel):
+            streams.append(dict(stream, socket=5 + 2 * len(streams), sender=sender,
+                                bytes=int(stream['bytes'] * share / parallel),
+                                bits_per_second=stream['bits_per_second'] * share / parallel))
+    data = {'streams': streams, 'sum': total}
+    if bidir:
+        data['sum_bidir_reverse'] = dict(total, sender=False, bytes=int(total['bytes'] * bidir_reverse_share),
+                                         bits_per_second=total['bits_per_second'] * bidir_reverse_share)
+    return {'event': 'interval', 'data': data}
+
+
+def split_text_interval(line, parallel, bidir):
+    # '[  5]   0.00-1.00   sec  71.2 MBytes   570 Mbits/sec    0   1.49 MBytes'
+    if parallel == 1 and not bidir:
+        return [line]
+    match = re.match(r'\[\s*\d+\]\s+(\S+)\s+sec\s+([0-9.]+) MBytes\s+([0-9.]+) Mbits/sec', line)
+    period, mbytes, mbps = match.group(1), float(match.group(2)), float(match.group(3))
+    lines = []
+    for role, share in (('[TX-C]', 1.0), ('[RX-C]', bidir_reverse_share))[:2 if bidir else 1]:
+        role = role if bidir else ''
+        for k in range(parallel):
+            lines.append(f'[{5 + 2 * len(lines):3d}]{role}   {period}   sec  {mbytes * share / parallel:.1f} MBytes  '
+                         f'{mbps * share / parallel:.0f} Mbits/sec')
+        if parallel > 1:
+            lines.append(f'[SUM]{role}   {period}   sec  {mbytes * share:.1f} MBytes  {mbps * share:.0f} Mbits/sec')
+    return lines
+
+
+def fake_iperf3(args):
+    if '--version' in args:
+        emit('iperf 3.17 (cJSON 1.7.15)')
+        return 0
+
+    secs = option(args, '-t', float, 10)
+    interval = option(args, '-i', float, 1.0)
+    parallel = option(args, '-P', int, 1)
+    bidir = '--bidir' in args
+    count = math.ceil(secs / interval) if secs else sys.maxsize
+
+    if '--json-stream' in args:
+        events = [json.loads(line) for line in fixtures.joinpath('iperf3_json_stream.txt').read_text().splitlines()]
+        intervals = [split_interval(event, parallel, bidir) for event in events if event['event'] == 'interval']
+        emit(json.dumps(events[0]))
+        for i in paced(count, interval):
+            emit(json.dumps(intervals[i % len(intervals)]))
+        emit(json.dumps(events[-1]))
+        return 0
+
+    lines = fixtures.joinpath('iperf3.txt').read_text().splitlines()
+    intervals = [line for line in lines if 'Mbits/sec' in line and 'sender' not in line and 'receiver' not in line]
+    for line in lines[:3]:
+        emit(line)
+    for i in paced(count, interval):
+        for line in split_text_interval(intervals[i % len(intervals)], parallel, bidir):
+            emit(line)
+    for line in lines[3 + len(intervals):]:
+        emit(line)
+    return 0
+
+
+tools = {
+    'iw': fake_iw,
+    'ping': fake_ping,
+    'iperf3': fake_iperf3,
+}
+
+
+def main(tool):
+    sys.exit(tools[tool](sys.argv[1:]))
@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+
+import json
+import argparse
+import threading
+from time import sleep
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class Fake_webhook:
+    '''
+    local stand-in for an alert webhook, every post waits latency secs before the reply,
+    the alerts posted are kept in order
+    '''
+
+    def __init__(self, port=0, latency=0.0, status=200):
+        self.latency = latency
+        self.status = status
+        self.lock = threading.Lock()
+        self.posts = 0
+        self.alerts = []
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), Fake_webhook_handler)
+        self.httpd.fake_webhook = self
+        self.port = self.httpd.server_address[1]
+        self.url = f'http://127.0.0.1:{self.port}/alerts'
+        self.thread = None
+
+    def receive(self, body):
+        sleep(self.latency)
+        alerts = json.loads(body).get('alerts', [])
+        with self.lock:
+            self.posts += 1
+            self.alerts.extend(alerts)
+        for alert in alerts:
+            print(f'==> {alert.get("interface")} {alert.get("rule")} {alert.get("state")}: {alert.get("condition")}, '
+                  f'{alert.get("field")} {alert.get("value")}')
+        return self.status
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='fake_webhook', daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class Fake_webhook_handler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            status = self.server.fake_webhook.receive(body)
+        except ValueError:
+            status = 400
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--port', default=8090, type=int,
+                        help='listen port')
+    parser.add_argument('--latency', default=0.0, type=float,
+                        help='secs every post waits before the reply')
+    parser.add_argument('--status', default=200, type=int,
+                        help='http status of every reply')
+    args = parser.parse_args()
+
+    webhook = Fake_webhook(args.port, args.latency, args.status)
+    print(f'==> fake webhook on {webhook.url}')
+    try:
+        webhook.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(f'==> {webhook.posts} posts, {len(webhook.alerts)} alerts.')
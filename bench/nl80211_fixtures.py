@@ -0,0 +1,241 @@
+#!/usr/bin/python3
+'''
+nl80211 replies of the links in bench/fixtures/iw, for the tests of the nl80211 backend:
+<scenario>_interface.bin is the NL80211_CMD_GET_INTERFACE reply and its ack, <scenario>_station.bin
+the NL80211_CMD_GET_STATION dump and its done, the netlink messages of a reply back to back with seq 0
+
+    python3 bench/nl80211_fixtures.py                     # write the fixtures of the scenarios below
+    python3 bench/nl80211_fixtures.py -r wlo1 -S office   # record the replies of a real interface
+'''
+
+import sys
+import struct
+import argparse
+from pathlib import Path
+
+bench_folder = Path(__file__).resolve().parent
+sys.path.insert(0, str(bench_folder.parent))
+
+from link_stats import (Nl80211_sampler, pack_attr, NLMSG_ERROR, NLMSG_DONE,
+                        NL80211_CMD_GET_INTERFACE, NL80211_CMD_GET_STATION, NL80211_ATTR_IFINDEX, NL80211_ATTR_MAC,
+                        NL80211_ATTR_STA_INFO, NL80211_ATTR_WIPHY_FREQ, NL80211_ATTR_SSID,
+                        NL80211_ATTR_CHANNEL_WIDTH, NL80211_ATTR_CENTER_FREQ1,
+                        NL80211_STA_INFO_SIGNAL, NL80211_STA_INFO_TX_BITRATE, NL80211_STA_INFO_RX_PACKETS,
+                        NL80211_STA_INFO_TX_PACKETS, NL80211_STA_INFO_TX_RETRIES, NL80211_STA_INFO_TX_FAILED,
+                        NL80211_STA_INFO_SIGNAL_AVG, NL80211_STA_INFO_RX_BITRATE, NL80211_STA_INFO_RX_BYTES64,
+                        NL80211_STA_INFO_TX_BYTES64, NL80211_STA_INFO_EXPECTED_THROUGHPUT,
+                        NL80211_STA_INFO_BEACON_SIGNAL_AVG, NL80211_RATE_INFO_BITRATE, NL80211_RATE_INFO_MCS,
+                        NL80211_RATE_INFO_BITRATE32, NL80211_RATE_INFO_VHT_MCS, NL80211_RATE_INFO_VHT_NSS,
+                        NL80211_RATE_INFO_HE_MCS, NL80211_RATE_INFO_HE_NSS, NL80211_RATE_INFO_HE_GI,
+                        NL80211_RATE_INFO_HE_DCM)
+
+fixture_folder = bench_folder.joinpath('fixtures', 'nl80211')
+
+# attributes the backend doesn't read, sent by the kernel all the same
+NL80211_ATTR_WIPHY = 1
+NL80211_ATTR_IFNAME = 4
+NL80211_ATTR_IFTYPE = 5
+NL80211_ATTR_GENERATION = 46
+NL80211_STA_INFO_INACTIVE_TIME = 1
+NL80211_STA_INFO_CONNECTED_TIME = 16
+NL80211_RATE_INFO_SHORT_GI = 4
+NL80211_RATE_INFO_80_MHZ_WIDTH = 8
+NL80211_IFTYPE_STATION = 2
+
+# the links of the iw fixtures, rates as the kernel keeps them: bitrates in 100 kbit/s, throughput in kbit/s
+scenarios = {
+    'wifi6': {
+        'interface': {'ssid': 'office-ax', 'freq': 5745, 'width': 3, 'center_freq': 5775},
+        'station': {'bssid': '04:42:1a:9c:8d:7e', 'signal': -47, 'signal_avg': -46, 'beacon_signal': -45,
+                    'rx_bytes': 3920183342, 'tx_bytes': 210938221, 'rx_packets': 2719332, 'tx_packets': 903211,
+                    'tx_retries': 18233, 'tx_failed': 41, 'expected_throughput': 612304,
+                    'rx_rate': {'bitrate': 12009, 'he_mcs': 11, 'he_nss': 2, 'he_gi': 0, 'he_dcm': 0},
+                    'tx_rate': {'bitrate': 10806, 'he_mcs': 10, 'he_nss': 2, 'he_gi': 0, 'he_dcm': 0}},
+    },
+    'wifi5': {
+        'interface': {'ssid': 'office-5g', 'freq': 5180, 'width': 3, 'center_freq': 5210},
+        'station': {'bssid': '24:4b:fe:1a:2b:3c', 'signal': -52, 'signal_avg': -51, 'beacon_signal': -50,
+                    'rx_bytes': 1482393321, 'tx_bytes': 98231442, 'rx_packets': 1098231, 'tx_packets': 412093,
+                    'tx_retries': 18233, 'tx_failed': 41, 'expected_throughput': 390625,
+                    'rx_rate': {'bitrate': 8667, 'vht_mcs': 9, 'vht_nss': 2, 'short_gi': True},
+                    'tx_rate': {'bitrate': 7800, 'vht_mcs': 8, 'vht_nss': 2, 'short_gi': True}},
+    },
+    '2g': {
+        'interface': {'ssid': 'office-2g', 'freq': 2437, 'width': 1, 'center_freq': 2437},
+        'station': {'bssid': '24:4b:fe:1a:2b:38', 'signal': -61, 'signal_avg': -60, 'beacon_signal': -60,
+                    'rx_bytes': 58231992, 'tx_bytes': 8123321, 'rx_packets': 92311, 'tx_packets': 30211,
+                    'tx_retries': 4102, 'tx_failed': 41, 'expected_throughput': 71532,
+                    'rx_rate': {'bitrate': 1444, 'mcs': 15, 'short_gi': True},
+                    'tx_rate': {'bitrate': 1300, 'mcs': 14, 'short_gi': True}},
+    },
+    # no ssid on the interface and an empty station dump
+    'disconnected': {
+        'interface': {},
+        'station': None,
+    },
+}
+
+ifindex = 3
+
+
+def nlmsg(msg_type, payload, flags=0):
+    return struct.pack('=IHHII', 16 + len(payload), msg_type, flags, 0, 0) + payload
+
+
+def genl_msg(family, cmd, attrs, flags=0):
+    return nlmsg(family, struct.pack('=BBH', cmd, 1, 0) + b''.join(attrs), flags)
+
+
+def u8(value):
+    return struct.pack('=B', value)
+
+
+def s8(value):
+    return struct.pack('=b', value)
+
+
+def u16(value):
+    return struct.pack('=H', value)
+
+
+def u32(value):
+    return struct.pack('=I', value)
+
+
+def u64(value):
+    return struct.pack('=Q', value)
+
+
+def rate_info(rate):
+    attrs = [pack_attr(NL80211_RATE_INFO_BITRATE32, u32(rate['bitrate']))]
+    if rate['bitrate'] < 0x10000:
+        attrs.append(pack_attr(NL80211_RATE_INFO_BITRATE, u16(rate['bitrate'])))
+    for name, attr_type in (('mcs', NL80211_RATE_INFO_MCS),
+                            ('vht_mcs', NL80211_RATE_INFO_VHT_MCS), ('vht_nss', NL80211_RATE_INFO_VHT_NSS),
+                            ('he_mcs', NL80211_RATE_INFO_HE_MCS), ('he_nss', NL80211_RATE_INFO_HE_NSS),
+                            ('he_gi', NL80211_RATE_INFO_HE_GI), ('he_dcm', NL80211_RATE_INFO_HE_DCM)):
+        if name in rate:
+            attrs.append(pack_attr(attr_type, u8(rate[name])))
+    if 'vht_mcs' in rate or 'he_mcs' in rate:
+        attrs.append(pack_attr(NL80211_RATE_INFO_80_MHZ_WIDTH, b''))
+    if rate.get('short_gi'):
+        attrs.append(pack_attr(NL80211_RATE_INFO_SHORT_GI, b''))
+    return b''.join(attrs)
+
+
+def interface_reply(family, interface):
+    attrs = [pack_attr(NL80211_ATTR_IFINDEX, u32(ifindex)),
+             pack_attr(NL80211_ATTR_IFNAME, b'wlo1\0'),
+             pack_attr(NL80211_ATTR_WIPHY, u32(0)),
+             pack_attr(NL80211_ATTR_IFTYPE, u32(NL80211_IFTYPE_STATION)),
+             pack_attr(NL80211_ATTR_MAC, bytes.fromhex('3cf0112a5b7c'))]
+    if interface:
+        attrs += [pack_attr(NL80211_ATTR_SSID, interface['ssid'].encode()),
+                  pack_attr(NL80211_ATTR_WIPHY_FREQ, u32(interface['freq'])),
+                  pack_attr(NL80211_ATTR_CHANNEL_WIDTH, u32(interface['width'])),
+                  pack_attr(NL80211_ATTR_CENTER_FREQ1, u32(interface['center_freq']))]
+    ack = nlmsg(NLMSG_ERROR, struct.pack('=i', 0) + struct.pack('=IHHII', 36, family, 5, 0, 0))
+    return genl_msg(family, NL80211_CMD_GET_INTERFACE, attrs) + ack
+
+
+def station_reply(family, station):
+    done = nlmsg(NLMSG_DONE, struct.pack('=i', 0), flags=0x2)
+    if station is None:
+        return done
+
+    sta_info = [pack_attr(NL80211_STA_INFO_INACTIVE_TIME, u32(24)),
+                pack_attr(NL80211_STA_INFO_RX_BYTES64, u64(station['rx_bytes'])),
+                pack_attr(NL80211_STA_INFO_TX_BYTES64, u64(station['tx_bytes'])),
+                pack_attr(NL80211_STA_INFO_RX_PACKETS, u32(station['rx_packets'])),
+                pack_attr(NL80211_STA_INFO_TX_PACKETS, u32(station['tx_packets'])),
+                pack_attr(NL80211_STA_INFO_TX_RETRIES, u32(station['tx_retries'])),
+                pack_attr(NL80211_STA_INFO_TX_FAILED, u32(station['tx_failed'])),
+                pack_attr(NL80211_STA_INFO_SIGNAL, s8(station['signal'])),
+                pack_attr(NL80211_STA_INFO_SIGNAL_AVG, s8(station['signal_avg'])),
+                pack_attr(NL80211_STA_INFO_BEACON_SIGNAL_AVG, s8(station['beacon_signal'])),
+                pack_attr(NL80211_STA_INFO_TX_BITRATE, rate_info(station['tx_rate'])),
+                pack_attr(NL80211_STA_INFO_RX_BITRATE, rate_info(station['rx_rate'])),
+                pack_attr(NL80211_STA_INFO_EXPECTED_THROUGHPUT, u32(station['expected_throughput'])),
+                pack_attr(NL80211_STA_INFO_CONNECTED_TIME, u32(3520))]
+    attrs = [pack_attr(NL80211_ATTR_IFINDEX, u32(ifindex)),
+             pack_attr(NL80211_ATTR_MAC, bytes.fromhex(station['bssid'].replace(':', ''))),
+             pack_attr(NL80211_ATTR_GENERATION, u32(12)),
+             pack_attr(NL80211_ATTR_STA_INFO, b''.join(sta_info))]
+    return genl_msg(family, NL80211_CMD_GET_STATION, attrs, flags=0x2) + done
+
+
+class Recording_socket:
+    '''
+    netlink socket keeping the datagrams received for each request
+    '''
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.replies = []
+
+    def send(self, data):
+        self.replies.append(b'')
+        return self.sock.send(data)
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def recv(self, size):
+        data = self.sock.recv(size)
+        self.replies[-1] += data
+        return data
+
+    def close(self):
+        self.sock.close()
+
+
+def zero_seq(data):
+    '''
+    seq and port id of every message set to 0
+    '''
+    data = bytearray(data)
+    offset = 0
+    while offset + 16 <= len(data):
+        length = struct.unpack_from('=I', data, offset)[0]
+        struct.pack_into('=II', data, offset + 8, 0, 0)
+        offset += (length + 3) & ~3
+    return bytes(data)
+
+
+def record(interface):
+    import socket
+    from link_stats import NETLINK_GENERIC
+
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+    sock.bind((0, 0))
+    recording = Recording_socket(sock)
+    sampler = Nl80211_sampler(interface, sock=recording)
+    sampler.sample()
+    sampler.association()
+    sampler.close()
+    # family, interface, the station dump when connected and the one of association()
+    return zero_seq(recording.replies[1]), zero_seq(recording.replies[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--record', metavar='', default=None,
+                        help='record the replies of this interface instead')
+    parser.add_argument('-S', '--scenario', metavar='', default='recorded',
+                        help='name of the recorded scenario')
+    args = parser.parse_args()
+
+    fixture_folder.mkdir(parents=True, exist_ok=True)
+    if args.record:
+        replies = {args.scenario: record(args.record)}
+    else:
+        # any family id, the replies are matched to requests by the tests
+        family = 0x1c
+        replies = {name: (interface_reply(family, scenario['interface']), station_reply(family, scenario['station']))
+                   for name, scenario in scenarios.items()}
+
+    for name, (interface_data, station_data) in replies.items():
+        for kind, data in (('interface', interface_data), ('station', station_data)):
+            path = fixture_folder.joinpath(f'{name}_{kind}.bin')
+            path.write_bytes(data)
+            print(f'==> {path}: {len(data)} bytes')
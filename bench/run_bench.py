@@ -0,0 +1,231 @@
+#!/usr/bin/python3
+'''
+run go_wifi_test.py offline against the fake iw / ping / iperf3 and a fake influxdb,
+one run per scenario, and append the results to a jsonl file keyed by git commit:
+
+    python3 bench/run_bench.py -t 20 -f 5
+    python3 bench/run_bench.py -S wifi6 --db_latency 0.2 --db_fail_rate 0.1
+
+each result is compared with the last one of the same scenario and parameters in the file,
+a change worse than --threshold is reported as a regression (exit code 1)
+'''
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+import tempfile
+from time import monotonic
+from datetime import datetime
+from pathlib import Path
+
+from fake_influxdb import Fake_influxdb
+from fake_tools import scenarios
+
+bench_folder = Path(__file__).resolve().parent
+repo_folder = bench_folder.parent
+
+# metric: True when higher is better
+tracked_metrics = {
+    'samples_per_sec': True,
+    'cpu_ms_per_sample': False,
+    'max_rss_mb': False,
+    'write_latency_ms_p95': False,
+    'startup_secs': False,
+}
+
+# parameters that make two results comparable
+param_keys = ('scenario', 'duration', 'sample_rate', 'speed', 'runtime', 'iperf_output', 'link_backend',
+              'no_iperf', 'passive', 'traffic', 'direction', 'parallel', 'sink', 'db_latency', 'db_fail_rate')
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_folder,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_credential(folder, port):
+    db_config = {
+        'influxdb_ip': '127.0.0.1',
+        'influxdb_port': port,
+        'influxdb_username': 'bench',
+        'influxdb_password': 'bench',
+        'influxdb_dbname': 'bench',
+    }
+    folder.joinpath('credential.py').write_text(f'db_config = {db_config!r}\n')
+
+
+def last_summary(folder):
+    summaries = sorted(folder.joinpath('summary').glob('*_wifi_test_summary'))
+    if not summaries:
+        return {}
+    lines = summaries[-1].read_text().splitlines()
+    return json.loads(lines[-1]) if lines else {}
+
+
+def run_scenario(args, scenario):
+    db = Fake_influxdb(latency=args.db_latency, jitter=args.db_jitter, fail_rate=args.db_fail_rate, seed=0).start()
+
+    with tempfile.TemporaryDirectory(prefix='wifi_bench_') as tmp:
+        work_folder = Path(tmp)
+        write_credential(work_folder, db.port)
+
+        env = dict(os.environ)
+        env['PATH'] = f'{bench_folder.joinpath("fakebin")}{os.pathsep}{env.get("PATH", "")}'
+        env['PYTHONPATH'] = f'{work_folder}{os.pathsep}{env.get("PYTHONPATH", "")}'
+        env['BENCH_SCENARIO'] = scenario
+        env['BENCH_SPEED'] = str(args.speed)
+        env['BENCH_TRAFFIC'] = str(args.traffic)
+
+        cmd = [sys.executable, str(repo_folder.joinpath('go_wifi_test.py')), '-l', 'bench',
+               '-t', str(args.duration), '-f', str(args.sample_rate), '-r', '127.0.0.1', '-s', '127.0.0.1',
+               '-B', args.link_backend, '-O', args.iperf_output, '--runtime', args.runtime, '--console', 'off',
+               '-d', args.direction, '--parallel', str(args.parallel), '--sink', args.sink]
+        if args.no_iperf:
+            cmd.append('-N')
+        if args.passive:
+            cmd.append('--passive')
+
+        print(f'==> bench {scenario}: {" ".join(cmd[1:])}')
+        with open(work_folder.joinpath('output.txt'), 'w') as output:
+            start = monotonic()
+            child = subprocess.Popen(cmd, cwd=work_folder, env=env, stdout=output, stderr=subprocess.STDOUT)
+            # rusage of the logger and every iw / ping / iperf3 it waited for
+            _, status, rusage = os.wait4(child.pid, 0)
+            wall = monotonic() - start
+
+        db_stats = db.stats()
+        db.close()
+        if args.verbose and (status or not db_stats['points']):
+            print(work_folder.joinpath('output.txt').read_text())
+        summary = last_summary(work_folder)
+
+    samples = summary.get('samples', 0)
+    cpu_secs = rusage.ru_utime + rusage.ru_stime
+    result = {
+        'commit': git_commit(),
+        'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'scenario': scenario,
+        'duration': args.duration,
+        'sample_rate': args.sample_rate,
+        'speed': args.speed,
+        'runtime': args.runtime,
+        'iperf_output': args.iperf_output,
+        'link_backend': args.link_backend,
+        'no_iperf': args.no_iperf,
+        'passive': args.passive,
+        'traffic': args.traffic,
+        'direction': args.direction,
+        'parallel': args.parallel,
+        'sink': args.sink,
+        'db_latency': args.db_latency,
+        'db_fail_rate': args.db_fail_rate,
+        'exit_status': status,
+        'wall_secs': round(wall, 3),
+        'samples': samples,
+        'missed_ticks': summary.get('missed_ticks'),
+        'samples_per_sec': round(samples / wall, 3),
+        'cpu_secs': round(cpu_secs, 3),
+        'cpu_ms_per_sample': round(cpu_secs / samples * 1000, 3) if samples else None,
+        # ru_maxrss is KB on linux
+        'max_rss_mb': round(rusage.ru_maxrss / 1024, 1),
+        'jitter_ms_max': summary.get('jitter_ms_max'),
+        'startup_secs': summary.get('startup_secs'),
+    }
+    result.update(db_stats)
+    return result
+
+
+def find_baseline(results_file, result):
+    if not results_file.exists():
+        return None
+    baseline = None
+    with open(results_file) as f:
+        for line in f:
+            previous = json.loads(line)
+            if all(previous.get(key) == result[key] for key in param_keys):
+                baseline = previous
+    return baseline
+
+
+def regressions(baseline, result, threshold):
+    found = []
+    for metric, higher_better in tracked_metrics.items():
+        old, new = baseline.get(metric), result.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / abs(old)
+        if (change < -threshold) if higher_better else (change > threshold):
+            found.append(f'{metric}: {old} -> {new} ({change:+.1%}) vs {baseline.get("commit")}')
+    return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-S', '--scenario', metavar='', action='append', choices=scenarios,
+                        help=f'iw fixture set, repeat for several: {", ".join(scenarios)} (default all)')
+    parser.add_argument('-t', '--duration', metavar='', default=10, type=int,
+                        help='test time duration (secs) of each run')
+    parser.add_argument('-f', '--sample_rate', metavar='', default=1, type=float,
+                        help='samples per second')
+    parser.add_argument('--speed', metavar='', default=1, type=float,
+                        help='replay speed factor of the fake ping / iperf3')
+    parser.add_argument('--runtime', metavar='', default='threads', choices=['threads', 'asyncio'],
+                        help='runtime of go_wifi_test.py')
+    parser.add_argument('-O', '--iperf_output', metavar='', default='text', choices=['text', 'json'],
+                        help='iperf3 output read by the logger')
+    parser.add_argument('-B', '--link_backend', metavar='', default='iw',
+                        help='link stats backend, nl80211 reads the kernel (its parser is tested on bench/fixtures/nl80211)')
+    parser.add_argument('-N', '--no_iperf', action='store_true',
+                        help='disable iperf test.')
+    parser.add_argument('--passive', action='store_true',
+                        help='passive run, throughput from the station counters')
+    parser.add_argument('--traffic', metavar='', default=0, type=float,
+                        help='Mbit/s the fake station counters advance by')
+    parser.add_argument('-d', '--direction', metavar='', default='ul', choices=['ul', 'dl', 'both', 'bidir'],
+                        help='iperf direction of go_wifi_test.py')
+    parser.add_argument('--parallel', metavar='', default=1, type=int,
+                        help='iperf parallel streams of each direction')
+    parser.add_argument('--sink', metavar='', default='influx_http', choices=['influxdb', 'influx_http'],
+                        help='sink writing to the fake influxdb, influxdb needs the influxdb module')
+    parser.add_argument('--db_latency', metavar='', default=0.01, type=float,
+                        help='secs every db write waits')
+    parser.add_argument('--db_jitter', metavar='', default=0.0, type=float,
+                        help='extra random secs every db write waits, up to')
+    parser.add_argument('--db_fail_rate', metavar='', default=0.0, type=float,
+                        help='share of db writes failing')
+    parser.add_argument('--results', metavar='', default=str(bench_folder.joinpath('results.jsonl')), type=str,
+                        help='jsonl file the results are appended to')
+    parser.add_argument('--threshold', metavar='', default=0.1, type=float,
+                        help='relative change reported as a regression')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='show the logger output of failed runs')
+    args = parser.parse_args()
+
+    results_file = Path(args.results)
+    found = []
+    for scenario in args.scenario or scenarios:
+        result = run_scenario(args, scenario)
+        print(json.dumps(result))
+
+        # e.g. the module of the sink is missing: nothing was measured, don't keep it as a baseline
+        if result['samples'] and not result['points']:
+            print(f'==> bench {scenario}: no point reached the fake influxdb through sink {args.sink}, '
+                  f'-v shows the logger output.')
+            found.append(f'{scenario}: no writes')
+            continue
+
+        baseline = find_baseline(results_file, result)
+        if baseline:
+            for regression in regressions(baseline, result, args.threshold):
+                print(f'==> regression in {scenario}: {regression}')
+                found.append(regression)
+
+        with open(results_file, 'a') as f:
+            f.write(f'{json.dumps(result)}\n')
+
+    sys.exit(1 if found else 0)
@@ -0,0 +1,315 @@
+#!/usr/bin/python3
+
+import json
+import mmap
+import math
+import struct
+import argparse
+from pathlib import Path
+from datetime import datetime, timezone
+
+from line_protocol import to_timestamp_ns
+
+'''
+binary log layout:
+    file header: magic b'WTLB', u16 version, u16 reserved, u32 json header length
+    json header: measurement and the columns with their types, padded to 8 bytes
+    records: float64 epoch secs + one float64 per column, missing value is NaN
+a file holds the records of one measurement under a fixed set of columns: a record without one of them
+stores NaN and reads back None, only a new column or a column changing type starts a new file.
+Text and bool values are stored as float64 too, text as the index of the value in the string table,
+the json strings of <file>.strings one per line, appended as new values come.
+Version 1 files keep the tag values in the header instead, one file per tag values.
+'''
+
+MAGIC = b'WTLB'
+VERSION = 2
+file_header = struct.Struct('<4sHHI')
+
+suffix = '.wtb'
+strings_suffix = '.strings'
+
+
+def to_epoch(record_time):
+    return to_timestamp_ns(record_time) / 1e9
+
+
+def kind_of(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    return 'text'
+
+
+def merge_kind(column, kind):
+    if kind is None or column == kind:
+        return column
+    if {column, kind} == {'int', 'float'}:
+        return 'float'
+    return kind
+
+
+class Binlog_segment:
+    '''
+    one file of a measurement, columns: name -> kind (None while only None was seen)
+    '''
+
+    def __init__(self, path, measurement, columns):
+        self.path = Path(path)
+        self.columns = columns
+        self.names = list(columns)
+        self.record_struct = struct.Struct(f'<{len(self.names) + 1}d')
+        # text value -> index in the string table
+        self.strings = {}
+        self.strings_file = None
+
+        header = {
+            'measurement': measurement,
+            'fields': self.names,
+            'int_fields': [name for name, kind in columns.items() if kind == 'int'],
+            'bool_fields': [name for name, kind in columns.items() if kind == 'bool'],
+            'text_fields': [name for name, kind in columns.items() if kind == 'text'],
+        }
+        header_bytes = json.dumps(header).encode('utf8')
+        header_bytes += b' ' * ((8 - (file_header.size + len(header_bytes)) % 8) % 8)
+
+        self.f = open(self.path, 'ab')
+        self.f.write(file_header.pack(MAGIC, VERSION, 0, len(header_bytes)) + header_bytes)
+
+    def fits(self, fields):
+        for name, value in fields.items():
+            if name not in self.columns:
+                return False
+            column, kind = self.columns[name], kind_of(value)
+            if kind is not None and column != kind and not (column == 'float' and kind == 'int'):
+                return False
+        return True
+
+    def evolve(self, fields):
+        '''
+        columns of the next segment: these ones, widened or added for fields
+        '''
+        columns = dict(self.columns)
+        for name, value in fields.items():
+            columns[name] = merge_kind(columns[name], kind_of(value)) if name in columns else kind_of(value)
+        return columns
+
+    def encode(self, name, value):
+        if value is None:
+            return math.nan
+        if self.columns[name] != 'text':
+            return float(value)
+        value = str(value)
+        if value not in self.strings:
+            if self.strings_file is None:
+                self.strings_file = open(self.path.with_name(self.path.name + strings_suffix), 'a')
+            self.strings[value] = len(self.strings)
+            self.strings_file.write(f'{json.dumps(value)}\n')
+        return float(self.strings[value])
+
+    def write(self, record_time, fields):
+        values = [self.encode(name, fields.get(name)) for name in self.names]
+        self.f.write(self.record_struct.pack(to_epoch(record_time), *values))
+
+    def flush(self):
+        # the string table first, a record never points past it
+        if self.strings_file is not None:
+            self.strings_file.flush()
+        self.f.flush()
+
+    def close(self):
+        self.flush()
+        if self.strings_file is not None:
+            self.strings_file.close()
+        self.f.close()
+
+
+class Binlog_writer:
+
+    def __init__(self, folder, prefix):
+        self.folder = Path(folder)
+        self.prefix = prefix
+        # measurement -> Binlog_segment
+        self.segments = {}
+
+    def open_segment(self, measurement, columns):
+        name = f'{self.prefix}_{datetime.now().strftime("%Y-%m-%d_%H%M%S_%f")}_{measurement}{suffix}'
+        return Binlog_segment(self.folder.joinpath(name), measurement, columns)
+
+    def write(self, records):
+        for record in records:
+            measurement = record['measurement']
+            fields = record['fields']
+
+            segment = self.segments.get(measurement)
+            if segment is None:
+                segment = self.open_segment(measurement, {name: kind_of(value) for name, value in fields.items()})
+                self.segments[measurement] = segment
+            elif not segment.fits(fields):
+                columns = segment.evolve(fields)
+                segment.close()
+                segment = self.open_segment(measurement, columns)
+                self.segments[measurement] = segment
+
+            segment.write(record['time'], fields)
+
+        for segment in self.segments.values():
+            segment.flush()
+
+    def close(self):
+        for segment in self.segments.values():
+            segment.close()
+        self.segments = {}
+
+
+class Binlog_reader:
+    '''
+    mmap a binary log, columns are zero-copy strided views of the mapped file,
+    a text column holds indexes of strings
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.f = open(self.path, 'rb')
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, header_length = file_header.unpack_from(self.mm, 0)
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError(f'{path} is not a binary log of version 1 to {VERSION}')
+
+        self.header = json.loads(self.mm[file_header.size:file_header.size + header_length])
+        self.measurement = self.header['measurement']
+        self.tags = self.header.get('tags', {})
+        self.fields = self.header['fields']
+        self.int_fields = set(self.header['int_fields'])
+        self.bool_fields = set(self.header.get('bool_fields', ()))
+        self.text_fields = set(self.header.get('text_fields', ()))
+        self.strings = self.load_strings() if self.text_fields else []
+
+        self.data_offset = file_header.size + header_length
+        self.record_size = 8 * (len(self.fields) + 1)
+        # ignore a partly written last record
+        self.count = (len(self.mm) - self.data_offset) // self.record_size
+
+    def load_strings(self):
+        strings = []
+        try:
+            with open(self.path.with_name(self.path.name + strings_suffix)) as f:
+                for line in f:
+                    try:
+                        strings.append(json.loads(line))
+                    except ValueError:
+                        # torn last line
+                        break
+        except FileNotFoundError:
+            pass
+        return strings
+
+    def __len__(self):
+        return self.count
+
+    def doubles(self):
+        end = self.data_offset + self.count * self.record_size
+        return memoryview(self.mm)[self.data_offset:end].cast('d')
+
+    def columns(self):
+        view = self.doubles()
+        width = len(self.fields) + 1
+        columns = {'time': view[0::width]}
+        for i, name in enumerate(self.fields, start=1):
+            columns[name] = view[i::width]
+        return columns
+
+    def array(self):
+        # numpy is optional, only needed for a structured array view
+        import numpy
+        dtype = numpy.dtype([('time', '<f8')] + [(name, '<f8') for name in self.fields])
+        return numpy.frombuffer(self.mm, dtype=dtype, count=self.count, offset=self.data_offset)
+
+    def record_at(self, values):
+        fields = dict(self.tags)
+        for name, value in zip(self.fields, values[1:]):
+            if math.isnan(value):
+                value = None
+            elif name in self.int_fields:
+                value = int(value)
+            elif name in self.bool_fields:
+                value = bool(value)
+            elif name in self.text_fields:
+                index = int(value)
+                value = self.strings[index] if index < len(self.strings) else None
+            fields[name] = value
+        record_time = datetime.fromtimestamp(values[0], tz=timezone.utc)
+        time_format = '%Y-%m-%d %H:%M:%S.%f' if record_time.microsecond else '%Y-%m-%d %H:%M:%S'
+        return {
+            'measurement': self.measurement,
+            'time': record_time.strftime(time_format),
+            'fields': fields,
+        }
+
+    def iter_with_offset(self, offset=0):
+        '''
+        (end_offset, record) from byte offset, same shape as backfill.iter_records
+        '''
+        index = max(offset - self.data_offset, 0) // self.record_size
+        record_struct = struct.Struct(f'<{len(self.fields) + 1}d')
+        for i in range(index, self.count):
+            start = self.data_offset + i * self.record_size
+            yield start + self.record_size, self.record_at(record_struct.unpack_from(self.mm, start))
+
+    def __iter__(self):
+        for _, record in self.iter_with_offset():
+            yield record
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
+
+
+def json_to_binlog(src, folder=None):
+    from backfill import iter_records
+
+    src = Path(src)
+    writer = Binlog_writer(folder or src.parent, src.name)
+    count = 0
+    chunk = []
+    for _, record in iter_records(src):
+        chunk.append(record)
+        if len(chunk) >= 1000:
+            writer.write(chunk)
+            count += len(chunk)
+            chunk = []
+    writer.write(chunk)
+    count += len(chunk)
+    writer.close()
+    return count
+
+
+def binlog_to_json(src, dst):
+    reader = Binlog_reader(src)
+    with open(dst, 'a') as f:
+        for record in reader:
+            f.write(f'{json.dumps(record)}\n')
+    count = len(reader)
+    reader.close()
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('src', type=str,
+                        help='log file to convert')
+    parser.add_argument('-o', '--output', default=None, type=str,
+                        help='json-lines file when src is binary, folder when src is json-lines')
+    args = parser.parse_args()
+
+    if args.src.endswith(suffix):
+        dst = args.output or args.src[:-len(suffix)]
+        print(f'==> {binlog_to_json(args.src, dst)} records written to {dst}.')
+    else:
+        print(f'==> {json_to_binlog(args.src, args.output)} records converted.')
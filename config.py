@@ -1,5 +1,62 @@
 config = {
     'number_of_buffer': 5,
     'db_connect_timeout': 5,
-    'db_connect_retries': 2
+    'db_connect_retries': 2,
+    'sample_rate': 1,
+    'fusion_mode': 'nearest',
+    'stream_maxlen': 600,
+    'db_batch_size': 500,
+    'db_flush_interval': 5,
+    'db_queue_size': 10000,
+    'db_overflow_policy': 'drop_oldest',
+    'spool_segment_bytes': 16 * 1024 * 1024,
+    'spool_fsync': False,
+    'spool_replay_chunk': 1000,
+    'spool_replay_interval': 10,
+    'backfill_workers': 4,
+    'backfill_chunk_size': 5000,
+    'backfill_send_threads': 2,
+    'log_format': 'json',
+    'stats_max_samples': 100000,
+    'interface': 'wlo1',
+    'iperf_output': 'auto',
+    'probe_engine': 'ping',
+    'runtime': 'threads',
+    'console': 'all',
+    'console_interval': 5,
+    'metrics_port': 0,
+    'profile_maxlen': 100000,
+    'counter_wrap_margin': 0.1,
+    'log_max_bytes': 64 * 1024 * 1024,
+    'log_compress': True,
+    'log_retention_days': 30,
+    'summary_interval_mins': 15,
+    'producer_restart_delay': 5,
+    'local_store': True,
+    'local_store_file': 'local_store.sqlite',
+    'iperf_parallel': 1,
+    'iperf_buffer_length': 1024,
+    'iperf_bitrate': '0',
+    'roam_sample_rate': 10,
+    'roam_settle_secs': 3,
+    'scan_interval': 60,
+    'scan_ttl': 180,
+    # a triggered scan takes the radio off channel for seconds, by default only `iw scan dump`
+    'scan_trigger': False,
+    'sinks': ['influxdb'],
+    'producer_warmup_secs': 1,
+    'alert_rules': [
+        {'name': 'weak_signal', 'kind': 'threshold', 'field': 'signal', 'op': '<', 'value': -75, 'for_secs': 10},
+        {'name': 'high_latency', 'kind': 'percentile', 'field': 'latency', 'op': '>', 'value': 50,
+         'p': 95, 'window_secs': 30},
+        {'name': 'throughput_drop', 'kind': 'drop', 'field': 'throughput', 'ratio': 0.5, 'for_secs': 5},
+    ],
+    'alert_webhook': None,
+    'alert_batch_secs': 2,
+    'alert_min_interval_secs': 300,
+    'alert_queue_size': 1000,
+    'alert_timeout_secs': 5,
+    'rollup_windows': {'10s': 10, '1m': 60},
+    'raw_retention_days': None,
+    'raw_retention_policy': 'wifi_raw'
 }
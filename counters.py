@@ -0,0 +1,98 @@
+from config import config
+
+# cumulative station counters and their width in bits
+counter_widths = {
+    'rx_bytes': 64,
+    'tx_bytes': 64,
+    'rx_packets': 32,
+    'tx_packets': 32,
+    'tx_retries': 32,
+    'tx_failed': 32,
+}
+
+# fields Counter_differ.update() returns, None when not known for the interval
+rate_fields = ('rx_goodput', 'tx_goodput', 'rx_pps', 'tx_pps', 'tx_retry_ratio', 'tx_fail_ratio', 'airtime')
+
+
+class Counter_differ:
+    '''
+    per interval rates from the cumulative counters of consecutive Station_info samples:
+    a counter going backwards from near the top of its width wrapped, otherwise it was reset
+    (reconnect, driver reload) and the interval is unknown; a new bssid starts over
+    '''
+
+    def __init__(self, wrap_margin=config['counter_wrap_margin']):
+        # a wrap is only believed when the previous value was within this share of the top
+        self.wrap_margin = wrap_margin
+        self.prev = None
+        self.prev_ts = None
+        self.prev_bssid = None
+        self.resets = 0
+        self.wraps = 0
+
+    def reset(self):
+        self.prev = None
+        self.prev_ts = None
+        self.prev_bssid = None
+
+    def delta(self, name, value):
+        prev = self.prev.get(name)
+        if value is None or prev is None:
+            return None
+        if value >= prev:
+            return value - prev
+
+        top = 1 << counter_widths[name]
+        if prev >= top * (1 - self.wrap_margin):
+            self.wraps += 1
+            return value + top - prev
+        self.resets += 1
+        return None
+
+    def update(self, link, ts):
+        '''
+        link: Station_info, ts: monotonic secs of the sample, return {rate_fields: value}
+        '''
+        rates = dict.fromkeys(rate_fields)
+        current = {name: getattr(link, name) for name in counter_widths}
+
+        if self.prev is None or link.bssid != self.prev_bssid or ts <= self.prev_ts:
+            self.prev, self.prev_ts, self.prev_bssid = current, ts, link.bssid
+            return rates
+
+        dt = ts - self.prev_ts
+        deltas = {name: self.delta(name, value) for name, value in current.items()}
+        self.prev, self.prev_ts = current, ts
+
+        rx_bytes, tx_bytes = deltas['rx_bytes'], deltas['tx_bytes']
+        rx_packets, tx_packets = deltas['rx_packets'], deltas['tx_packets']
+        retries, failed = deltas['tx_retries'], deltas['tx_failed']
+
+        if rx_bytes is not None:
+            rates['rx_goodput'] = round(rx_bytes * 8 / dt / 1e6, 3)
+        if tx_bytes is not None:
+            rates['tx_goodput'] = round(tx_bytes * 8 / dt / 1e6, 3)
+        if rx_packets is not None:
+            rates['rx_pps'] = round(rx_packets / dt, 1)
+        if tx_packets is not None:
+            rates['tx_pps'] = round(tx_packets / dt, 1)
+        if tx_packets is not None and retries is not None and tx_packets + retries:
+            # share of transmit attempts which were retries
+            rates['tx_retry_ratio'] = round(retries / (tx_packets + retries), 4)
+        if tx_packets is not None and failed is not None and tx_packets:
+            rates['tx_fail_ratio'] = round(failed / tx_packets, 4)
+
+        # share of the interval the radio spent on our frames at the current phy rates
+        if None not in (rx_bytes, tx_bytes) and link.rx_bitrate and link.tx_bitrate:
+            busy = rx_bytes * 8 / (link.rx_bitrate * 1e6) + tx_bytes * 8 / (link.tx_bitrate * 1e6)
+            rates['airtime'] = round(min(busy / dt, 1.0), 4)
+        return rates
+
+
+def passive_throughput(rates):
+    '''
+    throughput estimate of passive runs: rx + tx goodput of the interval
+    '''
+    if rates['rx_goodput'] is None and rates['tx_goodput'] is None:
+        return None
+    return round((rates['rx_goodput'] or 0.0) + (rates['tx_goodput'] or 0.0), 2)
@@ -0,0 +1,97 @@
+import threading
+from time import monotonic
+from collections import deque
+
+
+class Sample_stream:
+    '''
+    bounded buffer of (timestamp, value) from one producer,
+    put() never blocks and the oldest samples fall off when full
+    '''
+
+    def __init__(self, name, maxlen=600):
+        self.name = name
+        self.samples = deque(maxlen=maxlen)
+        self.lock = threading.Lock()
+        self.total = 0
+
+    def put(self, item):
+        # accept a bare value from producers which don't stamp their samples
+        if not isinstance(item, tuple):
+            item = (monotonic(), item)
+        with self.lock:
+            self.samples.append(item)
+            self.total += 1
+
+    def __len__(self):
+        return len(self.samples)
+
+    def window(self, start, end):
+        with self.lock:
+            return [(ts, value) for ts, value in self.samples if start < ts <= end]
+
+    def last_before(self, end):
+        with self.lock:
+            for ts, value in reversed(self.samples):
+                if ts <= end:
+                    return ts, value
+        return None
+
+    def discard_before(self, ts):
+        with self.lock:
+            while self.samples and self.samples[0][0] < ts:
+                self.samples.popleft()
+
+
+def fuse_nearest(stream, start, end):
+    samples = stream.window(start, end)
+    if not samples:
+        # a producer of the same period with some phase jitter left this window empty,
+        # take its newest sample of at most one period before
+        sample = stream.last_before(start)
+        if sample is None or sample[0] <= start - (end - start):
+            return None
+        return sample[1]
+    middle = (start + end) / 2
+    return min(samples, key=lambda sample: abs(sample[0] - middle))[1]
+
+
+def fuse_last(stream, start, end):
+    sample = stream.last_before(end)
+    # a value older than the previous window is stale
+    if sample is None or sample[0] <= start - (end - start):
+        return None
+    return sample[1]
+
+
+def fuse_mean(stream, start, end):
+    values = [value for _, value in stream.window(start, end)]
+    if not values:
+        return None
+    return round(sum(values) / len(values), 3)
+
+
+fusion_modes = {
+    'nearest': fuse_nearest,
+    'last': fuse_last,
+    'mean': fuse_mean,
+}
+
+
+class Sample_fuser:
+    '''
+    join the streams by time window: each tick gets the value of every stream
+    which belongs to (tick - period, tick], None when a producer has nothing for it
+    '''
+
+    def __init__(self, streams, mode='nearest', keep_secs=10):
+        self.streams = streams
+        self.fuse = fusion_modes[mode]
+        self.mode = mode
+        self.keep_secs = keep_secs
+
+    def fuse_window(self, start, end):
+        result = {name: self.fuse(stream, start, end) for name, stream in self.streams.items()}
+        for stream in self.streams.values():
+            stream.discard_before(end - self.keep_secs)
+        return result
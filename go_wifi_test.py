@@ -2,86 +2,182 @@
 
 import sys
 import os
-from time import sleep
+from time import sleep, monotonic, time
+# startup is timed from here to the first sample, imports included
+process_start = monotonic()
 from datetime import datetime
-from copy import copy
 import argparse
-import re
 import threading
-import queue
-from subprocess import check_output, STDOUT
 from pathlib import Path
 import json
-import csv
 
 from influxdb_logger import Influxdb_logger
 from ping_tool import Ping_runner
-from iperf3_tool import Iperf3_runner
+from iperf3_tool import Iperf3_runner, flatten_interval
+from probe_tool import probe_engines
+from link_stats import get_link_sampler, link_backends, format_channel, Iw_sampler
+from scheduler import Tick_scheduler, parse_sample_rate
+from fusion import Sample_stream, Sample_fuser, fusion_modes
+from stats import Run_stats
+from metrics_server import Live_metrics, Metrics_server, Console_printer
+from profiler import profiler
+from counters import Counter_differ, passive_throughput
+from rotating import Rotating_file
+from roaming import Roam_tracker, roam_summary
+from scan_cache import Scan_cache, print_index
+from sinks import sink_types, parse_sink, write_csv_rows
+from alerts import Alert_engine, Alert_notifier, make_rule
+from rollups import Rollups
+from config import config
 
 
 class Wifi_test_logger(Influxdb_logger):
 
-    def __init__(self, duration, router_ip, location, iperf_server_ip, reverse, no_iperf):
-        super().__init__()
+    log_name_format = 'log_wifi_test_{date}'
+
+    def __init__(self, duration, router_ip, location, iperf_server_ip, reverse, no_iperf, link_backend='auto',
+                 sample_rate=config['sample_rate'], fusion_mode=config['fusion_mode'],
+                 log_format=config['log_format'], interface=config['interface'], iperf_port=5201,
+                 tags=None, scheduler=None, shared=None, bind_interface=False,
+                 iperf_output=config['iperf_output'], probe_engine=config['probe_engine'],
+                 probe_port=None, probe_tos=240, console=config['console'], passive=False,
+                 daemon=False, summary_interval=config['summary_interval_mins'],
+                 iperf_direction=None, iperf_parallel=config['iperf_parallel'],
+                 iperf_buffer_length=config['iperf_buffer_length'], iperf_udp=False,
+                 iperf_bitrate=config['iperf_bitrate'], track_roaming=False, scan=False, sinks=None,
+                 alerts=False, webhook=config['alert_webhook'], link_channel=None,
+                 scan_trigger=config['scan_trigger']):
+        super().__init__(shared=shared, sinks=sinks)
+        self.log_format = log_format
+        self.interface = interface
+        self.iperf_port = iperf_port
+        self.iperf_output = iperf_output
+        self.probe_engine = probe_engine
+        self.probe_port = probe_port
+        self.probe_tos = probe_tos
+        # extra fields of every record, e.g. job tags of the orchestrator
+        self.tags = tags or {}
+        # ping through this interface, needed when several radios are up
+        self.bind_interface = bind_interface
         self.duration = duration
+        self.sample_rate = sample_rate
         self.location = location
         self.router_ip = router_ip
         self.iperf_server_ip = iperf_server_ip
         self.reverse = reverse
-        self.no_iperf = no_iperf
+        # ul, dl, both (one client per direction) or bidir (one iperf3 --bidir client)
+        self.iperf_direction = iperf_direction or ('dl' if reverse else 'ul')
+        self.directions = ('ul', 'dl') if self.iperf_direction in ('both', 'bidir') else (self.iperf_direction,)
+        self.iperf_parallel = iperf_parallel
+        self.iperf_buffer_length = iperf_buffer_length
+        self.iperf_udp = iperf_udp
+        self.iperf_bitrate = iperf_bitrate
+        # no iperf load, throughput is estimated from the station byte counters
+        self.passive = passive
+        self.no_iperf = no_iperf or passive
         self.error_msg_showed = False
-
-        self.total_signal = 0
-        self.total_latency = 0
-        self.total_throughput = 0
+        # run until stopped, summarize every summary_interval mins instead of once at the end
+        self.daemon = daemon
+        self.summary_secs = summary_interval * 60
+        self.window_start = monotonic()
+        self.next_summary = self.window_start + self.summary_secs
+
+        self.run_id = f'{datetime.now():%Y%m%d_%H%M%S}_{interface}'
+        self.samples_taken = 0
+        self.startup_secs = None
+        # rtt mdev of the ping summary, None until ping exits
+        self.ping_mdev = None
+        self.scheduler = scheduler or Tick_scheduler(sample_rate, duration)
+        self.stats = self.new_stats()
+        # keep sub-second part in record time when sampling faster than 1 Hz
+        self.time_format = '%Y-%m-%d %H:%M:%S' if sample_rate <= 1 else '%Y-%m-%d %H:%M:%S.%f'
+        self.console = Console_printer(console)
+        self.metrics = Live_metrics(sample_rate)
 
         self.summary_folder = Path.cwd().joinpath('summary')
         if not self.summary_folder.exists():
             self.summary_folder.mkdir()
 
-        self.log_file = self.log_folder.joinpath(
-            f'log_wifi_test_{datetime.now().date()}')
-
-        self.summary_file = self.summary_folder.joinpath(
-            f'{datetime.now().date()}_wifi_test_summary')
+        # named by the date of each write, a run across midnight starts new files
+        if shared is not None:
+            self.summary_writer = shared.summary_writer
+            self.summary_csv_writer = shared.summary_csv_writer
+        else:
+            self.summary_writer = Rotating_file(self.summary_folder, '{date}_wifi_test_summary',
+                                                retention_days=config['log_retention_days'])
+            self.summary_csv_writer = Rotating_file(self.summary_folder, '{date}_wifi_test_summary.csv',
+                                                    retention_days=config['log_retention_days'])
+        self.csv_headers = {}
 
-        self.summary_csv_file = self.summary_folder.joinpath(
-            f'{datetime.now().date()}_wifi_test_summary.csv')
+        # link_channel: Nl80211_socket shared by the jobs of an orchestrator, which closes it
+        self.link_sampler = get_link_sampler(self.interface, link_backend, channel=link_channel)
 
-        self.queue_ping = queue.Queue()
-        self.queue_iperf = queue.Queue()
+        self.ping_stream = Sample_stream('latency', maxlen=config['stream_maxlen'])
+        self.iperf_streams = {direction: Sample_stream(f'throughput_{direction}', maxlen=config['stream_maxlen'])
+                              for direction in self.directions}
 
-    def get_wifi_link_status(self):
-        # iw info
-        cmd = 'iw wlo1 info'
+        streams = {'latency': self.ping_stream}
+        if not self.no_iperf:
+            streams.update({stream.name: stream for stream in self.iperf_streams.values()})
+        self.fuser = Sample_fuser(streams, mode=fusion_mode)
 
-        cmd_result = check_output(
-            [cmd], timeout=3, stderr=STDOUT, shell=True).decode('utf8').strip()
+        # per-interval iperf metrics of json mode, joined by the latest one
+        self.iperf_detail_streams = {direction: Sample_stream(f'iperf_detail_{direction}', maxlen=config['stream_maxlen'])
+                                     for direction in self.directions}
+        self.detail_fuser = Sample_fuser({stream.name: stream for stream in self.iperf_detail_streams.values()},
+                                         mode='last')
 
-        # get ssid
-        ssid_pattern = re.compile(r'ssid (.*)')
-        try:
-            self.ssid = ssid_pattern.search(cmd_result).group(1)
-        except AttributeError:
-            self.ssid = None
-            self.channel = None
-            self.bandwidth = None
-            self.bandwidth = None
-            return False
+        self.counters = Counter_differ()
 
-        # get channel
-        channel_pattern = re.compile(r'channel ([^,]*),')
-        self.channel = channel_pattern.search(cmd_result).group(1)
+        self.roam_events = []
+        self.roam_tracker = None
+        if track_roaming:
+            gap_streams = {'ping': self.ping_stream}
+            if not self.no_iperf:
+                gap_streams.update({f'iperf_{direction}': stream for direction, stream in self.iperf_streams.items()})
+            self.roam_tracker = Roam_tracker(self.interface, self.link_sampler.name, gap_streams, self.scheduler.period)
+
+        # neighbor APs of a background scan, tag every record with the load on our channels
+        self.scan_cache = None
+        if scan:
+            if scan_trigger and not self.no_iperf:
+                # off channel the iperf flows stall and the throughput is the scan's
+                print('==> no triggered scans under iperf load, reading the scan results of the kernel (iw scan dump).')
+                scan_trigger = False
+            self.scan_cache = Scan_cache(self.interface, trigger=scan_trigger)
+
+        # 10 s / 1 min aggregates of the samples, written as measurements of their own
+        self.rollups = Rollups('wifi_test', extra_keys=self.tags) if config['rollup_windows'] else None
+
+        # rules checked on every sample, the notifier posts to the webhook off the sampling thread
+        self.alert_engine = Alert_engine([make_rule(rule) for rule in config['alert_rules']]) if alerts else None
+        if shared is not None:
+            self.notifier = shared.notifier
+        else:
+            self.notifier = Alert_notifier(webhook) if alerts and webhook else None
 
-        # get bandwidth
-        bandwidth_pattern = re.compile(r'width: (\d*) MHz')
-        self.bandwidth = int(bandwidth_pattern.search(cmd_result).group(1))
+        self.is_shut_down = False
 
-        # get center freq
-        center_freq_pattern = re.compile(r'center1: (\d*) MHz')
-        self.center_freq = int(center_freq_pattern.search(cmd_result).group(1))
+    def new_stats(self):
+        ticks = self.summary_secs * self.sample_rate if self.daemon else self.scheduler.total_ticks
+        return Run_stats(capacity=round(ticks or 0), max_samples=config['stats_max_samples'])
 
-        return True
+    def get_wifi_link_status(self):
+        try:
+            self.link = self.link_sampler.sample()
+        except OSError as e:
+            if self.link_sampler.name == 'iw':
+                raise
+            # e.g. a reply lost on the netlink socket
+            print(f'==> nl80211 sample failed ({e.__class__} {e}), fallback to iw.')
+            self.link_sampler.close()
+            self.link_sampler = Iw_sampler(self.interface)
+            self.link = self.link_sampler.sample()
+        self.ssid = self.link.ssid
+        self.channel = self.link.channel
+        self.bandwidth = self.link.bandwidth
+        self.center_freq = self.link.center_freq
+        return self.link.connected
 
     def check_2dot4G_or_5G(self):
         if self.center_freq < 3000:
@@ -91,213 +187,277 @@ class Wifi_test_logger(Influxdb_logger):
             # print('\n==> Connect Wifi to 5 GHz.\n')
             self.connected_at_5GHz = True
 
-    def detect_signal(self, duration):
+    def detect_signal(self):
         '''
         show collected result from ping and iperf thread and send to buffer
         '''
 
-        for sec, _ in enumerate(range(duration), start=1):
+        for _ in self.scheduler:
+            self.sample_once()
+            self.roll_summary()
 
-            # check status first
+    def sample_once(self):
+        '''
+        take one sample for the current tick of the scheduler, return False when it is skipped
+        '''
+
+        with profiler.stage('sample'):
+            self.log_roams()
+            return self.take_sample()
+
+    def log_roams(self, final=False):
+        if self.roam_tracker is None:
+            return
+        for event in self.roam_tracker.collect(monotonic(), final=final):
+            self.roam_events.append(event)
+            print(f'==> {event.kind}: {event.old_bssid} -> {event.new_bssid}, signal {event.signal_before} -> '
+                  f'{event.signal_after} dBm, link gap {event.link_gap_ms} ms, '
+                  f'interruption {event.gaps.get("interruption_ms")} ms.')
+            self.logging_with_buffer({
+                'measurement': 'wifi_roam',
+                'time': datetime.utcnow().strftime(self.time_format),
+                'fields': {'location': self.location,
+                           'ssid': self.ssid,
+                           'interface': self.interface,
+                           **event.as_fields(),
+                           **self.tags
+                           }
+            })
+
+    def take_sample(self):
+        # check status first
+        with profiler.stage('link_sample'):
             wifi_connected = self.get_wifi_link_status()
-            if not wifi_connected and not self.error_msg_showed:
+        if not wifi_connected:
+            self.counters.reset()
+            if not self.error_msg_showed:
                 print('==> wifi connection lost.')
                 self.error_msg_showed = True
-                sleep(1)
-                continue
-
-            self.check_2dot4G_or_5G()
+            return False
 
-            cmd = 'iw wlo1 link'
-            cmd_result = check_output(
-                [cmd], timeout=5, stderr=STDOUT, shell=True).decode('utf8').strip()
+        self.check_2dot4G_or_5G()
+
+        # every connected tick, so each delta spans one period
+        rates = self.counters.update(self.link, monotonic())
+
+        link = self.link
+        rx_bitrate = link.rx_bitrate
+        tx_bitrate = link.tx_bitrate
+        rx_mcs = link.rx_mcs
+        tx_mcs = link.tx_mcs
+        nss = link.nss
+        signal = link.signal
+
+        # if connected to 2.4GHz, sometimes there is no mcs showed and never nss.
+        if not self.connected_at_5GHz:
+            rx_mcs = 0 if rx_mcs is None else rx_mcs
+            tx_mcs = 0 if tx_mcs is None else tx_mcs
+            nss = 0
+
+        essential = {'signal': signal, 'rx bitrate': rx_bitrate, 'tx bitrate': tx_bitrate,
+                     'rx mcs': rx_mcs, 'tx mcs': tx_mcs, 'nss': nss}
+        missing = [name for name, value in essential.items() if value is None]
+        if missing:
+            if not self.error_msg_showed:
+                print(f'==> missing essential value: {", ".join(missing)}.')
+                print(link)
+            return False
 
-            # output difference from iw wlo1 link
-            # wifi 5
-            # rx bitrate: 58.5 Mbit/s VHT-MCS 9 80 MHz VHT-NSS 1
-            # wifi 6
-            # rx bitrate: 1200.9 MBit/s 80MHz HE-MCS 11 HE-NSS 2 HE-GI 0 HE-DCM 0
-            # 2.4 GHz
-            # rx bitrate: 144.4 MBit/s MCS 15 short GI
+        # join ping latency and iperf throughput which belong to this tick
+        deadline = self.scheduler.deadline
+        with profiler.stage('fusion'):
+            fused = self.fuser.fuse_window(deadline - self.scheduler.period, deadline)
 
-            # get rx bitrate
-            bitrate_pattern = re.compile(r'rx bitrate: (.*) MBit/s')
-            try:
-                rx_bitrate = float(bitrate_pattern.search(cmd_result).group(1))
-            except AttributeError:
-                if not self.error_msg_showed:
-                    print('==> missing essential value: rx bitrate.')
-                    print(cmd_result)
-                sleep(1)
-                continue
+        latency = fused['latency']
+        if latency is None:
+            if not self.error_msg_showed:
+                print('==> Error: no ping result in this tick.')
+            return False
 
-            # get tx bitrate
-            bitrate_pattern = re.compile(r'tx bitrate: (.*) MBit/s')
-            try:
-                tx_bitrate = float(bitrate_pattern.search(cmd_result).group(1))
-            except AttributeError:
+        direction_fields = {}
+        if not self.no_iperf:
+            throughputs = {direction: fused[f'throughput_{direction}'] for direction in self.directions}
+            missing = [direction for direction, value in throughputs.items() if value is None]
+            if missing:
                 if not self.error_msg_showed:
-                    print('==> missing essential value: tx bitrate.')
-                    print(cmd_result)
-                sleep(1)
-                continue
+                    print(f'==> Error: no iperf {"/".join(missing)} result in this tick.')
+                return False
+            throughput = round(sum(throughputs.values()), 2)
+            if len(throughputs) > 1:
+                direction_fields = {f'throughput_{direction}': value for direction, value in throughputs.items()}
+        elif self.passive:
+            throughput = passive_throughput(rates)
+        else:
+            throughput = 0.0
+
+        scan_fields = self.scan_cache.link_fields(link) if self.scan_cache is not None else {}
+
+        iperf_details = self.detail_fuser.fuse_window(deadline - self.scheduler.period, deadline)
+        iperf_fields = {}
+        for direction in self.directions:
+            iperf_detail = iperf_details[f'iperf_detail_{direction}']
+            if iperf_detail:
+                prefix = 'iperf' if len(self.directions) == 1 else f'iperf_{direction}'
+                iperf_fields.update(flatten_interval(iperf_detail, prefix))
+        if self.console.due():
+            direction_string = ''.join(f', {name[11:]}: {value}' for name, value in direction_fields.items())
+            self.console.print([
+                f'sec: {self.scheduler.elapsed:.1f}, interface: {self.interface}, ssid: {self.ssid}, channel: {self.channel}, bandwidth: {self.bandwidth}',
+                f'\tsignal: {signal} dBm. Rx_bitrate: {rx_bitrate} Mbit/s, Tx_bitrate: {tx_bitrate} Mbit/s, rx_mcs: {rx_mcs}, tx_mcs: {tx_mcs}, nss: {nss}.',
+                f'\tlatency: {latency} ms, throughput: {throughput} Mbps{direction_string}',
+                '-' * 120])
+
+        record_time = datetime.utcnow().strftime(self.time_format)
+        data = {
+            'measurement': 'wifi_test',
+            'time': record_time,
+            'fields': {'location': self.location,
+                       'ssid': self.ssid,
+                       'bssid': link.bssid,
+                       'channel': self.channel,
+                       'bandwidth': self.bandwidth,
+                       'signal': signal,
+                       'rx_bitrate': rx_bitrate,
+                       'tx_bitrate': tx_bitrate,
+                       'rx_mcs': rx_mcs,
+                       'tx_mcs': tx_mcs,
+                       'nss': nss,
+                       'latency': latency,
+                       'throughput': throughput,
+                       **direction_fields,
+                       **rates,
+                       **scan_fields,
+                       **iperf_fields,
+                       **self.tags
+                       }
+        }
+
+        with profiler.stage('logging'):
+            self.logging_with_buffer(data)
+        if self.rollups is not None:
+            with profiler.stage('rollup'):
+                for record in self.rollups.add(data['fields'], time()):
+                    self.logging_with_buffer(record)
+
+        self.stats.add(data['fields'], deadline)
+        self.metrics.update(data['fields'], deadline)
+        if self.alert_engine is not None:
+            with profiler.stage('alerts'):
+                self.raise_alerts(data['fields'], deadline)
+        self.samples_taken += 1
+        if self.startup_secs is None:
+            self.startup_secs = round(monotonic() - process_start, 3)
+            print(f'==> first sample {self.startup_secs} secs after start.')
 
-            # get rx mcs
-            rx_mcs_pattern = re.compile(r'rx.*(HE-MCS|VHT-MCS|MCS) (\d*)\W')
-            try:
-                rx_mcs = int(rx_mcs_pattern.search(cmd_result).group(2))
-            except (AttributeError, ValueError):
-                # if connected to 2.4GHz, sometimes there is no rx mcs showed in cmd output.
-                if not self.connected_at_5GHz:
-                    tx_mcs = 0
-                else:
-                    if not self.error_msg_showed:
-                        print('==> missing essential value: rx mcs.')
-                        print(cmd_result)
-                    sleep(1)
-                    continue
-
-            # get tx mcs
-            tx_mcs_pattern = re.compile(r'tx.*(HE-MCS|VHT-MCS|MCS) (\d*)\W')
-            try:
-                tx_mcs = int(tx_mcs_pattern.search(
-                    cmd_result).group(2).strip())
-            except (AttributeError, ValueError):
-                # if connected to 2.4GHz, sometimes there is no tx mcs showed in cmd output.
-                if not self.connected_at_5GHz:
-                    tx_mcs = 0
-                else:
-                    if not self.error_msg_showed:
-                        print('==> missing essential value: tx mcs.')
-                        print(cmd_result)
-                    sleep(1)
-                    continue
-
-            # get nss
-            # when connect to 2.4GHz there is no nss info in iw link output
-            nss_pattern = re.compile(r'(HE-NSS|VHT-NSS) (\d*)\W')
-            if not self.connected_at_5GHz:
-                nss = 0
-            else:
-                try:
-                    nss = int(nss_pattern.search(cmd_result).group(2))
-                except AttributeError:
-                    if not self.error_msg_showed:
-                        print('==> missing essential value: nss.')
-                        print(cmd_result)
-                    sleep(1)
-                    continue
-
-            # get signal
-            signal_pattern = re.compile(r'signal: (.*) dBm')
-            try:
-                signal = int(signal_pattern.search(cmd_result).group(1))
-            except AttributeError:
-                if not self.error_msg_showed:
-                    print('==> missing essential value.')
-                sleep(1)
-                continue
+        self.error_msg_showed = False
+        return True
 
-            # get ping latency from ping_tool
+    def flush_rollups(self):
+        # the windows open at the end of a run, partial ones tell by their samples
+        if self.rollups is not None:
+            for record in self.rollups.close():
+                self.logging_with_buffer(record)
+
+    def raise_alerts(self, fields, ts):
+        for alert in self.alert_engine.evaluate(fields, ts):
+            print(f'==> alert {alert["rule"]} {alert["state"]}: {alert["condition"]}, {alert["field"]} {alert["value"]}.')
+            alert.update({'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                          'location': self.location,
+                          'interface': self.interface,
+                          'ssid': self.ssid,
+                          'bssid': fields.get('bssid'),
+                          **self.tags})
+            self.logging_with_buffer({
+                'measurement': 'wifi_alert',
+                'time': datetime.utcnow().strftime(self.time_format),
+                'fields': {key: value for key, value in alert.items() if key != 'time'}
+            })
+            if self.notifier is not None:
+                self.notifier.notify(alert)
+
+    def roll_summary(self, final=False):
+        '''
+        daemon mode: summarize the samples since the last rolling summary, then start a new window
+        '''
+        now = monotonic()
+        if not self.daemon or (now < self.next_summary and not final):
+            return
+        self.next_summary += self.summary_secs
+        self.window_secs = round(now - self.window_start, 1)
+        self.window_start = now
+        if self.stats.count:
+            self.show_avg()
+            self.summarize()
+            self.summarize_to_file()
+            self.summarize_to_csv()
+        self.stats = self.new_stats()
+        self.scheduler.reset_jitters()
+        self.roam_events = []
+
+    def keep_running(self, producer, name):
+        '''
+        daemon mode: restart ping or iperf when it exits, e.g. the iperf3 server restarted
+        '''
+        while True:
             try:
-                latency = self.queue_ping.get(timeout=3)
-                self.queue_ping.task_done()
-            except queue.Empty:
-                if not self.error_msg_showed:
-                    print('==> Error: cannot get ping result from queue.')
-                sleep(1)
-                continue
+                producer()
+            except Exception as e:
+                if not self.daemon:
+                    raise
+                print(f'==> {name} error: {e.__class__} {e}')
+            if not self.daemon:
+                return
+            print(f'==> {name} exited, restarting in {config["producer_restart_delay"]} secs.')
+            sleep(config['producer_restart_delay'])
+
+    def make_ping_runner(self):
+        # ping tos defaults to 240 to use high priority
+        return Ping_runner(ip=self.router_ip, tos=self.probe_tos, duration=self.duration,
+                           interval=self.scheduler.period, queue=self.ping_stream,
+                           interface=self.interface if self.bind_interface else None,
+                           engine=self.probe_engine, port=self.probe_port)
 
-            # get iperf throughput from iperf3_tool
-            if not self.no_iperf:
-                try:
-                    throughput = self.queue_iperf.get(timeout=1)
-                    self.queue_iperf.task_done()
-                except queue.Empty:
-                    if not self.error_msg_showed:
-                        print('==> Error: cannot get iperf result from queue.')
-                    sleep(1)
-                    continue
-            else:
-                throughput = 0.0
-
-            print(
-                f'sec: {sec}, ssid: {self.ssid}, channel: {self.channel}, bandwidth: {self.bandwidth}')
-            print(
-                f'\tsignal: {signal} dBm. Rx_bitrate: {rx_bitrate} Mbit/s, Tx_bitrate: {tx_bitrate} Mbit/s, rx_mcs: {rx_mcs}, tx_mcs: {tx_mcs}, nss: {nss}.')
-            print(f'\tlatency: {latency} ms, throughput: {throughput} Mbps')
-            print('-' * 120)
-
-            record_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-            data = {
-                'measurement': 'wifi_test',
-                'time': record_time,
-                'fields': {'location': self.location,
-                           'ssid': self.ssid,
-                           'channel': self.channel,
-                           'bandwidth': self.bandwidth,
-                           'signal': signal,
-                           'rx_bitrate': rx_bitrate,
-                           'tx_bitrate': tx_bitrate,
-                           'rx_mcs': rx_mcs,
-                           'tx_mcs': tx_mcs,
-                           'nss': nss,
-                           'latency': latency,
-                           'throughput': throughput
-                           }
-            }
-
-            self.logging_with_buffer(data)
-
-            self.total_signal += signal
-            self.total_latency += latency
-            self.total_throughput += throughput
-
-            self.error_msg_showed = False
+    def start_ping(self):
+        ping_runner = self.make_ping_runner()
+        ping_runner.run()
+        self.report_ping_stats(ping_runner.stats)
 
-            sleep(1)
+    def report_ping_stats(self, ping_stats):
+        self.ping_stats = ping_stats
 
-    def start_ping(self):
-        # set ping tos = 240 to use high priority
-        ping_runner = Ping_runner(ip=self.router_ip, tos=240, duration=self.duration,
-                                  interval=1, queue=self.queue_ping)
-        self.ping_summary = ping_runner.run()
-
-        # show summary
-        # print(f'{self.ping_summary=}')
-
-        # get and show ping mdev
-        mdev_pattern = re.compile(r'/([0-9.]*) ms')
-        self.latency_mdev = float(
-            mdev_pattern.search(self.ping_summary).group(1))
-        print(f'{self.latency_mdev=}')
-
-        # get packet loss rate stuff
-        packet_sent_pattern = re.compile(r'([0-9]*) packets transmitted')
-        self.packet_sent = int(
-            packet_sent_pattern.search(self.ping_summary).group(1))
+        # show ping mdev and packet loss rate stuff
+        self.ping_mdev = self.ping_stats.get('rtt_mdev')
+        print(f'{self.ping_mdev=}')
+        self.packet_sent = self.ping_stats.get('packets_sent')
         print(f'{self.packet_sent=}')
-
-        packet_received_pattern = re.compile(r'([0-9]*) received')
-        self.packet_received = int(
-            packet_received_pattern.search(self.ping_summary).group(1))
+        self.packet_received = self.ping_stats.get('packets_received')
         print(f'{self.packet_received=}')
-
-        loss_rate_pattern = re.compile(r'([0-9.]*)% packet loss')
-        self.packet_loss_rate = float(
-            loss_rate_pattern.search(self.ping_summary).group(1))
+        self.packet_loss_rate = self.ping_stats.get('packet_loss_rate')
         print(f'{self.packet_loss_rate=}%')
 
-    def start_iperf(self):
-        iperf_runner = Iperf3_runner(host=self.iperf_server_ip, tos=0, port=5201, exec_secs=self.duration,
-                                     bitrate=0, udp=False, reverse=self.reverse, buffer_length=1024,
-                                     queue=self.queue_iperf)
-        iperf_runner.run()
+    def make_iperf_runner(self, direction, port, bidir=False):
+        return Iperf3_runner(host=self.iperf_server_ip, tos=0, port=port, exec_secs=self.duration or 0, interval=self.scheduler.period,
+                             bitrate=self.iperf_bitrate, udp=self.iperf_udp, reverse=direction == 'dl',
+                             buffer_length=self.iperf_buffer_length, parallel=self.iperf_parallel,
+                             queue=self.iperf_streams[direction], output_mode=self.iperf_output,
+                             detail_queue=self.iperf_detail_streams[direction], bidir=bidir,
+                             reverse_queue=self.iperf_streams['dl'] if bidir else None,
+                             reverse_detail_queue=self.iperf_detail_streams['dl'] if bidir else None)
+
+    def make_iperf_runners(self):
+        if self.iperf_direction == 'bidir':
+            return [self.make_iperf_runner('ul', self.iperf_port, bidir=True)]
+        if self.iperf_direction == 'both':
+            # an iperf3 server runs one test at a time, the downlink goes to the next port
+            return [self.make_iperf_runner('ul', self.iperf_port), self.make_iperf_runner('dl', self.iperf_port + 1)]
+        return [self.make_iperf_runner(self.iperf_direction, self.iperf_port)]
 
     def summarize(self):
         self.summary = {}
         self.summary['time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         self.summary['location'] = self.location
+        self.summary['interface'] = self.interface
+        self.summary.update(self.tags)
         self.summary['ssid'] = self.ssid
         self.summary['channel'] = self.channel
         self.summary['bandwidth'] = self.bandwidth
@@ -305,95 +465,322 @@ class Wifi_test_logger(Influxdb_logger):
         self.summary['avg_latency'] = self.avg_latency
         self.summary['avg_throughput'] = self.avg_throughput
         self.summary['latency_mdev'] = self.latency_mdev
-        self.summary['duration'] = self.duration
-        self.summary['tput_direction'] = 'dl' if self.reverse else 'ul'
+        self.summary['latency_std'] = self.latency_std
+        self.summary['duration'] = self.window_secs if self.daemon else self.duration
+        self.summary['sample_rate'] = self.sample_rate
+        self.summary['samples'] = self.stats.count
+        # since the start of the run
+        self.summary['missed_ticks'] = self.scheduler.missed_ticks
+        self.summary['startup_secs'] = self.startup_secs
+        self.summary.update(self.scheduler.jitter_stats())
+        self.summary['tput_direction'] = 'passive' if self.passive else self.iperf_direction
+        if len(self.directions) > 1 and not self.no_iperf:
+            for direction in self.directions:
+                self.summary[f'avg_throughput_{direction}'] = round(self.stats.field(f'throughput_{direction}').get('avg', 0), 2)
+        if not self.no_iperf:
+            self.summary['iperf_protocol'] = 'udp' if self.iperf_udp else 'tcp'
+            self.summary['iperf_parallel'] = self.iperf_parallel
+        self.summary['counter_resets'] = self.counters.resets
+        if self.roam_tracker is not None:
+            self.summary.update(roam_summary(self.roam_events))
+        if self.scan_cache is not None:
+            self.summary.update(self.scan_cache.summary(self.link.bssid))
+        if self.alert_engine is not None:
+            self.summary['alerts_fired'] = self.alert_engine.fired
+        if self.notifier is not None:
+            self.summary['alerts_sent'] = self.notifier.sent
+            self.summary['alerts_suppressed'] = self.notifier.suppressed
+            self.summary['alerts_dropped'] = self.notifier.dropped
+        self.summary.update(self.stats.summary())
 
     def summarize_to_file(self):
-        with open(self.summary_file, 'a') as f:
-            f.write(json.dumps(self.summary))
-            f.write('\n')
+        self.summary_writer.write(f'{json.dumps(self.summary)}\n')
+        if self.store is not None:
+            self.store.end_run(self.run_id, self.summary)
 
     def summarize_to_csv(self):
         headers = ['time', 'location', 'ssid', 'channel', 'bandwidth',  'avg_signal',
-                   'avg_latency', 'latency_mdev', 'tput_direction', 'avg_throughput', 'duration']
+                   'avg_latency', 'latency_mdev', 'latency_std', 'tput_direction', 'avg_throughput', 'duration',
+                   'sample_rate', 'samples', 'missed_ticks', 'jitter_ms_avg', 'jitter_ms_max']
+        headers += [key for key in self.summary if key not in headers]
 
-        if not self.summary_csv_file.exists():
-            with open(self.summary_csv_file, 'w', encoding='utf_8') as csv_file:
-                writer = csv.DictWriter(csv_file, fieldnames=headers)
-                writer.writeheader()
-
-        with open(self.summary_csv_file, 'a', encoding='utf_8') as csv_file:
-            writer = csv.DictWriter(csv_file, fieldnames=headers)
-            writer.writerow(self.summary)
+        row = {key: json.dumps(value) if isinstance(value, dict) else value
+               for key, value in self.summary.items()}
+        write_csv_rows(self.summary_csv_writer, [row], headers, self.csv_headers)
 
     def show_avg(self):
-        self.avg_signal = round(self.total_signal / self.duration, 2)
-        self.avg_latency = round(self.total_latency / self.duration, 2)
-        self.avg_throughput = round(self.total_throughput / self.duration, 2)
+        signal = self.stats.field('signal')
+        latency = self.stats.field('latency')
+        throughput = self.stats.field('throughput')
+
+        self.avg_signal = round(signal.get('avg', 0), 2)
+        self.avg_latency = round(latency.get('avg', 0), 2)
+        self.avg_throughput = round(throughput.get('avg', 0), 2)
+        # mdev of ping's own summary, std of the latency of the samples
+        self.latency_mdev = self.ping_mdev
+        self.latency_std = latency.get('std')
 
         print('=' * 120)
-        print(f'Avg signal: {self.avg_signal} dBm.')
-        print(f'Avg latency: {self.avg_latency} ms.')
-        print(f'Avg throughput: {self.avg_throughput} Mbit/s.')
+        print(f'Avg signal: {self.avg_signal} dBm. p50/p95/p99 {signal.get("p50")}/{signal.get("p95")}/{signal.get("p99")}')
+        print(f'Avg latency: {self.avg_latency} ms. p50/p95/p99 {latency.get("p50")}/{latency.get("p95")}/{latency.get("p99")}, mdev {self.latency_mdev}, std {self.latency_std}')
+        print(f'Avg throughput: {self.avg_throughput} Mbit/s. p50/p95/p99 {throughput.get("p50")}/{throughput.get("p95")}/{throughput.get("p99")}')
+        if len(self.directions) > 1 and not self.no_iperf:
+            for direction in self.directions:
+                field = self.stats.field(f'throughput_{direction}')
+                print(f'\t{direction}: {round(field.get("avg", 0), 2)} Mbit/s. p50/p95/p99 {field.get("p50")}/{field.get("p95")}/{field.get("p99")}')
+        print(f'Samples: {self.stats.count}, missed ticks: {self.scheduler.missed_ticks}, '
+              f'first sample after {self.startup_secs} secs.')
         print('=' * 120)
 
-    def run(self):
-        self.get_wifi_link_status()
+    def start_producers(self):
+        if self.roam_tracker is not None:
+            self.roam_tracker.start()
+        if self.scan_cache is not None:
+            self.scan_cache.start()
 
-        th = threading.Thread(target=self.start_ping, daemon=True)
+        th = threading.Thread(target=self.keep_running, args=(self.start_ping, 'ping'), daemon=True)
         th.start()
 
         if not self.no_iperf:
-            th = threading.Thread(target=self.start_iperf, daemon=True)
-            th.start()
-
-        # wait ping and iperf thread to start and put data in queue
-        sleep(1)
+            for runner in self.make_iperf_runners():
+                th = threading.Thread(target=self.keep_running, args=(runner.run, f'iperf port {runner.port}'), daemon=True)
+                th.start()
 
-        self.detect_signal(self.duration)
+    def producers_ready(self):
+        # the first tick fuses nothing without a sample of every stream
+        return all(stream.total for stream in self.fuser.streams.values())
 
-        self.show_avg()
+    def wait_for_producers(self, timeout=config['producer_warmup_secs']):
+        '''
+        until ping and iperf put their first samples, at most timeout secs
+        '''
+        deadline = monotonic() + timeout
+        while not self.producers_ready() and monotonic() < deadline:
+            sleep(0.01)
 
+    def shutdown(self):
+        '''
+        land what is still buffered and close the writer, once however the run ended
+        '''
+        if self.is_shut_down:
+            return
+        self.is_shut_down = True
+        self.log_roams(final=True)
+        self.flush_rollups()
         self.clean_buffer_and_send()
+        self.close_writer()
+
+    def finish(self):
+        self.shutdown()
+        self.show_avg()
+        self.report()
 
+    def report(self):
         self.summarize()
         self.summarize_to_file()
         self.summarize_to_csv()
 
+        self.link_sampler.close()
+        if self.roam_tracker is not None:
+            self.roam_tracker.close()
+        if self.scan_cache is not None:
+            self.scan_cache.close()
+        self.close_files()
+
+    def close_writer(self):
+        super().close_writer()
+        if self.notifier is not None and self.owns_writer:
+            # a dead webhook holds up the exit at most this long
+            self.notifier.close(timeout=config['alert_timeout_secs'] * 2)
+
+    def close_files(self):
+        super().close_files()
+        if self.owns_writer:
+            self.summary_writer.close()
+            self.summary_csv_writer.close()
+
+    def run(self):
+        self.get_wifi_link_status()
+
+        self.start_producers()
+        self.wait_for_producers()
+
+        self.detect_signal()
+
+        self.finish()
+
+    def log_scan(self, bsses):
+        record_time = datetime.utcnow().strftime(self.time_format)
+        for bss in bsses:
+            if bss['freq'] is None:
+                continue
+            self.logging_with_buffer({
+                'measurement': 'wifi_scan',
+                'time': record_time,
+                'fields': {'location': self.location,
+                           'interface': self.interface,
+                           'bssid': bss['bssid'],
+                           'ssid': bss['ssid'],
+                           'channel': format_channel(bss['freq']),
+                           'signal': bss['signal'],
+                           **self.tags
+                           }
+            })
+
+    def survey(self):
+        '''
+        scan-only run: no probes and no link sampling, every scan is logged and the channel index
+        of the cache goes to the summary
+        '''
+        self.get_wifi_link_status()
+        end = monotonic() + self.duration if self.duration else None
+        try:
+            while True:
+                self.log_scan(self.scan_cache.scan_once())
+                print_index(self.scan_cache.channel_index(self.link.bssid))
+                if end is not None and monotonic() + self.scan_cache.interval > end:
+                    break
+                sleep(self.scan_cache.interval)
+        except KeyboardInterrupt:
+            print('\n==> Interrupted.\n')
+
+        self.clean_buffer_and_send()
+        self.close_writer()
+
+        self.summary = {
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'location': self.location,
+            'interface': self.interface,
+            **self.tags,
+            'ssid': self.ssid,
+            'channel': self.channel,
+            'tput_direction': 'survey',
+            **self.scan_cache.summary(self.link.bssid),
+        }
+        self.summarize_to_file()
+        self.link_sampler.close()
+        self.close_files()
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('-l', '--location', metavar='', required=True, type=str,
+    parser.add_argument('-l', '--location', metavar='location', required=True, type=str,
                         help='tag data with location')
     parser.add_argument('-t', '--duration', metavar='', default=300, type=int,
                         help='test time duration (secs)')
+    parser.add_argument('-D', '--daemon', action='store_true',
+                        help='run until stopped, ignores --duration')
+    parser.add_argument('--summary_interval', metavar='', default=config['summary_interval_mins'], type=float,
+                        help='mins between rolling summaries of --daemon')
+    parser.add_argument('-f', '--sample_rate', metavar='', default=config['sample_rate'], type=parse_sample_rate,
+                        help='samples per second')
+    parser.add_argument('-F', '--fusion_mode', metavar='', default=config['fusion_mode'], choices=list(fusion_modes),
+                        help='how ping / iperf samples are joined to each tick: nearest, last or mean')
+    parser.add_argument('-L', '--log_format', metavar='', default=config['log_format'], choices=['json', 'binary', 'both'],
+                        help='sample log format: json, binary or both')
+    parser.add_argument('-i', '--interface', metavar='', default=config['interface'], type=str,
+                        help='wireless interface')
     parser.add_argument('-r', '--router_ip', metavar='', default='192.168.50.1', type=str,
                         help='router\'s IP')
     parser.add_argument('-s', '--iperf_server_ip', metavar='', default='192.168.50.210', type=str,
                         help='iperf3\'s server IP')
     parser.add_argument('-R', '--reverse', action="store_true",
                         help='iperf direction reverse to downlink from server')
+    parser.add_argument('-d', '--direction', metavar='', default=None, choices=['ul', 'dl', 'both', 'bidir'],
+                        help='iperf direction: ul, dl, both (two clients, dl on the next server port) '
+                             'or bidir (iperf3 >= 3.7), default dl with -R else ul')
+    parser.add_argument('--parallel', metavar='', default=config['iperf_parallel'], type=int,
+                        help='iperf parallel streams of each direction')
+    parser.add_argument('--buffer_length', metavar='', default=config['iperf_buffer_length'], type=int,
+                        help='iperf read / write buffer length (bytes), 0 for the iperf3 default')
+    parser.add_argument('--udp', action="store_true",
+                        help='iperf over udp, at --bitrate')
+    parser.add_argument('--bitrate', metavar='', default=config['iperf_bitrate'], type=str,
+                        help='iperf target bitrate of each stream, e.g. 300M, 0 for unlimited')
     parser.add_argument('-N', '--no_iperf', action="store_true",
                         help='disable iperf test.')
+    parser.add_argument('--passive', action="store_true",
+                        help='no iperf load, estimate throughput from the station byte counters')
+    parser.add_argument('-O', '--iperf_output', metavar='', default=config['iperf_output'], choices=['text', 'json', 'auto'],
+                        help='read iperf3 text output or its --json-stream (iperf3 >= 3.17)')
+    parser.add_argument('-P', '--probe', metavar='', default=config['probe_engine'], choices=['ping'] + list(probe_engines),
+                        help='latency probe: ping binary, or in-process icmp, udp (echo) or tcp (connect)')
+    parser.add_argument('--probe_port', metavar='', default=None, type=int,
+                        help='destination port of udp / tcp probes')
+    parser.add_argument('-Q', '--tos', metavar='', default=240, type=int,
+                        help='type of service value of latency probes')
+    parser.add_argument('--roam', action='store_true',
+                        help=f'track roams at {config["roam_sample_rate"]} Hz and measure the traffic interruption of each')
+    parser.add_argument('--scan', action='store_true',
+                        help=f'scan neighbor APs every {config["scan_interval"]} secs in the background, '
+                             'tag records with the neighbors and congestion of our channels')
+    parser.add_argument('--survey', action='store_true',
+                        help='only scan for --duration (0 until stopped) and write the channel index to the summary')
+    parser.add_argument('--scan_trigger', action='store_true', default=config['scan_trigger'],
+                        help='trigger scans (root, radio off channel) instead of reading the last results of the kernel, '
+                             'ignored under iperf load, implied by --survey')
+    parser.add_argument('--sink', metavar='', action='append', type=parse_sink,
+                        help=f'output of the records, repeat for several: {", ".join(sink_types)}, '
+                             f'name:arg for a url / file / folder (default {" ".join(config["sinks"])})')
+    parser.add_argument('--alerts', action='store_true',
+                        help='check the alert rules of config.py on every sample')
+    parser.add_argument('--webhook', metavar='', default=config['alert_webhook'], type=str,
+                        help='url the alerts are posted to as json, implies --alerts')
+    parser.add_argument('-B', '--link_backend', metavar='', default='auto', choices=['auto'] + list(link_backends),
+                        help='link stats backend: auto, nl80211 or iw')
+    parser.add_argument('--runtime', metavar='', default=config['runtime'], choices=['threads', 'asyncio'],
+                        help='run producers in threads or on one asyncio event loop')
+    parser.add_argument('--console', metavar='', default=config['console'], choices=['all', 'rate', 'off'],
+                        help=f'print every sample, one every {config["console_interval"]} secs (rate) or none')
+    parser.add_argument('--metrics_port', metavar='', default=config['metrics_port'], type=int,
+                        help='serve live metrics over http on this port, 0 to disable')
+    parser.add_argument('--profile', action='store_true',
+                        help='time every stage of the measurement loop and print a profile at the end')
+    parser.add_argument('--trace_file', metavar='', default=None, type=str,
+                        help='also save the profile as chrome trace json to this file, implies --profile')
 
     args = parser.parse_args()
-    logger = Wifi_test_logger(duration=args.duration, iperf_server_ip=args.iperf_server_ip, no_iperf=args.no_iperf,
-                              router_ip=args.router_ip, reverse=args.reverse, location=args.location)
-
+    if args.profile or args.trace_file:
+        profiler.enable()
+
+    logger_class = Wifi_test_logger
+    if args.runtime == 'asyncio':
+        from async_runtime import Async_wifi_test_logger as logger_class
+
+    logger = logger_class(duration=0 if args.daemon else args.duration, iperf_server_ip=args.iperf_server_ip, no_iperf=args.no_iperf,
+                          router_ip=args.router_ip, reverse=args.reverse, location=args.location,
+                          link_backend=args.link_backend, sample_rate=args.sample_rate,
+                          fusion_mode=args.fusion_mode, log_format=args.log_format,
+                          interface=args.interface, iperf_output=args.iperf_output,
+                          probe_engine=args.probe, probe_port=args.probe_port, probe_tos=args.tos,
+                          console=args.console, passive=args.passive,
+                          daemon=args.daemon, summary_interval=args.summary_interval,
+                          iperf_direction=args.direction, iperf_parallel=args.parallel,
+                          iperf_buffer_length=args.buffer_length, iperf_udp=args.udp, iperf_bitrate=args.bitrate,
+                          track_roaming=args.roam, scan=args.scan or args.survey, sinks=args.sink,
+                          alerts=args.alerts or bool(args.webhook), webhook=args.webhook,
+                          scan_trigger=args.scan_trigger or args.survey)
+    if args.metrics_port:
+        Metrics_server([logger], args.metrics_port).start()
+
+    interrupted = False
     try:
-        logger.run()
+        if args.survey:
+            logger.survey()
+        else:
+            logger.run()
     except KeyboardInterrupt:
         print('\n==> Interrupted.\n')
-        logger.clean_buffer_and_send()
-        sleep(0.1)
-        max_sec_count = logger.db_retries * logger.db_timeout
-        countdown = copy(max_sec_count)
-        while logger.is_sending:
-            if countdown < max_sec_count:
-                print(
-                    f'==> waiting for process to end ... secs left max {countdown}')
-            countdown -= 1
-            sleep(1)
+        interrupted = True
+        logger.shutdown()
+        if args.daemon:
+            logger.roll_summary(final=True)
+        logger.close_files()
+    finally:
+        # however the run ended, after its shutdown
+        profiler.finish(args.trace_file)
+
+    if interrupted:
         try:
             print('\n==> Exited')
             sys.exit(0)
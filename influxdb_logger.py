@@ -1,60 +1,97 @@
 from pathlib import Path
-import threading
-import pickle
 import json
-import time
-import requests
+import gzip
 import sys
 
 from config import config
+from batch_writer import Batch_writer
+from spool import Spool, Spool_replayer
+from backfill import backfill
+from binlog import Binlog_writer, Binlog_reader
+from rotating import Rotating_file
+from local_store import Local_store
+from sinks import open_sinks, Influxdb_sink
+from profiler import profiler
+from metrics_server import Console_printer
 
 
 class Influxdb_logger:
 
-    is_send_to_db = True
-
-    # check if python influx module installed
-    try:
-        from influxdb import InfluxDBClient
-    except ModuleNotFoundError:
-        print('\n==> module influxdb is not found, send to db function is disabled.')
-        time.sleep(2)
-        is_send_to_db = False
-
-    # check if credential exists
-    try:
-        from credential import db_config
-        influxdb_ip = db_config['influxdb_ip']
-        influxdb_port = db_config['influxdb_port']
-        influxdb_username = db_config['influxdb_username']
-        influxdb_password = db_config['influxdb_password']
-        influxdb_dbname = db_config['influxdb_dbname']
-    except (NameError, ImportError, KeyError) as e:
-        print('\n==> credential.py is not found or db_config format incorrect, send to db function is disabled.')
-        time.sleep(2)
-        is_send_to_db = False
-
-    def __init__(self):
+    # False when an event loop drains the writer instead of its own thread
+    writer_thread = True
+    # json log name, {date} is the local date of each write
+    log_name_format = 'log_{date}'
+    # samples of one run share it in the local store
+    run_id = None
+    # {dst: token} of send_line_notify, alerts of a run go to the webhook of alerts.Alert_notifier
+    line_notify_token = {}
+
+    def __init__(self, shared=None, sinks=None):
+        '''
+        shared: another Influxdb_logger whose sinks, db writer and spool are reused
+        sinks: specs of the outputs of this run, see sinks.py, config sinks by default
+        '''
         self.log_folder = Path.cwd().joinpath('logs')
         if not self.log_folder.exists():
             self.log_folder.mkdir()
 
         self.send_fail_file = self.log_folder.joinpath('send_fail')
+        self.spool = None
+        self.spool_replayer = None
 
         self.db_timeout = config['db_connect_timeout']
         self.db_retries = config['db_connect_retries']
         self.number_of_buffer = config['number_of_buffer']
+        self.log_format = config['log_format']
+        self.console = Console_printer(config['console'])
+        self.binlog = None
 
         self.data_pool = []
         self.is_sending = False
+        self.writer = None
+
+        if shared is not None:
+            self.log_writer = shared.log_writer
+            self.store = shared.store
+            self.sinks = shared.sinks
+            self.remote_sinks = shared.remote_sinks
+            self.local_sinks = shared.local_sinks
+            self.is_send_to_db = shared.is_send_to_db
+            self.spool = shared.spool
+            self.writer = shared.writer
+            self.owns_writer = False
+            return
+        self.owns_writer = True
+        self.log_writer = Rotating_file(self.log_folder, self.log_name_format,
+                                        max_bytes=config['log_max_bytes'],
+                                        compress=config['log_compress'],
+                                        retention_days=config['log_retention_days'])
+        self.store = Local_store(self.log_folder.joinpath(config['local_store_file'])) if config['local_store'] else None
+
+        self.sinks = open_sinks(config['sinks'] if sinks is None else sinks, self.log_folder)
+        self.remote_sinks = [sink for sink in self.sinks.values() if sink.remote]
+        self.local_sinks = {spec: sink for spec, sink in self.sinks.items() if not sink.remote}
+        self.is_send_to_db = bool(self.remote_sinks)
 
         if self.is_send_to_db:
-            print(
-                f'\n==> database used in influxdb: {self.influxdb_ip} / {self.influxdb_dbname}\n')
-            time.sleep(2)
+            self.spool = Spool(self.log_folder.joinpath('spool'),
+                               segment_bytes=config['spool_segment_bytes'],
+                               fsync=config['spool_fsync'])
+            if self.send_fail_file.exists():
+                self.spool.import_pickle(self.send_fail_file)
+            self.spool_replayer = Spool_replayer(self.spool, self.write_to_db,
+                                                 chunk_size=config['spool_replay_chunk'],
+                                                 interval=config['spool_replay_interval'])
+            self.writer = Batch_writer(self.send_to_sinks,
+                                       batch_size=config['db_batch_size'],
+                                       flush_interval=config['db_flush_interval'],
+                                       queue_size=config['db_queue_size'],
+                                       overflow_policy=config['db_overflow_policy'],
+                                       start=self.writer_thread)
 
     def send_line_notify(self, dst, msg):
         def lineNotifyMessage(line_token, msg):
+            import requests
             line_headers = {
                 "Authorization": "Bearer " + line_token,
                 "Content-Type": "application/x-www-form-urlencoded"
@@ -62,7 +99,7 @@ class Influxdb_logger:
 
             payload = {'message': msg}
             r = requests.post("https://notify-api.line.me/api/notify",
-                              headers=line_headers, params=payload)
+                              headers=line_headers, params=payload, timeout=config['alert_timeout_secs'])
             return r.status_code
 
         if not self.line_notify_token:
@@ -79,62 +116,64 @@ class Influxdb_logger:
                 f'==> func: {sys._getframe().f_code.co_name} error: {e.__class__} {e}')
 
     def write_to_file(self):
-        with open(self.log_file, 'a') as f:
-            for each in self.data_pool:
-                f.write(f'{json.dumps(each)}\n')
-        print(f'==> records saved to log file: {self.log_file}. ')
-
-    def send_to_influx(self, influx_format_list):
-        try:
-            db_cli = self.InfluxDBClient(
-                self.influxdb_ip,
-                self.influxdb_port,
-                self.influxdb_username,
-                self.influxdb_password,
-                self.influxdb_dbname,
-                timeout=self.db_timeout,
-                retries=self.db_retries)
-        except Exception as e:
-            print(f'==> can not establish connection to DB.')
-            print(f'==> error: {e.__class__} {e}')
+        with profiler.stage('write_to_file'):
+            self.write_log_files()
+
+    def write_log_files(self):
+        if self.log_format in ('json', 'both'):
+            self.log_writer.write(''.join(f'{json.dumps(each)}\n' for each in self.data_pool))
+            self.console.status(f'==> records saved to log file: {self.log_writer.path}. ')
+
+        if self.log_format in ('binary', 'both'):
+            prefix = self.log_writer.name_for()
+            if self.binlog is not None and self.binlog.prefix != prefix:
+                # new day, new segments
+                self.binlog.close()
+                self.binlog = None
+            if self.binlog is None:
+                self.binlog = Binlog_writer(self.log_folder, prefix)
+            self.binlog.write(self.data_pool)
+
+    def write_to_store(self):
+        if self.store is None:
             return
+        with profiler.stage('store_write'):
+            self.store.write(self.data_pool, self.run_id)
 
-        # add up those unsend_data if exists
-        if self.send_fail_file.exists():
-            with open(self.send_fail_file, 'rb') as f:
-                unsend_data = pickle.load(f)
-            influx_format_list += unsend_data
+    def write_to_sinks(self):
+        for spec, sink in self.local_sinks.items():
+            try:
+                with profiler.stage('sink_write'):
+                    sink.write(self.data_pool)
+            except Exception as e:
+                print(f'==> sink {spec} error: {e.__class__} {e}')
 
-            self.send_fail_file.unlink()
+    def write_to_db(self, influx_format_list):
+        # a batch failed on one remote sink is replayed to all, a point written twice overwrites itself
+        for sink in self.remote_sinks:
+            sink.write(influx_format_list)
 
+    def send_to_sinks(self, influx_format_list):
         try:
-            print('==> trying to send to db ...')
+            self.console.status('==> trying to send to db ...')
             self.is_sending = True
-            db_cli.write_points(influx_format_list)
-            print(f'==> {len(influx_format_list)} records sent.')
+            with profiler.stage('db_write'):
+                self.write_to_db(influx_format_list)
+            self.console.status(f'==> {len(influx_format_list)} records sent.')
             self.is_sending = False
 
         except Exception as e:
-            print('==> send failed. put data to send_fail.')
+            print('==> send failed. put data to spool.')
             print(f'==> error: {e.__class__} {e}')
-
-            # check if there is new unsend data generate by other thread
-            if self.send_fail_file.exists():
-                print('==> found previous unsent data.')
-                with open(self.send_fail_file, 'rb') as f:
-                    prev_data = pickle.load(f)
-                influx_format_list += prev_data
-
-            with open(self.send_fail_file, 'wb') as f:
-                pickle.dump(influx_format_list, f)
+            self.spool.append(influx_format_list)
             self.is_sending = False
 
     def data_landing(self):
         self.write_to_file()
+        self.write_to_store()
+        self.write_to_sinks()
         if self.is_send_to_db == True:
-            thread_1 = threading.Thread(
-                target=self.send_to_influx, args=(self.data_pool,))
-            thread_1.start()
+            self.writer.put_many(self.data_pool)
 
     def logging_with_buffer(self, data):
         self.data_pool.append(data)
@@ -145,11 +184,44 @@ class Influxdb_logger:
     def clean_buffer_and_send(self):
         if self.data_pool:
             self.data_landing()
+            self.data_pool = []
+
+    def close_writer(self):
+        if self.writer is None or not self.owns_writer:
+            return
+        if self.writer.pending or self.writer.is_flushing:
+            print(f'==> waiting for db writer to flush {self.writer.pending} records ...')
+        self.writer.close(timeout=self.db_retries * self.db_timeout * 2)
+        if self.writer.dropped:
+            print(f'==> {self.writer.dropped} records dropped while db was slow.')
+        self.spool_replayer.close()
+        self.spool.close()
+        for sink in self.remote_sinks:
+            sink.close()
+
+    def close_files(self):
+        if self.binlog is not None:
+            self.binlog.close()
+            self.binlog = None
+        if self.owns_writer:
+            self.log_writer.close()
+            if self.store is not None:
+                self.store.close()
+            for sink in self.local_sinks.values():
+                sink.close()
 
     def parse_single_file(self, file):
         print(f'==> parsing file: {file}')
+        if file.suffix == '.wtb':
+            reader = Binlog_reader(file)
+            data_list = list(reader)
+            reader.close()
+            print('==> done.\n')
+            return data_list
+
+        opener = gzip.open if file.suffix == '.gz' else open
         try:
-            with open(file, 'r') as f:
+            with opener(file, 'rt') as f:
                 string_data_list = f.readlines()
         except UnicodeDecodeError as e:
             print(f'==> \tskipping file {file}:')
@@ -167,12 +239,13 @@ class Influxdb_logger:
         print('==> done.\n')
         return data_list
 
+    def backfill(self, f_object, **kwargs):
+        influxdb = next((sink for sink in self.remote_sinks if isinstance(sink, Influxdb_sink)), None)
+        if influxdb is None:
+            print('==> influxdb sink is disabled, nothing to backfill.')
+            return
+        return backfill(f_object, influxdb.db_params, self.log_folder.joinpath('backfill'), **kwargs)
+
     def parse_and_send(self, f_object):
-        data_to_send = []
-        if f_object.is_dir():
-            for each_file in [file for file in f_object.iterdir() if file.name[:3] == 'log']:
-                data_to_send += self.parse_single_file(each_file)
-        else:
-            data_to_send += self.parse_single_file(f_object)
-
-        self.send_to_influx(data_to_send)
+        # stream in chunks instead of one request holding every file
+        return self.backfill(f_object)
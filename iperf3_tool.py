@@ -6,12 +6,103 @@ from time import sleep
 from copy import copy
 import argparse
 import re
+import json
+import shlex
+import subprocess
+from time import monotonic
 import pexpect
 
+from profiler import profiler
+
+
+json_stream_min_version = (3, 17)
+
+# '[  5]   0.00-1.00   sec  71.2 MBytes   570 Mbits/sec', --bidir adds the role: '[  5][TX-C]',
+# parallel streams add a '[SUM]' line per interval
+text_line_pattern = re.compile(r'^\[\s*(\w+)\](?:\[(TX|RX)-C\])?.* ([0-9.]+) Mbits/sec')
+json_decoder = json.JSONDecoder()
+
+
+def iperf3_version():
+    try:
+        output = subprocess.check_output(['iperf3', '--version'], stderr=subprocess.STDOUT,
+                                         timeout=3).decode('utf8')
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r'iperf (\d+)\.(\d+)', output)
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def _mbps(bits_per_second):
+    return round(bits_per_second / 1e6, 2) if bits_per_second is not None else None
+
+
+def parse_interval(data, sum_key='sum', sender=None):
+    '''
+    one --json-stream interval event to a flat record, per-stream data under 'streams';
+    a --bidir interval holds both directions: sum / sum_bidir_reverse, streams by their sender flag
+    '''
+    total = data.get(sum_key, {})
+    record = {
+        'throughput': _mbps(total.get('bits_per_second')),
+        'bytes': total.get('bytes'),
+        'retransmits': total.get('retransmits'),
+        'jitter_ms': total.get('jitter_ms'),
+        'lost_packets': total.get('lost_packets'),
+        'lost_percent': total.get('lost_percent'),
+        'omitted': total.get('omitted', False),
+        'streams': [],
+    }
+    for stream in data.get('streams', []):
+        if sender is not None and stream.get('sender') != sender:
+            continue
+        record['streams'].append({
+            'throughput': _mbps(stream.get('bits_per_second')),
+            'retransmits': stream.get('retransmits'),
+            'snd_cwnd': stream.get('snd_cwnd'),
+            # iperf3 reports rtt in usec
+            'rtt_ms': stream['rtt'] / 1000 if stream.get('rtt') is not None else None,
+            'rttvar_ms': stream['rttvar'] / 1000 if stream.get('rttvar') is not None else None,
+        })
+    return record
+
+
+def flatten_interval(record, prefix='iperf'):
+    '''
+    interval record to flat numeric fields for a sample record, missing metrics are left out
+    '''
+    fields = {}
+    for key in ('retransmits', 'jitter_ms', 'lost_packets', 'lost_percent'):
+        if record.get(key) is not None:
+            fields[f'{prefix}_{key}'] = record[key]
+
+    streams = record.get('streams', [])
+    rtts = [stream['rtt_ms'] for stream in streams if stream['rtt_ms'] is not None]
+    if rtts:
+        fields[f'{prefix}_rtt_ms'] = round(sum(rtts) / len(rtts), 3)
+    cwnds = [stream['snd_cwnd'] for stream in streams if stream['snd_cwnd'] is not None]
+    if cwnds:
+        fields[f'{prefix}_snd_cwnd'] = sum(cwnds)
+
+    if len(streams) > 1:
+        for i, stream in enumerate(streams):
+            for key, value in stream.items():
+                if value is not None:
+                    fields[f'{prefix}_s{i}_{key}'] = value
+    return fields
+
 
 class Iperf3_runner:
 
-    def __init__(self, host, port, tos, bitrate, reverse, udp, exec_secs, buffer_length, queue):
+    def __init__(self, host, port, tos, bitrate, reverse, udp, exec_secs, buffer_length, queue, interval=1,
+                 output_mode='text', detail_queue=None, parallel=1, bidir=False,
+                 reverse_queue=None, reverse_detail_queue=None):
+        '''
+        output_mode: text scrapes the human readable output, json reads --json-stream (iperf3 >= 3.17),
+        auto picks json when the installed iperf3 supports it
+        parallel: streams of each direction, their sum goes to queue
+        bidir: both directions at once (iperf3 >= 3.7), queue gets the uplink and reverse_queue the downlink
+        '''
         super().__init__()
         self.host = host
         self.tos = tos
@@ -21,36 +112,126 @@ class Iperf3_runner:
         self.udp = udp
         self.exec_secs = exec_secs
         self.buffer_length = buffer_length
+        self.interval = interval
+        self.output_mode = output_mode
+        self.parallel = parallel
+        self.bidir = bidir
         self.q = queue
+        self.detail_q = detail_queue
+        self.reverse_q = reverse_queue
+        self.reverse_detail_q = reverse_detail_queue
+        self.end_summary = None
 
-    def run(self):
+    def build_cmd(self):
         reverse_string = ' -R' if self.reverse else ''
         udp_string = ' -u' if self.udp else ''
         buffer_length_string = f' -l {self.buffer_length}' if self.buffer_length else ''
+        parallel_string = f' -P {self.parallel}' if self.parallel > 1 else ''
+        if self.bidir:
+            reverse_string = ' --bidir'
 
-        cmd = f'iperf3 -c {self.host} -p {self.port} -S {self.tos} -b {self.bitrate} -t {self.exec_secs}{buffer_length_string}{reverse_string}{udp_string} -f m --forceflush'
-        print(f'==> iperf cmd send: \n\t{cmd}\n')
-        child = pexpect.spawnu(cmd, timeout=10)
+        return f'iperf3 -c {self.host} -p {self.port} -S {self.tos} -b {self.bitrate} -t {self.exec_secs} -i {self.interval}{buffer_length_string}{parallel_string}{reverse_string}{udp_string} -f m --forceflush'
 
-        mbps_pattern = re.compile(' ([0-9.]*) Mbits\/sec')
+    def resolve_output_mode(self):
+        if self.output_mode == 'auto':
+            version = iperf3_version()
+            return 'json' if version and version >= json_stream_min_version else 'text'
+        return self.output_mode
+
+    def run(self):
+        if self.resolve_output_mode() == 'json':
+            self.run_json()
+        else:
+            self.run_text()
+
+    def handle_line(self, line):
+        match = text_line_pattern.search(line)
+        # the averages of the whole test at the end are not an interval
+        if not match or line.rstrip().endswith(('sender', 'receiver')):
+            return
+        stream_id, role, mbps = match.groups()
+        # one stream reports itself, several report a sum too
+        if (stream_id == 'SUM') != (self.parallel > 1):
+            return
+        mbps = float(mbps)
+        if mbps == 0.0:
+            return
+        queue = self.reverse_q if role == 'RX' else self.q
+        queue.put((monotonic(), mbps))
+
+    def run_text(self):
+        cmd = self.build_cmd()
+        print(f'==> iperf cmd send: \n\t{cmd}\n')
+        with profiler.stage('iperf_spawn'):
+            child = pexpect.spawnu(cmd, timeout=10)
 
         while True:
             try:
                 child.expect('\n')
-                line = child.before
-
-                mbps = float(mbps_pattern.search(line).group(1))
-                if mbps == 0.0:
-                    continue
-                self.q.put(mbps)
+                self.handle_line(child.before)
 
             except pexpect.exceptions.EOF:
                 break
-            except AttributeError:
-                pass
             except Exception as e:
                 print(f'==> error: {e.__class__} {e}')
 
+    def handle_event(self, event):
+        name = event.get('event')
+        data = event.get('data', {})
+
+        if name == 'interval':
+            ts = monotonic()
+            if not self.bidir:
+                self.put_interval(ts, parse_interval(data), self.q, self.detail_q)
+                return
+            self.put_interval(ts, parse_interval(data, 'sum', sender=True), self.q, self.detail_q)
+            self.put_interval(ts, parse_interval(data, 'sum_bidir_reverse', sender=False),
+                              self.reverse_q, self.reverse_detail_q)
+        elif name == 'end':
+            self.end_summary = data
+        elif name == 'error':
+            print(f'==> iperf error: {data}')
+
+    def put_interval(self, ts, record, queue, detail_queue):
+        if record['omitted'] or record['throughput'] is None:
+            return
+        # zero intervals are kept, a stall is a result too
+        queue.put((ts, record['throughput']))
+        if detail_queue is not None:
+            detail_queue.put((ts, record))
+
+    def feed_json(self, buffer):
+        '''
+        decode the complete events in buffer, return the incomplete rest
+        '''
+        while True:
+            buffer = buffer.lstrip()
+            if not buffer:
+                return buffer
+            try:
+                event, end = json_decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if not buffer.startswith('{'):
+                    # not json, e.g. an error message of an old iperf3
+                    line, _, buffer = buffer.partition('\n')
+                    print(f'==> iperf: {line}')
+                    continue
+                return buffer
+            buffer = buffer[end:]
+            self.handle_event(event)
+
+    def run_json(self):
+        cmd = f'{self.build_cmd()} --json-stream'
+        print(f'==> iperf cmd send: \n\t{cmd}\n')
+        with profiler.stage('iperf_spawn'):
+            child = subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+        buffer = ''
+        # an event may be split over reads
+        for chunk in iter(lambda: child.stdout.read1(65536), b''):
+            buffer = self.feed_json(buffer + chunk.decode('utf8', errors='replace'))
+        child.wait()
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -64,9 +245,17 @@ if __name__ == '__main__':
                         type=str, help='the limit of bitrate(M/K)')
     parser.add_argument('-t', '--exec_secs', default=0, type=int,
                         help='time duration (secs)')
+    parser.add_argument('-i', '--interval', default=1, type=float,
+                        help='seconds between periodic throughput reports')
     parser.add_argument('-l', '--buffer_length', default=128, type=int,
                         help='length of buffer to read or write (default 128 KB for TCP, 8KB for UDP)')
 
+    parser.add_argument('-o', '--output_mode', default='text', choices=['text', 'json', 'auto'],
+                        help='read iperf3 text output or its --json-stream')
+    parser.add_argument('-P', '--parallel', default=1, type=int,
+                        help='number of parallel streams')
+    parser.add_argument('--bidir', action="store_true",
+                        help='uplink and downlink at once')
     parser.add_argument('-u', '--udp', action="store_true",
                         help='use udp instead of tcp.')
     parser.add_argument('-R', '--reverse', action="store_true",
@@ -74,7 +263,9 @@ if __name__ == '__main__':
     args = parser.parse_args()
 
     logger = Iperf3_runner(host=args.host, port=args.port, tos=args.tos,
-                           bitrate=args.bitrate, reverse=args.reverse, udp=args.udp, exec_secs=args.exec_secs, buffer_length=args.buffer_length)
+                           bitrate=args.bitrate, reverse=args.reverse, udp=args.udp, exec_secs=args.exec_secs, buffer_length=args.buffer_length,
+                           interval=args.interval, output_mode=args.output_mode,
+                           parallel=args.parallel, bidir=args.bidir)
 
     try:
         logger.run()
@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+'''
+single pass parsers of `iw <dev> info`, `iw <dev> link`, `iw <dev> station dump` and `iw <dev> scan` output:
+one precompiled pattern picks the known lines in a single scan, each is dispatched on its key
+through a table of handlers
+
+rate lines of each generation, see bench/fixtures/iw:
+    wifi 5   rx bitrate: 866.7 MBit/s VHT-MCS 9 80MHz short GI VHT-NSS 2
+    wifi 6   rx bitrate: 1200.9 MBit/s 80MHz HE-MCS 11 HE-NSS 2 HE-GI 0 HE-DCM 0
+    2.4 GHz  rx bitrate: 144.4 MBit/s MCS 15 short GI
+'''
+
+import re
+import sys
+import argparse
+
+# every field parse_station() returns, None when missing
+station_keys = ('bssid', 'signal', 'signal_avg', 'beacon_signal',
+                'rx_bitrate', 'rx_mcs', 'rx_nss', 'rx_he_gi', 'rx_he_dcm',
+                'tx_bitrate', 'tx_mcs', 'tx_nss', 'tx_he_gi', 'tx_he_dcm',
+                'rx_bytes', 'tx_bytes', 'rx_packets', 'tx_packets', 'tx_retries', 'tx_failed',
+                'expected_throughput')
+
+info_keys = ('ssid', 'channel', 'freq', 'bandwidth', 'center_freq')
+
+scan_keys = ('bssid', 'ssid', 'freq', 'signal', 'last_seen_ms')
+
+# token before a value in a rate line -> field suffix
+rate_tokens = {
+    'MCS': 'mcs',
+    'VHT-MCS': 'mcs',
+    'HE-MCS': 'mcs',
+    'EHT-MCS': 'mcs',
+    'VHT-NSS': 'nss',
+    'HE-NSS': 'nss',
+    'EHT-NSS': 'nss',
+    'HE-GI': 'he_gi',
+    'HE-DCM': 'he_dcm',
+}
+
+
+def _int(value):
+    return int(value.split(None, 1)[0])
+
+
+def _dbm(value):
+    # '-52 [-55, -54] dBm', the per chain values are dropped
+    return int(value.split(None, 1)[0])
+
+
+def _mbps(value):
+    # '390.625Mbps'
+    return float(value.rstrip('Mbps'))
+
+
+def _set(field, cast):
+    def handle(value, result):
+        result[field] = cast(value)
+    return handle
+
+
+def _rate(direction):
+    bitrate_key = f'{direction}_bitrate'
+    keys = {token: f'{direction}_{suffix}' for token, suffix in rate_tokens.items()}
+
+    def handle(value, result):
+        tokens = value.split()
+        result[bitrate_key] = float(tokens[0])
+        for i in range(1, len(tokens) - 1):
+            key = keys.get(tokens[i])
+            if key is not None:
+                result[key] = int(tokens[i + 1])
+    return handle
+
+
+def _bytes_packets(direction):
+    bytes_key = f'{direction}_bytes'
+    packets_key = f'{direction}_packets'
+
+    # link output: 'RX: 1482393321 bytes (1098231 packets)'
+    def handle(value, result):
+        tokens = value.split()
+        result[bytes_key] = int(tokens[0])
+        result[packets_key] = int(tokens[2].lstrip('('))
+    return handle
+
+
+station_handlers = {
+    'signal': _set('signal', _dbm),
+    'signal avg': _set('signal_avg', _dbm),
+    'beacon signal avg': _set('beacon_signal', _dbm),
+    'rx bitrate': _rate('rx'),
+    'tx bitrate': _rate('tx'),
+    'rx bytes': _set('rx_bytes', _int),
+    'tx bytes': _set('tx_bytes', _int),
+    'rx packets': _set('rx_packets', _int),
+    'tx packets': _set('tx_packets', _int),
+    'tx retries': _set('tx_retries', _int),
+    'tx failed': _set('tx_failed', _int),
+    'expected throughput': _set('expected_throughput', _mbps),
+    'RX': _bytes_packets('rx'),
+    'TX': _bytes_packets('tx'),
+}
+
+
+# one C level scan of the text: station headers and the lines of station_handlers, other lines are skipped
+station_line_pattern = re.compile(
+    r'^(?:(?:Connected to|Station) ([0-9a-fA-F:]{17}).*'
+    r'|\t(' + '|'.join(re.escape(key) for key in sorted(station_handlers, key=len, reverse=True)) + r'):\s*(.*))$',
+    re.MULTILINE)
+
+
+def parse_station(text):
+    '''
+    `iw <dev> link` or `iw <dev> station dump` output to {station_keys: value},
+    only the first station of a dump is read: the AP in managed mode
+    '''
+    result = dict.fromkeys(station_keys)
+    for bssid, key, value in station_line_pattern.findall(text):
+        if bssid:
+            if result['bssid'] is not None:
+                break
+            result['bssid'] = bssid
+            continue
+        try:
+            station_handlers[key](value, result)
+        except (ValueError, IndexError):
+            # a field in a format not seen yet stays missing
+            pass
+    return result
+
+
+def _channel(value, result):
+    # '36 (5180 MHz), width: 80 MHz, center1: 5210 MHz'
+    parts = value.split(', ')
+    result['channel'] = parts[0]
+    result['freq'] = int(parts[0].split('(', 1)[1].split()[0])
+    for part in parts[1:]:
+        name, _, number = part.partition(': ')
+        if name == 'width':
+            result['bandwidth'] = int(number.split()[0])
+        elif name == 'center1':
+            result['center_freq'] = int(number.split()[0])
+
+
+info_line_pattern = re.compile(r'^\t(ssid|channel) (.*)$', re.MULTILINE)
+
+
+def parse_iw_info(text):
+    '''
+    `iw <dev> info` output to {info_keys: value}, {} when not connected
+    '''
+    result = dict.fromkeys(info_keys)
+    for key, value in info_line_pattern.findall(text):
+        if key == 'ssid':
+            result['ssid'] = value
+            continue
+        try:
+            _channel(value, result)
+        except (ValueError, IndexError):
+            pass
+    return result if result['ssid'] is not None else {}
+
+
+def _freq(value):
+    # '5180' or '5180.0' of newer iw
+    return int(float(value.split(None, 1)[0]))
+
+
+def _signal(value):
+    # '-67.00 dBm'
+    return float(value.split(None, 1)[0])
+
+
+scan_handlers = {
+    'freq': _set('freq', _freq),
+    'signal': _set('signal', _signal),
+    'SSID': _set('ssid', str),
+    # '120 ms ago'
+    'last seen': _set('last_seen_ms', _int),
+}
+
+scan_line_pattern = re.compile(r'^(?:BSS ([0-9a-fA-F:]{17}).*|\t(freq|signal|SSID|last seen): (.*))$', re.MULTILINE)
+
+
+def parse_scan(text):
+    '''
+    `iw <dev> scan` or `scan dump` output to a list of {scan_keys: value}, one per BSS
+    '''
+    bsses = []
+    result = None
+    for bssid, key, value in scan_line_pattern.findall(text):
+        if bssid:
+            result = dict.fromkeys(scan_keys)
+            result['bssid'] = bssid.lower()
+            bsses.append(result)
+            continue
+        if result is None:
+            continue
+        try:
+            scan_handlers[key](value, result)
+        except (ValueError, IndexError):
+            pass
+    return bsses
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('kind', choices=['info', 'station', 'scan'],
+                        help='parse `iw <dev> info`, `iw <dev> link / station dump` or `iw <dev> scan` output from stdin')
+    args = parser.parse_args()
+
+    text = sys.stdin.read()
+    parsers = {'info': parse_iw_info, 'station': parse_station, 'scan': parse_scan}
+    print(parsers[args.kind](text))
@@ -0,0 +1,52 @@
+from datetime import datetime, timezone
+
+
+def _escape_key(key):
+    return str(key).replace('\\', '\\\\').replace(',', '\\,').replace('=', '\\=').replace(' ', '\\ ')
+
+
+def _escape_measurement(measurement):
+    return str(measurement).replace('\\', '\\\\').replace(',', '\\,').replace(' ', '\\ ')
+
+
+def _field_value(value):
+    # same typing as influxdb-python make_lines, so series keep their field types
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return f'{value}i'
+    if isinstance(value, float):
+        return repr(value)
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def to_timestamp_ns(record_time):
+    if isinstance(record_time, (int, float)):
+        return int(record_time * 1e9)
+    dt = datetime.fromisoformat(record_time)
+    if dt.tzinfo is None:
+        # records are stamped with utcnow()
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1e6) * 1000
+
+
+def to_line(point):
+    key = _escape_measurement(point['measurement'])
+    for tag, value in sorted((point.get('tags') or {}).items()):
+        if value is not None and value != '':
+            key += f',{_escape_key(tag)}={_escape_key(value)}'
+
+    fields = ','.join(f'{_escape_key(field)}={_field_value(value)}'
+                      for field, value in point['fields'].items() if value is not None)
+
+    line = f'{key} {fields}'
+    if point.get('time') is not None:
+        line += f' {to_timestamp_ns(point["time"])}'
+    return line
+
+
+def to_line_protocol(points):
+    '''
+    influxdb json points to line protocol strings, time precision is ns
+    '''
+    return [to_line(point) for point in points]
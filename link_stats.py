@@ -0,0 +1,469 @@
+#!/usr/bin/python3
+
+import os
+import errno
+import socket
+import struct
+import argparse
+import threading
+from time import time, monotonic
+from subprocess import check_output, STDOUT, CalledProcessError
+
+from profiler import profiler
+from iw_parser import parse_iw_info, parse_station
+
+
+class Station_info:
+    '''
+    one link stats sample of an interface, missing values are None
+    '''
+
+    __slots__ = ('timestamp', 'interface', 'ssid', 'bssid', 'channel', 'freq', 'bandwidth', 'center_freq',
+                 'signal', 'signal_avg', 'beacon_signal', 'rx_bitrate', 'tx_bitrate', 'rx_mcs', 'tx_mcs',
+                 'rx_nss', 'tx_nss', 'rx_he_gi', 'tx_he_gi', 'rx_he_dcm', 'tx_he_dcm',
+                 'rx_bytes', 'tx_bytes', 'rx_packets', 'tx_packets', 'tx_retries', 'tx_failed',
+                 'expected_throughput')
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            setattr(self, name, kwargs.get(name))
+        if self.timestamp is None:
+            self.timestamp = time()
+
+    @property
+    def connected(self):
+        return self.ssid is not None
+
+    @property
+    def nss(self):
+        return self.rx_nss if self.rx_nss is not None else self.tx_nss
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f'Station_info({self.as_dict()})'
+
+
+def freq_to_channel(freq):
+    if freq == 2484:
+        return 14
+    if freq < 2484:
+        return (freq - 2407) // 5
+    if freq >= 5955:
+        return (freq - 5950) // 5
+    return (freq - 5000) // 5
+
+
+def format_channel(freq):
+    # same format as `iw <dev> info` output, e.g. '36 (5180 MHz)'
+    return f'{freq_to_channel(freq)} ({freq} MHz)'
+
+
+# ---------------------------------------------------------------- iw backend
+
+
+class Iw_sampler:
+    '''
+    fallback backend, fork `iw` and parse its text output,
+    `station dump` instead of `link` for the retry / failed / expected throughput counters
+    '''
+
+    name = 'iw'
+
+    def __init__(self, interface):
+        self.interface = interface
+
+    def run_iw(self, sub_cmd, timeout):
+        try:
+            return check_output(['iw', self.interface, *sub_cmd.split()], timeout=timeout,
+                                stderr=STDOUT).decode('utf8').strip()
+        except CalledProcessError as e:
+            return e.output.decode('utf8').strip()
+
+    def sample(self):
+        with profiler.stage('iw_info'):
+            output = self.run_iw('info', timeout=3)
+        with profiler.stage('iw_parse'):
+            info = parse_iw_info(output)
+        if not info:
+            return Station_info(interface=self.interface)
+
+        with profiler.stage('iw_station'):
+            output = self.run_iw('station dump', timeout=5)
+        with profiler.stage('iw_parse'):
+            info.update(parse_station(output))
+        return Station_info(interface=self.interface, **info)
+
+    def association(self):
+        '''
+        (bssid, signal) of the AP, bssid None when not connected: one `iw link`
+        '''
+        station = parse_station(self.run_iw('link', timeout=3))
+        return station['bssid'], station['signal']
+
+    def close(self):
+        pass
+
+
+# ----------------------------------------------------------- nl80211 backend
+
+NETLINK_GENERIC = 16
+
+NLM_F_REQUEST = 0x01
+NLM_F_ACK = 0x04
+NLM_F_DUMP = 0x300
+
+NLMSG_ERROR = 0x2
+NLMSG_DONE = 0x3
+
+NLA_TYPE_MASK = 0x3fff
+
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+
+NL80211_CMD_GET_INTERFACE = 5
+NL80211_CMD_GET_STATION = 17
+
+NL80211_ATTR_IFINDEX = 3
+NL80211_ATTR_MAC = 6
+NL80211_ATTR_STA_INFO = 21
+NL80211_ATTR_WIPHY_FREQ = 38
+NL80211_ATTR_SSID = 52
+NL80211_ATTR_CHANNEL_WIDTH = 159
+NL80211_ATTR_CENTER_FREQ1 = 160
+
+NL80211_STA_INFO_SIGNAL = 7
+NL80211_STA_INFO_TX_BITRATE = 8
+NL80211_STA_INFO_RX_PACKETS = 9
+NL80211_STA_INFO_TX_PACKETS = 10
+NL80211_STA_INFO_TX_RETRIES = 11
+NL80211_STA_INFO_TX_FAILED = 12
+NL80211_STA_INFO_SIGNAL_AVG = 13
+NL80211_STA_INFO_RX_BITRATE = 14
+NL80211_STA_INFO_RX_BYTES64 = 23
+NL80211_STA_INFO_TX_BYTES64 = 24
+NL80211_STA_INFO_EXPECTED_THROUGHPUT = 27
+NL80211_STA_INFO_BEACON_SIGNAL_AVG = 30
+
+NL80211_RATE_INFO_BITRATE = 1
+NL80211_RATE_INFO_MCS = 2
+NL80211_RATE_INFO_BITRATE32 = 5
+NL80211_RATE_INFO_VHT_MCS = 6
+NL80211_RATE_INFO_VHT_NSS = 7
+NL80211_RATE_INFO_HE_MCS = 13
+NL80211_RATE_INFO_HE_NSS = 14
+NL80211_RATE_INFO_HE_GI = 15
+NL80211_RATE_INFO_HE_DCM = 16
+NL80211_RATE_INFO_EHT_MCS = 19
+NL80211_RATE_INFO_EHT_NSS = 20
+
+# enum nl80211_chan_width -> MHz
+channel_width_mhz = {0: 20, 1: 20, 2: 40, 3: 80, 4: 80, 5: 160, 6: 5, 7: 10, 13: 320}
+
+
+def _u8(data):
+    return data[0]
+
+
+def _s8(data):
+    return struct.unpack('=b', data[:1])[0]
+
+
+def _u16(data):
+    return struct.unpack('=H', data[:2])[0]
+
+
+def _u32(data):
+    return struct.unpack('=I', data[:4])[0]
+
+
+def _u64(data):
+    return struct.unpack('=Q', data[:8])[0]
+
+
+def pack_attr(attr_type, data):
+    length = 4 + len(data)
+    return struct.pack('=HH', length, attr_type) + data + b'\0' * ((4 - length % 4) % 4)
+
+
+def parse_attrs(data):
+    '''
+    netlink attributes to {type: payload}, nested attrs are left as raw bytes
+    '''
+    attrs = {}
+    offset = 0
+    while offset + 4 <= len(data):
+        length, attr_type = struct.unpack_from('=HH', data, offset)
+        if length < 4:
+            break
+        attrs[attr_type & NLA_TYPE_MASK] = data[offset + 4:offset + length]
+        offset += (length + 3) & ~3
+    return attrs
+
+
+def parse_nlmsgs(data):
+    '''
+    split one netlink datagram to (msg_type, seq, payload)
+    '''
+    offset = 0
+    while offset + 16 <= len(data):
+        length, msg_type, _, seq, _ = struct.unpack_from('=IHHII', data, offset)
+        if length < 16:
+            break
+        yield msg_type, seq, data[offset + 16:offset + length]
+        offset += (length + 3) & ~3
+
+
+def parse_rate_info(data):
+    '''
+    nested rate info to {bitrate, mcs, nss, he_gi, he_dcm}
+    '''
+    rate = parse_attrs(data)
+    if NL80211_RATE_INFO_BITRATE32 in rate:
+        bitrate = _u32(rate[NL80211_RATE_INFO_BITRATE32]) / 10
+    elif NL80211_RATE_INFO_BITRATE in rate:
+        bitrate = _u16(rate[NL80211_RATE_INFO_BITRATE]) / 10
+    else:
+        bitrate = None
+
+    mcs = nss = None
+    for mcs_type, nss_type in ((NL80211_RATE_INFO_EHT_MCS, NL80211_RATE_INFO_EHT_NSS),
+                               (NL80211_RATE_INFO_HE_MCS, NL80211_RATE_INFO_HE_NSS),
+                               (NL80211_RATE_INFO_VHT_MCS, NL80211_RATE_INFO_VHT_NSS)):
+        if mcs_type in rate:
+            mcs = _u8(rate[mcs_type])
+            nss = _u8(rate[nss_type]) if nss_type in rate else None
+            break
+    else:
+        if NL80211_RATE_INFO_MCS in rate:
+            mcs = _u8(rate[NL80211_RATE_INFO_MCS])
+
+    return {
+        'bitrate': bitrate,
+        'mcs': mcs,
+        'nss': nss,
+        'he_gi': _u8(rate[NL80211_RATE_INFO_HE_GI]) if NL80211_RATE_INFO_HE_GI in rate else None,
+        'he_dcm': _u8(rate[NL80211_RATE_INFO_HE_DCM]) if NL80211_RATE_INFO_HE_DCM in rate else None,
+    }
+
+
+def parse_interface_attrs(attrs):
+    if NL80211_ATTR_SSID not in attrs:
+        return {}
+
+    freq = _u32(attrs[NL80211_ATTR_WIPHY_FREQ]) if NL80211_ATTR_WIPHY_FREQ in attrs else None
+    width = attrs.get(NL80211_ATTR_CHANNEL_WIDTH)
+    center_freq = attrs.get(NL80211_ATTR_CENTER_FREQ1)
+    return {
+        'ssid': attrs[NL80211_ATTR_SSID].decode('utf8', errors='replace'),
+        'channel': format_channel(freq) if freq else None,
+        'freq': freq,
+        'bandwidth': channel_width_mhz.get(_u32(width)) if width else None,
+        'center_freq': _u32(center_freq) if center_freq else None,
+    }
+
+
+# (sta info attr, field, cast), same fields as iw_parser.parse_station
+sta_info_fields = (
+    (NL80211_STA_INFO_SIGNAL, 'signal', _s8),
+    (NL80211_STA_INFO_SIGNAL_AVG, 'signal_avg', _s8),
+    (NL80211_STA_INFO_BEACON_SIGNAL_AVG, 'beacon_signal', _s8),
+    (NL80211_STA_INFO_RX_BYTES64, 'rx_bytes', _u64),
+    (NL80211_STA_INFO_TX_BYTES64, 'tx_bytes', _u64),
+    (NL80211_STA_INFO_RX_PACKETS, 'rx_packets', _u32),
+    (NL80211_STA_INFO_TX_PACKETS, 'tx_packets', _u32),
+    (NL80211_STA_INFO_TX_RETRIES, 'tx_retries', _u32),
+    (NL80211_STA_INFO_TX_FAILED, 'tx_failed', _u32),
+)
+
+
+def parse_station_attrs(attrs):
+    result = {}
+    if NL80211_ATTR_MAC in attrs:
+        result['bssid'] = ':'.join(f'{b:02x}' for b in attrs[NL80211_ATTR_MAC][:6])
+    if NL80211_ATTR_STA_INFO not in attrs:
+        return result
+
+    sta_info = parse_attrs(attrs[NL80211_ATTR_STA_INFO])
+    for attr_type, name, cast in sta_info_fields:
+        if attr_type in sta_info:
+            result[name] = cast(sta_info[attr_type])
+    if NL80211_STA_INFO_EXPECTED_THROUGHPUT in sta_info:
+        # kbps
+        result['expected_throughput'] = _u32(sta_info[NL80211_STA_INFO_EXPECTED_THROUGHPUT]) / 1000
+    for attr_type, direction in ((NL80211_STA_INFO_RX_BITRATE, 'rx'), (NL80211_STA_INFO_TX_BITRATE, 'tx')):
+        if attr_type in sta_info:
+            for key, value in parse_rate_info(sta_info[attr_type]).items():
+                result[f'{direction}_{key}'] = value
+    return result
+
+
+class Nl80211_socket:
+    '''
+    generic netlink socket talking to nl80211, one request at a time: the samplers of several
+    interfaces share it with its seq counter, replies are matched on seq
+    '''
+
+    def __init__(self, sock=None, timeout=3):
+        self.seq = 0
+        # a lost reply fails the request after timeout secs instead of blocking the sampling thread
+        self.timeout = timeout
+        self.lock = threading.Lock()
+
+        if sock is None:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+            sock.bind((0, 0))
+        self.sock = sock
+
+        self.family_id = self.resolve_family('nl80211')
+
+    def request(self, family, cmd, attrs, dump=False):
+        with self.lock:
+            return self.request_locked(family, cmd, attrs, dump)
+
+    def request_locked(self, family, cmd, attrs, dump):
+        self.seq += 1
+        payload = struct.pack('=BBH', cmd, 1, 0) + b''.join(attrs)
+        flags = NLM_F_REQUEST | NLM_F_ACK | (NLM_F_DUMP if dump else 0)
+        self.sock.send(struct.pack('=IHHII', 16 + len(payload), family, flags, self.seq, 0) + payload)
+
+        replies = []
+        deadline = monotonic() + self.timeout
+        while True:
+            # replies of other requests are skipped, within the same deadline
+            left = deadline - monotonic()
+            if left <= 0:
+                raise OSError(errno.ETIMEDOUT, f'no nl80211 reply to request {self.seq} in {self.timeout} secs')
+            self.sock.settimeout(left)
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                raise OSError(errno.ETIMEDOUT, f'no nl80211 reply to request {self.seq} in {self.timeout} secs')
+            for msg_type, seq, msg_payload in parse_nlmsgs(data):
+                if seq != self.seq:
+                    continue
+                if msg_type == NLMSG_DONE:
+                    return replies
+                if msg_type == NLMSG_ERROR:
+                    error = struct.unpack_from('=i', msg_payload)[0]
+                    if error:
+                        raise OSError(-error, os.strerror(-error))
+                    return replies
+                # skip genl header
+                replies.append(parse_attrs(msg_payload[4:]))
+
+    def resolve_family(self, name):
+        replies = self.request(GENL_ID_CTRL, CTRL_CMD_GETFAMILY,
+                               [pack_attr(CTRL_ATTR_FAMILY_NAME, name.encode() + b'\0')])
+        return _u16(replies[0][CTRL_ATTR_FAMILY_ID])
+
+    def close(self):
+        self.sock.close()
+
+
+class Nl80211_sampler:
+    '''
+    read interface and station info straight from nl80211 over a generic netlink socket,
+    its own one unless channel, an Nl80211_socket of the caller, is given
+    '''
+
+    name = 'nl80211'
+
+    def __init__(self, interface, sock=None, timeout=3, channel=None):
+        self.interface = interface
+        self.ifindex = socket.if_nametoindex(interface)
+
+        # only the opener of a socket closes it
+        self.owns_channel = channel is None
+        self.channel = Nl80211_socket(sock, timeout) if channel is None else channel
+        self.family_id = self.channel.family_id
+
+    def request(self, family, cmd, attrs, dump=False):
+        return self.channel.request(family, cmd, attrs, dump)
+
+    def sample(self):
+        ifindex_attr = pack_attr(NL80211_ATTR_IFINDEX, struct.pack('=I', self.ifindex))
+
+        with profiler.stage('nl80211_interface'):
+            interface = self.request(self.family_id, NL80211_CMD_GET_INTERFACE, [ifindex_attr])
+            info = parse_interface_attrs(interface[0]) if interface else {}
+        if not info:
+            return Station_info(interface=self.interface)
+
+        with profiler.stage('nl80211_station'):
+            stations = self.request(self.family_id, NL80211_CMD_GET_STATION, [ifindex_attr], dump=True)
+            if stations:
+                # managed mode has only one station: the connected AP
+                info.update(parse_station_attrs(stations[0]))
+        return Station_info(interface=self.interface, **info)
+
+    def association(self):
+        '''
+        (bssid, signal) of the AP, bssid None when not connected: the station dump only
+        '''
+        ifindex_attr = pack_attr(NL80211_ATTR_IFINDEX, struct.pack('=I', self.ifindex))
+        stations = self.request(self.family_id, NL80211_CMD_GET_STATION, [ifindex_attr], dump=True)
+        if not stations:
+            return None, None
+        station = parse_station_attrs(stations[0])
+        return station.get('bssid'), station.get('signal')
+
+    def close(self):
+        if self.owns_channel:
+            self.channel.close()
+
+
+link_backends = {
+    'nl80211': Nl80211_sampler,
+    'iw': Iw_sampler,
+}
+
+
+def get_nl80211_socket(backend='auto'):
+    '''
+    one Nl80211_socket for the samplers of several interfaces, None for iw or when nl80211 is not available
+    '''
+    if backend == 'iw':
+        return None
+    if backend == 'nl80211':
+        return Nl80211_socket()
+
+    try:
+        return Nl80211_socket()
+    except (OSError, AttributeError, IndexError, KeyError) as e:
+        print(f'==> nl80211 is not available ({e.__class__} {e}), fallback to iw.')
+        return None
+
+
+def get_link_sampler(interface, backend='auto', channel=None):
+    '''
+    pass an Nl80211_socket of get_nl80211_socket to share one netlink socket between interfaces,
+    its opener closes it after the samplers
+    '''
+    if backend == 'iw':
+        return Iw_sampler(interface)
+    if backend == 'nl80211':
+        return Nl80211_sampler(interface, channel=channel)
+
+    try:
+        return Nl80211_sampler(interface, channel=channel)
+    except (OSError, AttributeError, IndexError, KeyError) as e:
+        print(f'==> nl80211 is not available ({e.__class__} {e}), fallback to iw.')
+        return Iw_sampler(interface)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--interface', default='wlo1',
+                        type=str, help='wireless interface')
+    parser.add_argument('-b', '--backend', default='auto', choices=['auto'] + list(link_backends),
+                        help='link stats backend')
+    args = parser.parse_args()
+
+    sampler = get_link_sampler(args.interface, args.backend)
+    print(f'==> backend: {sampler.name}')
+    print(sampler.sample())
+    sampler.close()
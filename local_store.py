@@ -0,0 +1,324 @@
+#!/usr/bin/python3
+'''
+indexed sqlite store of the sample records, written next to the log files so past runs
+can be queried without influxdb or rescanning every log:
+
+    python3 local_store.py query -l office --since 2026-10-01 --band 5 -b 60
+    python3 local_store.py runs -l office
+    python3 local_store.py compare 20261017_101500_wlo1 20261018_093000_wlo1
+    python3 local_store.py import logs
+'''
+
+import re
+import json
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from config import config
+from binlog import to_epoch
+from stats import _percentile
+
+# fields with their own column, every other field goes to the json of extra
+columns = {
+    'signal': 'REAL',
+    'rx_bitrate': 'REAL',
+    'tx_bitrate': 'REAL',
+    'rx_mcs': 'INTEGER',
+    'tx_mcs': 'INTEGER',
+    'nss': 'INTEGER',
+    'latency': 'REAL',
+    'throughput': 'REAL',
+}
+
+# record fields kept as keys of a sample row
+key_fields = ('location', 'ssid', 'interface')
+
+schema = f'''
+CREATE TABLE IF NOT EXISTS samples (
+    time REAL NOT NULL,
+    run_id TEXT,
+    measurement TEXT,
+    location TEXT,
+    ssid TEXT,
+    interface TEXT,
+    channel INTEGER,
+    band TEXT,
+    {", ".join(f"{name} {kind}" for name, kind in columns.items())},
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS samples_time ON samples (time);
+CREATE INDEX IF NOT EXISTS samples_location ON samples (location, time);
+CREATE INDEX IF NOT EXISTS samples_ssid ON samples (ssid, time);
+CREATE INDEX IF NOT EXISTS samples_channel ON samples (channel, time);
+CREATE INDEX IF NOT EXISTS samples_band ON samples (band, time);
+CREATE INDEX IF NOT EXISTS samples_run ON samples (run_id, time);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    start REAL,
+    location TEXT,
+    interface TEXT,
+    summary TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_start ON runs (start);
+CREATE TABLE IF NOT EXISTS imported_files (
+    name TEXT PRIMARY KEY,
+    offset INTEGER
+);
+'''
+
+# '36 (5180 MHz)'
+channel_pattern = re.compile(r'(\d+) \((\d+) MHz\)')
+
+
+def band_of(freq):
+    if freq < 3000:
+        return '2.4'
+    return '5' if freq < 5925 else '6'
+
+
+def parse_channel(channel):
+    '''
+    channel field of a record -> (channel number, band)
+    '''
+    match = channel_pattern.match(channel) if isinstance(channel, str) else None
+    if match is None:
+        return None, None
+    return int(match.group(1)), band_of(int(match.group(2)))
+
+
+def to_row(record, run_id):
+    fields = dict(record['fields'])
+    channel, band = parse_channel(fields.pop('channel', None))
+    keys = [fields.pop(name, None) for name in key_fields]
+    values = [fields.pop(name, None) for name in columns]
+    extra = {name: value for name, value in fields.items() if value is not None}
+    return (to_epoch(record['time']), run_id, record['measurement'], *keys, channel, band, *values,
+            json.dumps(extra) if extra else None)
+
+
+def parse_time(text):
+    # local date or date time of the command line -> epoch secs
+    return datetime.fromisoformat(text).timestamp()
+
+
+def format_time(epoch):
+    return datetime.fromtimestamp(epoch).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class Local_store:
+    '''
+    one sqlite file shared by the loggers of a run, a write is one transaction of a landed buffer
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        # written from the sampling thread, or a worker thread of the asyncio runtime
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(schema)
+        self.insert_sql = (f'INSERT INTO samples VALUES ('
+                           f'{", ".join("?" * (len(key_fields) + len(columns) + 6))})')
+
+    def write(self, records, run_id=None):
+        rows = [to_row(record, run_id) for record in records]
+        if not rows:
+            return
+        with self.lock, self.conn:
+            if run_id is not None:
+                self.conn.execute('INSERT OR IGNORE INTO runs (run_id, start, location, interface) VALUES (?, ?, ?, ?)',
+                                  (run_id, rows[0][0], rows[0][3], rows[0][5]))
+            self.conn.executemany(self.insert_sql, rows)
+
+    def end_run(self, run_id, summary):
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE runs SET summary = ? WHERE run_id = ?', (json.dumps(summary), run_id))
+
+    def import_file(self, file):
+        '''
+        json-lines or binary log -> samples, resumed from the offset reached by an earlier import
+        '''
+        from backfill import iter_records
+
+        file = Path(file)
+        row = self.conn.execute('SELECT offset FROM imported_files WHERE name = ?', (file.name,)).fetchone()
+        offset = row[0] if row else 0
+
+        imported = 0
+        chunk = []
+        for offset, record in iter_records(file, offset):
+            chunk.append(record)
+            if len(chunk) >= config['backfill_chunk_size']:
+                imported += self.import_chunk(file, chunk, offset)
+                chunk = []
+        imported += self.import_chunk(file, chunk, offset)
+        return imported
+
+    def import_chunk(self, file, records, offset):
+        rows = [to_row(record, None) for record in records if 'fields' in record]
+        with self.lock, self.conn:
+            self.conn.executemany(self.insert_sql, rows)
+            self.conn.execute('INSERT OR REPLACE INTO imported_files VALUES (?, ?)', (file.name, offset))
+        return len(rows)
+
+    @staticmethod
+    def where(location=None, ssid=None, channel=None, band=None, run_id=None, since=None, until=None):
+        conditions, params = ['measurement = ?'], ['wifi_test']
+        for name, value in (('location', location), ('ssid', ssid), ('channel', channel),
+                            ('band', band), ('run_id', run_id)):
+            if value is not None:
+                conditions.append(f'{name} = ?')
+                params.append(value)
+        if since is not None:
+            conditions.append('time >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append('time < ?')
+            params.append(until)
+        return ' AND '.join(conditions), params
+
+    def query(self, fields=('signal', 'latency', 'throughput'), bucket=None, limit=None, **filters):
+        '''
+        samples matching filters, or avg / min / max of fields per bucket secs
+        '''
+        unknown = [name for name in fields if name not in columns]
+        if unknown:
+            raise ValueError(f'not a column: {", ".join(unknown)}, choose from {", ".join(columns)}')
+
+        where, params = self.where(**filters)
+        if bucket:
+            selected = ', '.join(f'avg({name}), min({name}), max({name})' for name in fields)
+            sql = (f'SELECT CAST(time / ? AS INTEGER) * ? AS bucket, count(*), {selected} FROM samples '
+                   f'WHERE {where} GROUP BY bucket ORDER BY bucket')
+            params = [bucket, bucket] + params
+            names = ['time', 'samples'] + [f'{name}_{stat}' for name in fields for stat in ('avg', 'min', 'max')]
+        else:
+            sql = f'SELECT time, location, ssid, channel, band, {", ".join(fields)} FROM samples WHERE {where} ORDER BY time'
+            names = ['time', 'location', 'ssid', 'channel', 'band'] + list(fields)
+        if limit:
+            sql += f' LIMIT {int(limit)}'
+
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [dict(zip(names, row)) for row in rows]
+
+    def runs(self, location=None, since=None, until=None):
+        conditions, params = ['1'], []
+        if location is not None:
+            conditions.append('location = ?')
+            params.append(location)
+        if since is not None:
+            conditions.append('start >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append('start < ?')
+            params.append(until)
+        with self.lock:
+            rows = self.conn.execute(f'SELECT run_id, start, location, interface, summary FROM runs '
+                                     f'WHERE {" AND ".join(conditions)} ORDER BY start', params).fetchall()
+        return [{'run_id': run_id, 'start': start, 'location': location, 'interface': interface,
+                 **(json.loads(summary) if summary else {})}
+                for run_id, start, location, interface, summary in rows]
+
+    def compare(self, run_ids, fields=('signal', 'latency', 'throughput')):
+        '''
+        {run_id: {field_stat: value}} of avg / p50 / p95 of fields, read through the run index
+        '''
+        result = {}
+        for run_id in run_ids:
+            rows = self.query(fields=fields, run_id=run_id)
+            stats = {'samples': len(rows)}
+            for name in fields:
+                values = sorted(row[name] for row in rows if row[name] is not None)
+                stats[f'{name}_avg'] = round(sum(values) / len(values), 3) if values else None
+                for p in (50, 95):
+                    value = _percentile(values, p)
+                    stats[f'{name}_p{p}'] = round(value, 3) if value is not None else None
+            result[run_id] = stats
+        return result
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def print_table(rows):
+    if not rows:
+        print('==> nothing found.')
+        return
+    names = list(rows[0])
+    lines = [names] + [[format_time(row[name]) if name in ('time', 'start') and row[name] is not None
+                        else '' if row[name] is None
+                        else f'{row[name]:.3f}' if isinstance(row[name], float) else str(row[name])
+                        for name in names] for row in rows]
+    widths = [max(len(line[i]) for line in lines) for i in range(len(names))]
+    for line in lines:
+        print('  '.join(value.rjust(width) for value, width in zip(line, widths)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('action', choices=['query', 'runs', 'compare', 'import'],
+                        help='query samples, list runs, compare runs or import log files')
+    parser.add_argument('targets', nargs='*',
+                        help='run ids of compare, log files or folders of import')
+    parser.add_argument('-d', '--db', metavar='', default=str(Path.cwd().joinpath('logs', config['local_store_file'])),
+                        type=str, help='sqlite file of the store')
+    parser.add_argument('-l', '--location', metavar='', default=None, type=str,
+                        help='only this location')
+    parser.add_argument('--ssid', metavar='', default=None, type=str,
+                        help='only this ssid')
+    parser.add_argument('-c', '--channel', metavar='', default=None, type=int,
+                        help='only this channel')
+    parser.add_argument('--band', metavar='', default=None, choices=['2.4', '5', '6'],
+                        help='only this band: 2.4, 5 or 6 (GHz)')
+    parser.add_argument('--run', metavar='', default=None, type=str,
+                        help='only this run id')
+    parser.add_argument('--since', metavar='', default=None, type=parse_time,
+                        help='from this local date or date time, e.g. 2026-10-01 or 2026-10-01T08:00')
+    parser.add_argument('--until', metavar='', default=None, type=parse_time,
+                        help='before this local date or date time')
+    parser.add_argument('-f', '--fields', metavar='', default='signal,latency,throughput', type=str,
+                        help=f'comma separated fields of: {", ".join(columns)}')
+    parser.add_argument('-b', '--bucket', metavar='', default=None, type=float,
+                        help='downsample to avg / min / max per bucket of this many secs')
+    parser.add_argument('-n', '--limit', metavar='', default=None, type=int,
+                        help='at most this many rows')
+    parser.add_argument('--json', action='store_true',
+                        help='print json lines instead of a table')
+    # run ids or paths may follow the options
+    args = parser.parse_intermixed_args()
+
+    store = Local_store(args.db)
+    fields = tuple(args.fields.split(','))
+
+    if args.action == 'import':
+        from backfill import log_files
+        for target in args.targets or [str(Path.cwd().joinpath('logs'))]:
+            for file in log_files(target):
+                print(f'==> importing {file}: {store.import_file(file)} records.')
+        rows = []
+    elif args.action == 'runs':
+        rows = store.runs(location=args.location, since=args.since, until=args.until)
+        if not args.json:
+            rows = [{key: row.get(key) for key in ('run_id', 'start', 'location', 'interface', 'ssid',
+                                                     'samples', 'avg_signal', 'avg_latency', 'avg_throughput')}
+                    for row in rows]
+    elif args.action == 'compare':
+        rows = [{'run_id': run_id, **stats} for run_id, stats in store.compare(args.targets, fields).items()]
+    else:
+        rows = store.query(fields=fields, bucket=args.bucket, limit=args.limit, location=args.location,
+                           ssid=args.ssid, channel=args.channel, band=args.band, run_id=args.run,
+                           since=args.since, until=args.until)
+
+    if args.action != 'import':
+        if args.json:
+            for row in rows:
+                print(json.dumps(row))
+        else:
+            print_table(rows)
+    store.close()
@@ -0,0 +1,235 @@
+#!/usr/bin/python3
+
+import json
+import math
+import threading
+from time import monotonic
+from collections import deque
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from records import split_record
+from config import config
+
+
+class Live_metrics:
+    '''
+    latest sample and the samples of the longest window of one logger,
+    update() only keeps a reference, windows are computed when the endpoint renders
+    '''
+
+    def __init__(self, sample_rate, windows=(10, 60)):
+        self.windows = windows
+        self.samples = deque(maxlen=math.ceil(max(windows) * sample_rate) + 1)
+        self.lock = threading.Lock()
+        self.latest = None
+        self.latest_ts = None
+        self.updates = 0
+
+    def update(self, fields, ts):
+        with self.lock:
+            self.samples.append((ts, fields))
+            self.latest = fields
+            self.latest_ts = ts
+            self.updates += 1
+
+    def window_stats(self, now):
+        '''
+        {window_secs: {field: {'avg', 'min', 'max'}}} of the numeric fields
+        '''
+        with self.lock:
+            samples = list(self.samples)
+
+        result = {}
+        for secs in self.windows:
+            acc = {}
+            for ts, fields in samples:
+                if ts < now - secs:
+                    continue
+                for name, value in split_record({'fields': fields})[1].items():
+                    if value is None:
+                        continue
+                    if name not in acc:
+                        acc[name] = [0.0, 0, value, value]
+                    field = acc[name]
+                    field[0] += value
+                    field[1] += 1
+                    field[2] = min(field[2], value)
+                    field[3] = max(field[3], value)
+            result[secs] = {name: {'avg': round(total / count, 3), 'min': low, 'max': high}
+                            for name, (total, count, low, high) in acc.items()}
+        return result
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics_server:
+    '''
+    prometheus text on /metrics and json on /metrics.json for the loggers of a run,
+    served from one background thread; the rendered bodies are reused until a new sample
+    landed or refresh secs passed, so scrapes cost nothing to the sampling loop
+    '''
+
+    def __init__(self, loggers, port, host='0.0.0.0', refresh=1):
+        self.loggers = loggers
+        self.port = port
+        self.host = host
+        self.refresh = refresh
+
+        self.cache_key = None
+        self.cache_time = 0.0
+        self.bodies = None
+        self.cache_lock = threading.Lock()
+
+        self.httpd = None
+        self.thread = None
+
+    def collect(self):
+        now = monotonic()
+        # writer and spool belong to the first logger and are shared by the rest
+        owner = self.loggers[0]
+        writer = owner.writer
+        spool = owner.spool
+
+        try:
+            spool_bytes = spool.size if spool else None
+        except OSError:
+            # a segment acked away while counting
+            spool_bytes = None
+
+        result = {
+            'writer_queue_depth': writer.pending if writer else None,
+            'writer_dropped': writer.dropped if writer else None,
+            'db_flush_seconds': writer.last_flush_secs if writer else None,
+            'spool_bytes': spool_bytes,
+            'jobs': [],
+        }
+        for logger in self.loggers:
+            metrics = logger.metrics
+            result['jobs'].append({
+                'interface': logger.interface,
+                'samples': logger.samples_taken,
+                'missed_ticks': logger.scheduler.missed_ticks,
+                'ping_queue_depth': len(logger.ping_stream),
+                'iperf_queue_depth': sum(len(stream) for stream in logger.iperf_streams.values()),
+                'latest_age_seconds': round(now - metrics.latest_ts, 3) if metrics.latest_ts else None,
+                'latest': metrics.latest,
+                'windows': {f'{secs}s': stats for secs, stats in metrics.window_stats(now).items()},
+            })
+        return result
+
+    def to_prometheus(self, data):
+        lines = []
+
+        def metric(name, kind, samples):
+            samples = [(labels, value) for labels, value in samples if value is not None]
+            if samples:
+                lines.append(f'# TYPE wifi_test_{name} {kind}')
+            for labels, value in samples:
+                label_string = ','.join(f'{key}="{_label(label)}"' for key, label in labels.items())
+                lines.append(f'wifi_test_{name}{{{label_string}}} {value}')
+
+        jobs = data['jobs']
+        metric('samples_total', 'counter', [({'interface': job['interface']}, job['samples']) for job in jobs])
+        metric('missed_ticks_total', 'counter', [({'interface': job['interface']}, job['missed_ticks']) for job in jobs])
+        metric('ping_queue_depth', 'gauge', [({'interface': job['interface']}, job['ping_queue_depth']) for job in jobs])
+        metric('iperf_queue_depth', 'gauge', [({'interface': job['interface']}, job['iperf_queue_depth']) for job in jobs])
+        metric('latest_age_seconds', 'gauge', [({'interface': job['interface']}, job['latest_age_seconds']) for job in jobs])
+        metric('writer_queue_depth', 'gauge', [({}, data['writer_queue_depth'])])
+        metric('writer_dropped_total', 'counter', [({}, data['writer_dropped'])])
+        metric('db_flush_seconds', 'gauge', [({}, data['db_flush_seconds'])])
+        metric('spool_bytes', 'gauge', [({}, data['spool_bytes'])])
+
+        latest = []
+        for job in jobs:
+            for name, value in split_record({'fields': job['latest'] or {}})[1].items():
+                latest.append(({'interface': job['interface'], 'field': name}, value))
+        metric('latest', 'gauge', latest)
+
+        for stat in ('avg', 'min', 'max'):
+            samples = []
+            for job in jobs:
+                for window, fields in job['windows'].items():
+                    for name, stats in fields.items():
+                        samples.append(({'interface': job['interface'], 'window': window, 'field': name}, stats[stat]))
+            metric(f'window_{stat}', 'gauge', samples)
+
+        return '\n'.join(lines) + '\n'
+
+    def render(self):
+        key = tuple(logger.metrics.updates for logger in self.loggers)
+        with self.cache_lock:
+            if self.bodies is None or key != self.cache_key or monotonic() - self.cache_time > self.refresh:
+                data = self.collect()
+                self.bodies = {
+                    '/metrics': (self.to_prometheus(data).encode(), 'text/plain; version=0.0.4'),
+                    '/metrics.json': (json.dumps(data).encode(), 'application/json'),
+                }
+                self.cache_key = key
+                self.cache_time = monotonic()
+            return self.bodies
+
+    def start(self):
+        self.httpd = HTTPServer((self.host, self.port), Metrics_handler)
+        self.httpd.metrics_server = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='metrics_server', daemon=True)
+        self.thread.start()
+        print(f'==> live metrics on http://{self.host}:{self.port}/metrics and /metrics.json')
+        return self
+
+    def close(self):
+        if self.httpd is None:
+            return
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class Metrics_handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = self.server.metrics_server.render().get(self.path.split('?')[0])
+        if body is None:
+            self.send_error(404)
+            return
+        content, content_type = body
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # keep scrapes out of the console
+        pass
+
+
+class Console_printer:
+    '''
+    sample lines to the console: every sample (all), at most one every interval secs (rate) or none (off);
+    routine status lines (log file and db flushes) only with all
+    '''
+
+    def __init__(self, mode='all', interval=config['console_interval']):
+        self.mode = mode
+        self.interval = interval
+        self.last = None
+
+    def due(self):
+        if self.mode == 'off':
+            return False
+        if self.mode == 'all':
+            return True
+        now = monotonic()
+        if self.last is not None and now - self.last < self.interval:
+            return False
+        self.last = now
+        return True
+
+    def print(self, lines):
+        # one write per sample, not per line; check due() before building the lines
+        print('\n'.join(lines))
+
+    def status(self, msg):
+        if self.mode == 'all':
+            print(msg)
@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+
+import sys
+import os
+from time import monotonic
+import argparse
+
+from go_wifi_test import Wifi_test_logger
+from link_stats import link_backends, get_nl80211_socket
+from scheduler import Tick_scheduler, parse_sample_rate
+from metrics_server import Metrics_server
+from sinks import sink_types, parse_sink
+from profiler import profiler
+from config import config
+
+
+class Wifi_test_orchestrator:
+    '''
+    run several (interface, router_ip, iperf_server) jobs at once:
+    one sampling clock, one db writer and one netlink socket shared by every job
+    '''
+
+    def __init__(self, jobs, duration, location, reverse, no_iperf, link_backend='auto',
+                 sample_rate=config['sample_rate'], fusion_mode=config['fusion_mode'],
+                 log_format=config['log_format'], console=config['console'], passive=False,
+                 iperf_direction=None, iperf_parallel=config['iperf_parallel'], track_roaming=False,
+                 scan=False, sinks=None, alerts=False, webhook=config['alert_webhook'],
+                 scan_trigger=config['scan_trigger']):
+        self.scheduler = Tick_scheduler(sample_rate, duration)
+        self.loggers = []
+        # one netlink socket and seq counter for the link samplers of every job
+        self.link_channel = get_nl80211_socket(link_backend)
+        if self.link_channel is None:
+            link_backend = 'iw'
+
+        for job in jobs:
+            tags = {'interface': job['interface'], 'job': job['name']}
+            logger = Wifi_test_logger(duration=duration, router_ip=job['router_ip'], location=location,
+                                      iperf_server_ip=job['iperf_server_ip'], iperf_port=job['iperf_port'],
+                                      reverse=reverse, no_iperf=no_iperf or not job['iperf_server_ip'],
+                                      link_backend=link_backend, sample_rate=sample_rate,
+                                      fusion_mode=fusion_mode, log_format=log_format,
+                                      interface=job['interface'], tags=tags, scheduler=self.scheduler,
+                                      shared=self.loggers[0] if self.loggers else None,
+                                      bind_interface=True, console=console, passive=passive,
+                                      iperf_direction=iperf_direction, iperf_parallel=iperf_parallel,
+                                      track_roaming=track_roaming, scan=scan, sinks=sinks,
+                                      alerts=alerts, webhook=webhook, link_channel=self.link_channel,
+                                      scan_trigger=scan_trigger)
+            self.loggers.append(logger)
+
+    def detect_signal(self):
+        for _ in self.scheduler:
+            for logger in self.loggers:
+                logger.sample_once()
+
+    def run(self):
+        for logger in self.loggers:
+            logger.get_wifi_link_status()
+            logger.start_producers()
+
+        # one warmup for every job, they start at once
+        deadline = monotonic() + config['producer_warmup_secs']
+        for logger in self.loggers:
+            logger.wait_for_producers(max(deadline - monotonic(), 0))
+
+        self.detect_signal()
+
+        # the first logger owns the shared writer, close it after every job landed its buffer
+        for logger in reversed(self.loggers):
+            logger.finish()
+        self.close_link_channel()
+
+    def clean_up(self):
+        for logger in reversed(self.loggers):
+            logger.shutdown()
+            logger.close_files()
+        self.close_link_channel()
+
+    def close_link_channel(self):
+        # after the samplers of every job are done with it
+        if self.link_channel is not None:
+            self.link_channel.close()
+            self.link_channel = None
+
+
+def parse_job(spec):
+    '''
+    interface,router_ip[,iperf_server_ip[:port]]
+    '''
+    parts = spec.split(',')
+    if len(parts) not in (2, 3):
+        raise argparse.ArgumentTypeError(f'bad job spec: {spec}')
+
+    iperf_server_ip, iperf_port = None, 5201
+    if len(parts) == 3 and parts[2]:
+        iperf_server_ip, _, port = parts[2].partition(':')
+        iperf_port = int(port) if port else 5201
+
+    return {'name': spec, 'interface': parts[0], 'router_ip': parts[1],
+            'iperf_server_ip': iperf_server_ip, 'iperf_port': iperf_port}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-j', '--job', metavar='job', required=True, action='append', type=parse_job,
+                        help='interface,router_ip[,iperf_server_ip[:port]], repeat for each job')
+    parser.add_argument('-l', '--location', metavar='location', required=True, type=str,
+                        help='tag data with location')
+    parser.add_argument('-t', '--duration', metavar='', default=300, type=int,
+                        help='test time duration (secs)')
+    parser.add_argument('-f', '--sample_rate', metavar='', default=config['sample_rate'], type=parse_sample_rate,
+                        help='samples per second')
+    parser.add_argument('-R', '--reverse', action="store_true",
+                        help='iperf direction reverse to downlink from server')
+    parser.add_argument('-d', '--direction', metavar='', default=None, choices=['ul', 'dl', 'both', 'bidir'],
+                        help='iperf direction: ul, dl, both (dl on the next server port) or bidir')
+    parser.add_argument('--parallel', metavar='', default=config['iperf_parallel'], type=int,
+                        help='iperf parallel streams of each direction')
+    parser.add_argument('-N', '--no_iperf', action="store_true",
+                        help='disable iperf test of every job.')
+    parser.add_argument('--passive', action="store_true",
+                        help='no iperf load, estimate throughput from the station byte counters')
+    parser.add_argument('--roam', action='store_true',
+                        help='track roams of every job and measure the traffic interruption of each')
+    parser.add_argument('--scan', action='store_true',
+                        help='scan neighbor APs of every job in the background and tag records with the congestion')
+    parser.add_argument('--scan_trigger', action='store_true', default=config['scan_trigger'],
+                        help='trigger scans (root, radio off channel) instead of reading the last results of the kernel, '
+                             'ignored for jobs under iperf load')
+    parser.add_argument('--sink', metavar='', action='append', type=parse_sink,
+                        help=f'output of the records, repeat for several: {", ".join(sink_types)} '
+                             f'(default {" ".join(config["sinks"])})')
+    parser.add_argument('--alerts', action='store_true',
+                        help='check the alert rules of config.py on every sample of every job')
+    parser.add_argument('--webhook', metavar='', default=config['alert_webhook'], type=str,
+                        help='url the alerts are posted to as json, implies --alerts')
+    parser.add_argument('-B', '--link_backend', metavar='', default='auto', choices=['auto'] + list(link_backends),
+                        help='link stats backend: auto, nl80211 or iw')
+    parser.add_argument('--console', metavar='', default=config['console'], choices=['all', 'rate', 'off'],
+                        help=f'print every sample, one every {config["console_interval"]} secs (rate) or none')
+    parser.add_argument('--metrics_port', metavar='', default=config['metrics_port'], type=int,
+                        help='serve live metrics over http on this port, 0 to disable')
+    parser.add_argument('--profile', action='store_true',
+                        help='time every stage of the measurement loop and print a profile at the end')
+    parser.add_argument('--trace_file', metavar='', default=None, type=str,
+                        help='also save the profile as chrome trace json to this file, implies --profile')
+
+    args = parser.parse_args()
+    if args.profile or args.trace_file:
+        profiler.enable()
+
+    orchestrator = Wifi_test_orchestrator(jobs=args.job, duration=args.duration, location=args.location,
+                                          reverse=args.reverse, no_iperf=args.no_iperf,
+                                          link_backend=args.link_backend, sample_rate=args.sample_rate,
+                                          console=args.console, passive=args.passive,
+                                          iperf_direction=args.direction, iperf_parallel=args.parallel,
+                                          track_roaming=args.roam, scan=args.scan, sinks=args.sink,
+                                          alerts=args.alerts or bool(args.webhook), webhook=args.webhook,
+                                          scan_trigger=args.scan_trigger)
+    if args.metrics_port:
+        Metrics_server(orchestrator.loggers, args.metrics_port).start()
+
+    interrupted = False
+    try:
+        orchestrator.run()
+    except KeyboardInterrupt:
+        print('\n==> Interrupted.\n')
+        interrupted = True
+        orchestrator.clean_up()
+    finally:
+        # however the run ended, after its shutdown
+        profiler.finish(args.trace_file)
+
+    if interrupted:
+        try:
+            print('\n==> Exited')
+            sys.exit(0)
+        except SystemExit:
+            os._exit(0)
@@ -1,79 +1,130 @@
 #!/usr/bin/python3
 
 import pexpect
-import subprocess
 import sys
 import os
-from time import sleep
+from time import sleep, monotonic
 from copy import copy
 import argparse
 import re
+from platform import system
+
+from probe_tool import probe_engines, min_interval
+from profiler import profiler
+
+summary_pattern = re.compile(r'.*statistics.*')
+latency_pattern = re.compile(r'time=([0-9.]*) ms')
+
+
+def parse_ping_summary(summary_string):
+    '''
+    output:
+    --- 192.168.50.1 ping statistics ---
+    5 packets transmitted, 5 received, 0% packet loss, time 4007ms
+    rtt min/avg/max/mdev = 2.764/5.925/12.220/3.572 ms
+    '''
+    patterns = {
+        'packets_sent': (re.compile(r'([0-9]*) packets transmitted'), int),
+        'packets_received': (re.compile(r'([0-9]*) (?:packets )?received'), int),
+        'packet_loss_rate': (re.compile(r'([0-9.]*)% packet loss'), float),
+        'rtt_mdev': (re.compile(r'/([0-9.]*) ms'), float),
+    }
+    stats = {}
+    for key, (pattern, cast) in patterns.items():
+        match = pattern.search(summary_string)
+        if match:
+            stats[key] = cast(match.group(1))
+    return stats
 
 
 class Ping_runner:
 
-    def __init__(self, ip, tos, duration, interval, queue):
+    def __init__(self, ip, tos, duration, interval, queue, interface=None, engine='ping', port=None):
+        '''
+        engine: 'ping' runs the ping binary, icmp / udp / tcp use the in-process probers of probe_tool
+        '''
         super().__init__()
+        self.interface = interface
+        self.engine = engine
+        self.port = port
+        self.stats = {}
+        self.is_summary = False
+        self.summary_string = ''
         self.ip = ip
         self.tos = tos
         self.duration = duration
         self.interval = interval
+        if engine in probe_engines and interval < min_interval:
+            # a sample rate over 1 / min_interval, the probes can not keep up with it
+            print(f'==> probe interval {interval} secs is below {min_interval}, using {min_interval}.')
+            self.interval = min_interval
         self.q = queue
 
     @property
     def platform(self):
-        cmd = 'uname'
-        result = subprocess.check_output(
-            [cmd], stderr=subprocess.STDOUT).decode('utf8').strip()
-        return result
+        # from os.uname(), no fork
+        return system()
 
-    def run(self):
+    def make_prober(self):
+        return probe_engines[self.engine](self.ip, self.tos, self.duration, self.interval, self.q,
+                                          port=self.port, interface=self.interface)
+
+    def build_cmd(self):
         if self.platform == 'Darwin':
             tos_option_string = '-z'
             duration_string = f' -t {self.duration}' if self.duration else ''
         elif self.platform == 'Linux':
             tos_option_string = '-Q'
-            duration_string = f' -c {self.duration}' if self.duration else ''
+            duration_string = f' -w {self.duration}' if self.duration else ''
 
         interval_string = f' -i {self.interval}'
+        if self.interface:
+            interval_string += f' -b {self.interface}' if self.platform == 'Darwin' else f' -I {self.interface}'
 
-        cmd = f'ping {self.ip} {tos_option_string} {self.tos}{duration_string}{interval_string}'
-        print(f'==> ping cmd send: \n\t{cmd}\n')
+        return f'ping {self.ip} {tos_option_string} {self.tos}{duration_string}{interval_string}'
 
-        child = pexpect.spawnu(cmd, timeout=10)
+    def handle_line(self, line):
+        # get final summary and quit
+        ''' output:
+        --- 192.168.50.1 ping statistics ---
+        5 packets transmitted, 5 received, 0% packet loss, time 4007ms
+        rtt min/avg/max/mdev = 2.764/5.925/12.220/3.572 ms
+        '''
 
-        summary_pattern = re.compile(r'.*statistics.*')
-        latency_pattern = re.compile(r'time=([0-9.]*) ms')
-        is_summary = False
-        summary_string = ''
+        if summary_pattern.match(line):
+            # print('==> summary begin')
+            self.is_summary = True
 
-        while True:
-            try:
-                child.expect('\n')
-                line = child.before
+        if self.is_summary:
+            self.summary_string += f'{line}\n'
 
-                # get final summary and quit
-                ''' output:
-                --- 192.168.50.1 ping statistics ---
-                5 packets transmitted, 5 received, 0% packet loss, time 4007ms
-                rtt min/avg/max/mdev = 2.764/5.925/12.220/3.572 ms
-                '''
+        match = latency_pattern.search(line)
+        if match:
+            self.q.put((monotonic(), float(match.group(1))))
 
-                if summary_pattern.match(line):
-                    # print('==> summary begin')
-                    is_summary = True
+    def finish(self):
+        self.stats = parse_ping_summary(self.summary_string)
+        return self.summary_string
 
-                if is_summary:
-                    summary_string += f'{line}\n'
+    def run(self):
+        if self.engine != 'ping':
+            self.stats = self.make_prober().run()
+            return self.stats
 
-                latency = float(latency_pattern.search(line).group(1))
-                self.q.put(latency)
+        cmd = self.build_cmd()
+        print(f'==> ping cmd send: \n\t{cmd}\n')
+
+        with profiler.stage('ping_spawn'):
+            child = pexpect.spawnu(cmd, timeout=10)
+
+        while True:
+            try:
+                child.expect('\n')
+                self.handle_line(child.before)
 
             # return when get statistics
             except pexpect.exceptions.EOF:
-                return summary_string
-            except AttributeError:
-                pass
+                return self.finish()
             except Exception as e:
                 print(f'==> error: {e.__class__} {e}')
 
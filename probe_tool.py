@@ -0,0 +1,433 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import math
+import errno
+import struct
+import socket
+import select
+import argparse
+import itertools
+import threading
+from time import time_ns, monotonic, monotonic_ns, sleep
+
+# kernel receive timestamps (CLOCK_REALTIME) on linux
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35) if sys.platform.startswith('linux') else None
+SO_BINDTODEVICE = getattr(socket, 'SO_BINDTODEVICE', 25) if sys.platform.startswith('linux') else None
+SIOCGIFADDR = 0x8915
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+min_interval = 0.01
+
+# seq u16 + send time ns u64, carried in the probe payload
+payload_struct = struct.Struct('!HQ')
+
+# icmp probers of one process tell their replies apart by ident
+icmp_idents = itertools.count()
+
+
+def checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def parse_interval(value):
+    '''
+    secs between probes, for argparse
+    '''
+    try:
+        interval = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'interval is not a number: {value}')
+    if not interval >= min_interval:
+        raise argparse.ArgumentTypeError(f'interval must be >= {min_interval} secs, got {value}')
+    return interval
+
+
+def interface_address(interface):
+    '''
+    ipv4 address of an interface, linux only
+    '''
+    import fcntl
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        data = fcntl.ioctl(sock.fileno(), SIOCGIFADDR, struct.pack('256s', interface.encode()[:15]))
+    return socket.inet_ntoa(data[20:24])
+
+
+class Prober:
+    '''
+    send one probe every interval on absolute deadlines and match the replies,
+    subclasses implement open(), send(seq) and receive() -> [(seq, rtt_ns)]
+    '''
+
+    name = None
+
+    def __init__(self, host, tos, duration, interval, queue, port=None, timeout=2, interface=None):
+        if interval < min_interval:
+            raise ValueError(f'interval must be >= {min_interval} secs')
+
+        self.host = host
+        self.interface = interface
+        self.source_address = None
+        self.tos = tos
+        self.duration = duration
+        self.interval = interval
+        self.q = queue
+        self.port = port
+        self.timeout = timeout
+        self.stop_event = threading.Event()
+
+        self.sent = 0
+        self.received = 0
+        self.duplicates = 0
+        self.reordered = 0
+        # 16 bit seqs waiting for a reply / already answered
+        self.pending_seqs = set()
+        self.answered_seqs = set()
+        self.last_seq = None
+        # running rtt stats (Welford), nothing kept per probe
+        self.rtt_count = 0
+        self.rtt_mean = 0.0
+        self.rtt_m2 = 0.0
+        self.rtt_min = math.inf
+        self.rtt_max = -math.inf
+
+    def open(self):
+        raise NotImplementedError
+
+    def send(self, seq):
+        raise NotImplementedError
+
+    def receive(self):
+        raise NotImplementedError
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def set_tos(self, sock):
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, self.tos)
+
+    def bind_interface(self, sock):
+        '''
+        probes leave through self.interface: SO_BINDTODEVICE needs CAP_NET_RAW,
+        without it the socket is bound to the address of the interface
+        '''
+        if not self.interface:
+            return
+        if SO_BINDTODEVICE is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, self.interface.encode())
+                return
+            except PermissionError:
+                pass
+        if self.source_address is None:
+            try:
+                self.source_address = interface_address(self.interface)
+            except OSError as e:
+                raise OSError(f'probes can not be bound to {self.interface}: {e}') from e
+        sock.bind((self.source_address, 0))
+
+    def enable_rx_timestamp(self, sock):
+        if SO_TIMESTAMPNS is None:
+            return
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        except OSError:
+            pass
+
+    def rx_time_ns(self, ancdata):
+        for level, kind, data in ancdata:
+            if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS and len(data) >= 16:
+                sec, nsec = struct.unpack('qq', data[:16])
+                return sec * 1_000_000_000 + nsec
+        return time_ns()
+
+    def on_reply(self, seq, rtt_ns):
+        if seq in self.answered_seqs:
+            self.duplicates += 1
+            return
+        if seq not in self.pending_seqs:
+            return
+        self.pending_seqs.remove(seq)
+        self.answered_seqs.add(seq)
+        self.received += 1
+
+        # older than the last answered seq, modulo 16 bits
+        if self.last_seq is not None and 0 < (self.last_seq - seq) & 0xffff < 0x8000:
+            self.reordered += 1
+        else:
+            self.last_seq = seq
+
+        rtt_ms = rtt_ns / 1e6
+        self.add_rtt(rtt_ms)
+        self.q.put((monotonic(), round(rtt_ms, 3)))
+
+    def add_rtt(self, rtt_ms):
+        self.rtt_count += 1
+        delta = rtt_ms - self.rtt_mean
+        self.rtt_mean += delta / self.rtt_count
+        self.rtt_m2 += delta * (rtt_ms - self.rtt_mean)
+        self.rtt_min = min(self.rtt_min, rtt_ms)
+        self.rtt_max = max(self.rtt_max, rtt_ms)
+
+    def wait_replies(self, until_ns):
+        while True:
+            left = (until_ns - monotonic_ns()) / 1e9
+            if left <= 0:
+                return
+            readable, _, _ = select.select([self], [], [], left)
+            if readable:
+                for seq, rtt_ns in self.receive():
+                    self.on_reply(seq, rtt_ns)
+
+    def run(self):
+        self.open()
+        print(f'==> {self.name} probe to {self.host}, tos: {self.tos}, interval: {self.interval} secs\n')
+
+        start = monotonic_ns()
+        interval_ns = int(self.interval * 1e9)
+        total = math.ceil(self.duration / self.interval) if self.duration else None
+
+        seq = 0
+        while (total is None or seq < total) and not self.stop_event.is_set():
+            # seq wraps at 16 bits, same as icmp
+            seq16 = seq & 0xffff
+            self.pending_seqs.add(seq16)
+            self.answered_seqs.discard(seq16)
+            self.sent += 1
+            try:
+                self.send(seq16)
+            except OSError as e:
+                print(f'==> probe send error: {e.__class__} {e}')
+            seq += 1
+            self.wait_replies(start + seq * interval_ns)
+
+        # late replies
+        self.wait_replies(monotonic_ns() + int(self.timeout * 1e9))
+        self.close()
+        return self.stats()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def close(self):
+        self.sock.close()
+
+    def stats(self):
+        sent = self.sent
+        received = self.received
+        result = {
+            'packets_sent': sent,
+            'packets_received': received,
+            'packet_loss_rate': round((sent - received) / sent * 100, 3) if sent else 0.0,
+            'duplicates': self.duplicates,
+            'reordered': self.reordered,
+        }
+        if self.rtt_count:
+            result.update({
+                'rtt_min': round(self.rtt_min, 3),
+                'rtt_avg': round(self.rtt_mean, 3),
+                'rtt_max': round(self.rtt_max, 3),
+                # same as ping's mdev
+                'rtt_mdev': round(math.sqrt(self.rtt_m2 / self.rtt_count), 3),
+            })
+        return result
+
+
+class Icmp_prober(Prober):
+    '''
+    icmp echo on an unprivileged datagram socket (net.ipv4.ping_group_range), raw socket as fallback
+    '''
+
+    name = 'icmp'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # distinct for every prober of the process, the pid keeps other processes apart
+        self.ident = (os.getpid() * 0x9e37 + next(icmp_idents)) & 0xffff
+
+    def open(self):
+        self.address = socket.gethostbyname(self.host)
+        try:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            self.raw = False
+        except PermissionError:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            self.raw = True
+        self.bind_interface(self.sock)
+        self.set_tos(self.sock)
+        self.enable_rx_timestamp(self.sock)
+
+    def send(self, seq):
+        payload = payload_struct.pack(seq, time_ns())
+        header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, self.ident, seq)
+        packet = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum(header + payload), self.ident, seq) + payload
+        self.sock.sendto(packet, (self.address, 0))
+
+    def reply_ident(self):
+        # the kernel replaces the id of a datagram socket with its port
+        return self.ident if self.raw else self.sock.getsockname()[1]
+
+    def receive(self):
+        replies = []
+        reply_ident = self.reply_ident()
+        while True:
+            try:
+                data, ancdata, _, address = self.sock.recvmsg(1024, 64, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                return replies
+            rx_ns = self.rx_time_ns(ancdata)
+
+            if self.raw:
+                # strip ip header
+                data = data[(data[0] & 0x0f) * 4:]
+            if len(data) < 8 + payload_struct.size or address[0] != self.address:
+                continue
+            icmp_type, _, _, ident, seq = struct.unpack('!BBHHH', data[:8])
+            if icmp_type != ICMP_ECHO_REPLY or ident != reply_ident:
+                continue
+            payload_seq, sent_ns = payload_struct.unpack(data[8:8 + payload_struct.size])
+            if payload_seq != seq:
+                continue
+            replies.append((seq, rx_ns - sent_ns))
+
+
+class Udp_echo_prober(Prober):
+    '''
+    udp datagrams to an echo service, e.g. `probe_tool.py --echo_server` on the far end
+    '''
+
+    name = 'udp'
+
+    def open(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.bind_interface(self.sock)
+        self.sock.connect((self.host, self.port or 7))
+        self.set_tos(self.sock)
+        self.enable_rx_timestamp(self.sock)
+
+    def send(self, seq):
+        self.sock.send(payload_struct.pack(seq, time_ns()))
+
+    def receive(self):
+        replies = []
+        while True:
+            try:
+                data, ancdata, _, _ = self.sock.recvmsg(1024, 64, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                return replies
+            except ConnectionRefusedError:
+                continue
+            if len(data) < payload_struct.size:
+                continue
+            seq, sent_ns = payload_struct.unpack(data[:payload_struct.size])
+            replies.append((seq, self.rx_time_ns(ancdata) - sent_ns))
+
+
+class Tcp_connect_prober(Prober):
+    '''
+    time of a tcp handshake, a refused connection (RST) counts as a reply too
+    '''
+
+    name = 'tcp'
+
+    def open(self):
+        self.address = socket.gethostbyname(self.host)
+        self.pending = {}
+
+    def send(self, seq):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        self.bind_interface(sock)
+        self.set_tos(sock)
+        sent_ns = monotonic_ns()
+        result = sock.connect_ex((self.address, self.port or 80))
+        if result not in (0, errno.EINPROGRESS):
+            sock.close()
+            return
+        self.pending[sock] = (seq, sent_ns)
+
+    def wait_replies(self, until_ns):
+        while True:
+            left = (until_ns - monotonic_ns()) / 1e9
+            if left <= 0:
+                break
+            if not self.pending:
+                sleep(left)
+                break
+            _, writable, _ = select.select([], list(self.pending), [], left)
+            now = monotonic_ns()
+            for sock in writable:
+                seq, sent_ns = self.pending.pop(sock)
+                error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                sock.close()
+                if error in (0, errno.ECONNREFUSED):
+                    self.on_reply(seq, now - sent_ns)
+
+        # give up on handshakes older than timeout
+        for sock, (seq, sent_ns) in list(self.pending.items()):
+            if monotonic_ns() - sent_ns > self.timeout * 1e9:
+                self.pending.pop(sock)
+                sock.close()
+
+    def close(self):
+        for sock in self.pending:
+            sock.close()
+
+
+probe_engines = {
+    'icmp': Icmp_prober,
+    'udp': Udp_echo_prober,
+    'tcp': Tcp_connect_prober,
+}
+
+
+def run_echo_server(port):
+    '''
+    local stand-in for a udp echo service
+    '''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('0.0.0.0', port))
+    print(f'==> udp echo server on port {port}')
+    while True:
+        data, address = sock.recvfrom(2048)
+        sock.sendto(data, address)
+
+
+if __name__ == '__main__':
+    import queue
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--host', type=str,
+                        help='destination ip')
+    parser.add_argument('-e', '--engine', default='icmp', choices=list(probe_engines),
+                        help='probe type')
+    parser.add_argument('-p', '--port', default=None, type=int,
+                        help='destination port of udp / tcp probes')
+    parser.add_argument('-I', '--interface', default=None, type=str,
+                        help='interface the probes are sent through')
+    parser.add_argument('-Q', '--tos', default=0, type=int,
+                        help='type of service value')
+    parser.add_argument('-t', '--duration', default=10, type=float,
+                        help='time duration (secs)')
+    parser.add_argument('-i', '--interval', default=1, type=parse_interval,
+                        help=f'interval between probes, down to {min_interval}')
+    parser.add_argument('--echo_server', action='store_true',
+                        help='run a udp echo server on --port instead')
+    args = parser.parse_args()
+
+    if args.echo_server:
+        run_echo_server(args.port or 7)
+        sys.exit(0)
+
+    q = queue.Queue()
+    prober = probe_engines[args.engine](args.host, args.tos, args.duration, args.interval, q, port=args.port,
+                                         interface=args.interface)
+    print(prober.run())
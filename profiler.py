@@ -0,0 +1,127 @@
+import os
+import json
+import threading
+from time import perf_counter_ns, thread_time_ns
+from collections import deque
+from contextlib import nullcontext
+
+from stats import _percentile
+from config import config
+
+# histogram buckets of the report, upper bounds in ms
+bucket_bounds = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+_null_stage = nullcontext()
+
+
+class _Stage:
+
+    __slots__ = ('profiler', 'name', 'start_ns', 'cpu_ns')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start_ns = perf_counter_ns()
+        self.cpu_ns = thread_time_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.events.append((self.name, threading.get_ident(), self.start_ns,
+                                     perf_counter_ns() - self.start_ns, thread_time_ns() - self.cpu_ns))
+        return False
+
+
+class Stage_profiler:
+    '''
+    wall / cpu time of named stages in a bounded ring of events,
+    stage() returns a shared no-op context while disabled
+    '''
+
+    def __init__(self, maxlen=config['profile_maxlen']):
+        self.enabled = False
+        self.events = deque(maxlen=maxlen)
+        self.thread_names = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def stage(self, name):
+        if not self.enabled:
+            return _null_stage
+        ident = threading.get_ident()
+        if ident not in self.thread_names:
+            self.thread_names[ident] = threading.current_thread().name
+        return _Stage(self, name)
+
+    def by_stage(self):
+        stages = {}
+        for name, _, _, wall_ns, cpu_ns in list(self.events):
+            walls, cpus = stages.setdefault(name, ([], []))
+            walls.append(wall_ns / 1e6)
+            cpus.append(cpu_ns / 1e6)
+        return stages
+
+    def report(self):
+        '''
+        {stage: {count, wall_ms_avg/p50/p95/max, cpu_ms_avg, histogram}}
+        '''
+        result = {}
+        for name, (walls, cpus) in self.by_stage().items():
+            ordered = sorted(walls)
+            histogram = [0] * (len(bucket_bounds) + 1)
+            for wall in walls:
+                histogram[next((i for i, bound in enumerate(bucket_bounds) if wall <= bound), len(bucket_bounds))] += 1
+            result[name] = {
+                'count': len(walls),
+                'wall_ms_avg': round(sum(walls) / len(walls), 3),
+                'wall_ms_p50': round(_percentile(ordered, 50), 3),
+                'wall_ms_p95': round(_percentile(ordered, 95), 3),
+                'wall_ms_max': round(ordered[-1], 3),
+                'cpu_ms_avg': round(sum(cpus) / len(cpus), 3),
+                'histogram': histogram,
+            }
+        return result
+
+    def print_report(self):
+        report = self.report()
+        if not report:
+            return
+        labels = [f'<={bound}' for bound in bucket_bounds] + [f'>{bucket_bounds[-1]}']
+
+        print('=' * 120)
+        print(f'{"stage":<16}{"count":>8}{"avg ms":>10}{"p50 ms":>10}{"p95 ms":>10}{"max ms":>10}{"cpu ms":>10}')
+        for name, stage in sorted(report.items(), key=lambda item: -item[1]['wall_ms_avg'] * item[1]['count']):
+            print(f'{name:<16}{stage["count"]:>8}{stage["wall_ms_avg"]:>10}{stage["wall_ms_p50"]:>10}'
+                  f'{stage["wall_ms_p95"]:>10}{stage["wall_ms_max"]:>10}{stage["cpu_ms_avg"]:>10}')
+            width = max(stage['histogram'])
+            for label, count in zip(labels, stage['histogram']):
+                if count:
+                    print(f'    {label + " ms":>12} {"#" * max(1, round(count / width * 40))} {count}')
+        print('=' * 120)
+
+    def write_trace(self, path):
+        '''
+        chrome://tracing / perfetto json of the events still in the ring
+        '''
+        pid = os.getpid()
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': ident, 'args': {'name': name}}
+                 for ident, name in self.thread_names.items()]
+        for name, ident, start_ns, wall_ns, cpu_ns in list(self.events):
+            trace.append({'name': name, 'ph': 'X', 'pid': pid, 'tid': ident,
+                          'ts': start_ns / 1000, 'dur': wall_ns / 1000, 'args': {'cpu_us': cpu_ns / 1000}})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+        print(f'==> profile trace saved to: {path}')
+
+    def finish(self, trace_file=None):
+        if not self.enabled:
+            return
+        self.print_report()
+        if trace_file:
+            self.write_trace(trace_file)
+
+
+# one profiler for the process, enabled by --profile
+profiler = Stage_profiler()
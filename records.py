@@ -0,0 +1,19 @@
+'''
+helpers on the sample records shared by the stats, rollups, metrics and the binary log
+'''
+
+# describe where and on what link a record was taken, tags even when numeric
+static_fields = ('location', 'ssid', 'channel', 'bandwidth', 'interface')
+
+
+def split_record(record):
+    '''
+    (tags, fields) of a record: the static fields and text or bool values, then the numbers
+    '''
+    tags, fields = {}, {}
+    for key, value in record['fields'].items():
+        if key in static_fields or isinstance(value, (str, bool)):
+            tags[key] = value
+        else:
+            fields[key] = value
+    return tags, fields
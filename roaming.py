@@ -0,0 +1,168 @@
+import threading
+from time import monotonic
+from subprocess import SubprocessError
+from collections import deque
+
+from config import config
+from link_stats import get_link_sampler
+from stats import _percentile
+
+
+def traffic_gap(stream, start, end):
+    '''
+    longest time (ms) in (start, end] without a sample of stream, a zero value is a stall too
+    '''
+    stamps = [ts for ts, value in stream.window(start, end) if value]
+    points = [start] + stamps + [end]
+    return round(max(b - a for a, b in zip(points, points[1:])) * 1000, 1)
+
+
+class Roam_event:
+
+    __slots__ = ('kind', 'start', 'end', 'old_bssid', 'new_bssid', 'signal_before', 'signal_after', 'gaps')
+
+    def __init__(self, kind, start, end, old_bssid, new_bssid, signal_before, signal_after):
+        # roam: a new bssid, reconnect: the same one after a loss
+        self.kind = kind
+        # monotonic secs the old association was last / the new one first seen
+        self.start = start
+        self.end = end
+        self.old_bssid = old_bssid
+        self.new_bssid = new_bssid
+        self.signal_before = signal_before
+        self.signal_after = signal_after
+        self.gaps = {}
+
+    @property
+    def link_gap_ms(self):
+        return round((self.end - self.start) * 1000, 1)
+
+    def as_fields(self):
+        return {
+            'event': self.kind,
+            'old_bssid': self.old_bssid,
+            'new_bssid': self.new_bssid,
+            'signal_before': self.signal_before,
+            'signal_after': self.signal_after,
+            'link_gap_ms': self.link_gap_ms,
+            **self.gaps,
+        }
+
+
+class Roam_tracker:
+    '''
+    poll the association of an interface at a high rate in its own thread, a changed bssid is a roam;
+    an event is held for settle secs so the ping / iperf samples after it are in, the longest
+    gap between samples around it less the sampling period is the interruption
+    '''
+
+    def __init__(self, interface, backend, streams, period, rate=config['roam_sample_rate'],
+                 settle=config['roam_settle_secs']):
+        '''
+        streams: {name: Sample_stream} of ping / iperf, period: secs between their samples
+        '''
+        # own sampler, a netlink socket is not shared across threads
+        self.sampler = get_link_sampler(interface, backend)
+        self.streams = streams
+        self.period = period
+        self.poll_period = 1 / rate
+        self.settle = settle
+
+        self.bssid = None
+        self.signal = None
+        self.seen_at = None
+        # association lost, waiting for the next one
+        self.lost = None
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.polls = 0
+        self.errors = 0
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='roam_tracker', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        deadline = monotonic()
+        while not self.stopped.wait(max(deadline - monotonic(), 0)):
+            self.poll(monotonic())
+            # a slow poll skips deadlines instead of bursting
+            deadline = max(deadline + self.poll_period, monotonic())
+
+    def poll(self, now):
+        try:
+            bssid, signal = self.sampler.association()
+        except (OSError, SubprocessError):
+            # a netlink error, or iw failing or timing out, the next poll tries again
+            self.errors += 1
+            return
+        self.polls += 1
+
+        if bssid is None:
+            if self.bssid is not None:
+                self.lost = (self.bssid, self.signal, self.seen_at)
+                self.bssid = None
+            return
+
+        if self.lost is not None:
+            old_bssid, old_signal, last_seen = self.lost
+            self.lost = None
+            kind = 'roam' if bssid != old_bssid else 'reconnect'
+            self.add_event(Roam_event(kind, last_seen, now, old_bssid, bssid, old_signal, signal))
+        elif self.bssid is not None and bssid != self.bssid:
+            self.add_event(Roam_event('roam', self.seen_at, now, self.bssid, bssid, self.signal, signal))
+
+        self.bssid = bssid
+        self.signal = signal
+        self.seen_at = now
+
+    def add_event(self, event):
+        with self.lock:
+            self.pending.append(event)
+
+    def collect(self, now, final=False):
+        '''
+        events settled by now, with the traffic gaps of every stream around them;
+        final takes the unsettled ones too, at the end of a run
+        '''
+        done = []
+        with self.lock:
+            while self.pending and (final or self.pending[0].end + self.settle <= now):
+                done.append(self.pending.popleft())
+
+        for event in done:
+            interruptions = []
+            for name, stream in self.streams.items():
+                gap = traffic_gap(stream, event.start - self.settle, min(event.end + self.settle, now))
+                event.gaps[f'{name}_gap_ms'] = gap
+                interruptions.append(max(gap - self.period * 1000, 0.0))
+            if interruptions:
+                event.gaps['interruption_ms'] = round(max(interruptions), 1)
+        return done
+
+    def close(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=3)
+        self.sampler.close()
+
+
+def roam_summary(events):
+    '''
+    counts and percentiles of the settled events of a run
+    '''
+    summary = {
+        'roams': sum(event.kind == 'roam' for event in events),
+        'reconnects': sum(event.kind == 'reconnect' for event in events),
+    }
+    for name, values in (('interruption_ms', [event.gaps.get('interruption_ms') for event in events]),
+                         ('link_gap_ms', [event.link_gap_ms for event in events])):
+        values = sorted(value for value in values if value is not None)
+        for p in (50, 95):
+            value = _percentile(values, p)
+            summary[f'{name}_p{p}'] = round(value, 1) if value is not None else None
+        summary[f'{name}_max'] = values[-1] if values else None
+    return summary
@@ -0,0 +1,137 @@
+'''
+rollups of the sample records, computed as they are taken: per window aligned to the clock and per
+location / ssid / channel, the count, mean, min, max and p95 of every numeric field go to a measurement
+of their own (e.g. wifi_test_1m) next to the raw points, so long-range dashboards read pre-aggregated data
+'''
+
+from datetime import datetime, timezone
+
+from config import config
+from records import split_record
+from stats import _percentile, P2_quantile
+
+# a new value of any of them starts a new series of a window
+rollup_keys = ('location', 'ssid', 'channel')
+
+
+def rollup_measurement(measurement, name):
+    return f'{measurement}_{name}'
+
+
+class Field_rollup:
+    '''
+    p95 is exact up to exact_limit samples of a window, a P² estimate after that
+    '''
+
+    __slots__ = ('count', 'total', 'min', 'max', 'values', 'p95')
+
+    exact_limit = 128
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.values = []
+        self.p95 = P2_quantile(0.95)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.p95.add(value)
+        if self.values is not None:
+            self.values.append(value)
+            if self.count > self.exact_limit:
+                self.values = None
+
+    def fields(self, name):
+        p95 = _percentile(sorted(self.values), 95) if self.values is not None else self.p95.value
+        return {
+            f'{name}_mean': round(self.total / self.count, 3),
+            f'{name}_min': self.min,
+            f'{name}_max': self.max,
+            f'{name}_p95': round(p95, 3),
+        }
+
+
+class Window_rollup:
+
+    def __init__(self, start, key_fields):
+        self.start = start
+        self.key_fields = key_fields
+        self.samples = 0
+        self.fields = {}
+
+    def add(self, values):
+        self.samples += 1
+        for name, value in values.items():
+            if value is None or isinstance(value, float) and value != value:
+                continue
+            if name not in self.fields:
+                self.fields[name] = Field_rollup()
+            self.fields[name].add(value)
+
+    def record(self, measurement, window_secs):
+        fields = {**self.key_fields, 'window_secs': window_secs, 'samples': self.samples}
+        for name, rollup in self.fields.items():
+            fields.update(rollup.fields(name))
+        return {
+            'measurement': measurement,
+            # records are stamped in utc at the end of the window, when its last sample could be taken
+            'time': datetime.fromtimestamp(self.start + window_secs, timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            'fields': fields,
+        }
+
+
+class Rollup:
+    '''
+    the open window of every key, a window is closed by the first sample after its end
+    '''
+
+    def __init__(self, measurement, window_secs, extra_keys=()):
+        self.measurement = measurement
+        self.window_secs = window_secs
+        # e.g. the interface and job tags of the orchestrator
+        self.keys = rollup_keys + tuple(key for key in extra_keys if key not in rollup_keys)
+        self.windows = {}
+
+    def add(self, fields, now):
+        '''
+        add a sample record at now (epoch secs), return the records of the windows it closed
+        '''
+        start = now - now % self.window_secs
+        done = self.close(before=start)
+
+        key_fields = {key: fields.get(key) for key in self.keys}
+        key = tuple(key_fields.values())
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = Window_rollup(start, key_fields)
+        _, values = split_record({'fields': {name: value for name, value in fields.items() if name not in self.keys}})
+        window.add(values)
+        return done
+
+    def close(self, before=None):
+        '''
+        records of the windows started before before, of every window when None
+        '''
+        done = [key for key, window in self.windows.items() if before is None or window.start < before]
+        return [self.windows.pop(key).record(self.measurement, self.window_secs) for key in done]
+
+
+class Rollups:
+
+    def __init__(self, measurement, windows=config['rollup_windows'], extra_keys=()):
+        '''
+        windows: {name: secs}, the name is the suffix of the measurement
+        '''
+        self.rollups = [Rollup(rollup_measurement(measurement, name), secs, extra_keys)
+                        for name, secs in windows.items()]
+
+    def add(self, fields, now):
+        return [record for rollup in self.rollups for record in rollup.add(fields, now)]
+
+    def close(self):
+        return [record for rollup in self.rollups for record in rollup.close()]
@@ -0,0 +1,102 @@
+import gzip
+import shutil
+import threading
+from time import time
+from datetime import datetime
+from pathlib import Path
+
+
+def compress_file(path):
+    '''
+    path -> path.gz, the original is removed once the copy is complete
+    '''
+    path = Path(path)
+    tmp_path = path.with_name(f'{path.name}.gz.tmp')
+    with open(path, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    tmp_path.replace(path.with_name(f'{path.name}.gz'))
+    path.unlink()
+
+
+class Rotating_file:
+    '''
+    append-only text file kept open between writes, named by name_format from the date of each write
+    (e.g. 'log_wifi_test_{date}'), so a new day starts a new file; a file growing over max_bytes
+    is moved aside as <name>.<n>. Files closed by a rotation are gzipped in the background and
+    files of this name older than retention_days are removed.
+    '''
+
+    def __init__(self, folder, name_format, max_bytes=None, compress=False, retention_days=None):
+        self.folder = Path(folder)
+        self.name_format = name_format
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.retention_days = retention_days
+
+        self.lock = threading.Lock()
+        self.f = None
+        self.path = None
+        # the file was empty when opened, e.g. a csv header is due
+        self.fresh = False
+
+    def name_for(self, now=None):
+        return self.name_format.format(date=(now or datetime.now()).date())
+
+    def current(self, now=None):
+        '''
+        the open handle for a write at now, rotated when the date changed or the file is full
+        '''
+        path = self.folder.joinpath(self.name_for(now))
+        if self.f is not None and path != self.path:
+            self.close(rotated=True)
+        elif self.f is not None and self.max_bytes and self.f.tell() >= self.max_bytes:
+            self.roll_over()
+
+        if self.f is None:
+            self.path = path
+            self.f = open(path, 'a', encoding='utf_8')
+            self.fresh = self.f.tell() == 0
+        return self.f
+
+    def write(self, text, now=None):
+        with self.lock:
+            f = self.current(now)
+            f.write(text)
+            f.flush()
+            self.fresh = False
+
+    def roll_over(self):
+        self.f.close()
+        self.f = None
+        n = 1
+        while any(self.folder.joinpath(f'{self.path.name}.{n}{ext}').exists() for ext in ('', '.gz')):
+            n += 1
+        rolled = self.path.rename(self.folder.joinpath(f'{self.path.name}.{n}'))
+        self.after_rotation(rolled)
+
+    def after_rotation(self, path):
+        if self.compress:
+            threading.Thread(target=compress_file, args=(path,), name='log_compress', daemon=True).start()
+        if self.retention_days is not None:
+            self.prune()
+
+    def prune(self):
+        deadline = time() - self.retention_days * 86400
+        pattern = self.name_format.format(date='*').rstrip('*') + '*'
+        for path in self.folder.glob(pattern):
+            if path == self.path or not path.is_file():
+                continue
+            try:
+                if path.stat().st_mtime < deadline:
+                    path.unlink()
+                    print(f'==> removed old file: {path}')
+            except OSError:
+                pass
+
+    def close(self, rotated=False):
+        if self.f is None:
+            return
+        self.f.close()
+        self.f = None
+        if rotated:
+            self.after_rotation(self.path)
@@ -0,0 +1,217 @@
+#!/usr/bin/python3
+'''
+neighbor APs from a background `iw <dev> scan dump` on its own slow schedule, so the sampling path
+only reads the cache; --trigger scans all channels itself, which takes the radio off channel:
+
+    python3 scan_cache.py -i wlo1 --trigger
+'''
+
+import argparse
+import threading
+from time import monotonic
+from subprocess import check_output, STDOUT, CalledProcessError, TimeoutExpired
+
+from config import config
+from iw_parser import parse_scan
+from link_stats import freq_to_channel
+from local_store import band_of
+
+# channels a new network would be put on, the best of each band goes to the summary
+candidate_channels = {
+    '2.4': (1, 6, 11),
+    '5': (36, 40, 44, 48, 149, 153, 157, 161, 165),
+}
+
+
+def channel_to_freq(channel, band):
+    if band == '2.4':
+        return 2484 if channel == 14 else 2407 + channel * 5
+    return (5950 if band == '6' else 5000) + channel * 5
+
+
+def signal_weight(signal):
+    # -95 dBm and below is noise, -45 dBm and above a full competitor
+    return min(max((signal + 95) / 50, 0.0), 1.0)
+
+
+def overlap(freq_a, freq_b):
+    '''
+    share two 20 MHz channels overlap: 1 on the same channel, 0.75 on the 2.4 GHz neighbor, 0 apart
+    '''
+    return max(1 - abs(freq_a - freq_b) / 20, 0.0)
+
+
+def subchannels(freq, center_freq=None, bandwidth=None):
+    # 20 MHz channels a link occupies
+    if not center_freq or not bandwidth or bandwidth <= 20:
+        return [freq]
+    low = center_freq - bandwidth // 2 + 10
+    return [low + 20 * k for k in range(bandwidth // 20)]
+
+
+class Scan_cache:
+    '''
+    bssid -> last scan result, evicted ttl secs after it was last seen;
+    neighbors are weighted by signal and by how much their primary channel overlaps
+    '''
+
+    def __init__(self, interface, interval=config['scan_interval'], ttl=config['scan_ttl'],
+                 trigger=config['scan_trigger']):
+        self.interface = interface
+        self.interval = interval
+        self.ttl = ttl
+        # read what the kernel saw last (`scan dump`, no root needed), or trigger a new scan:
+        # the radio then leaves its channel for seconds and the traffic of the link stalls
+        self.trigger = trigger
+
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.scans = 0
+        self.failures = 0
+        # bumped on every change of entries, link loads are cached per generation
+        self.generation = 0
+        self.load_cache = {}
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='scan_cache', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        while True:
+            self.scan_once()
+            if self.stopped.wait(self.interval):
+                return
+
+    def run_scan(self):
+        # at the lowest priority, a scan never competes with the measurement for cpu
+        cmd = ['nice', '-n', '19', 'iw', self.interface, 'scan'] + ([] if self.trigger else ['dump'])
+        try:
+            return check_output(cmd, stderr=STDOUT, timeout=30).decode('utf8', errors='replace')
+        except CalledProcessError as e:
+            output = e.output.decode('utf8', errors='replace')
+            if self.trigger and 'Operation not permitted' in output:
+                print('==> scan needs root, reading the results of other scans instead (iw scan dump).')
+                self.trigger = False
+                return self.run_scan()
+            raise
+
+    def scan_once(self):
+        try:
+            bsses = parse_scan(self.run_scan())
+        except (OSError, CalledProcessError, TimeoutExpired) as e:
+            self.failures += 1
+            print(f'==> scan failed: {e.__class__} {e}')
+            return []
+
+        now = monotonic()
+        with self.lock:
+            for bss in bsses:
+                if bss['freq'] is None or bss['signal'] is None:
+                    continue
+                # last seen is how old the result of the kernel was when dumped
+                bss['seen'] = now - (bss['last_seen_ms'] or 0) / 1000
+                bss['channel'] = freq_to_channel(bss['freq'])
+                bss['band'] = band_of(bss['freq'])
+                self.entries[bss['bssid']] = bss
+            self.evict(now)
+            self.scans += 1
+        return bsses
+
+    def evict(self, now):
+        for bssid in [bssid for bssid, bss in self.entries.items() if now - bss['seen'] > self.ttl]:
+            del self.entries[bssid]
+        self.generation += 1
+        self.load_cache = {}
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.entries.values())
+
+    def load(self, freqs, own_bssid=None):
+        '''
+        (neighbors, congestion) on the 20 MHz channels of freqs
+        '''
+        neighbors, congestion = 0, 0.0
+        for bss in self.snapshot():
+            if bss['bssid'] == own_bssid:
+                continue
+            share = max(overlap(freq, bss['freq']) for freq in freqs)
+            if share:
+                neighbors += 1
+                congestion += share * signal_weight(bss['signal'])
+        return neighbors, round(congestion, 2)
+
+    def link_fields(self, link):
+        '''
+        fields of a sample record for the link, read from the cache without waiting for a scan
+        '''
+        if not self.scans or link.freq is None:
+            return {}
+        key = (self.generation, link.bssid, link.freq, link.center_freq, link.bandwidth)
+        if key not in self.load_cache:
+            neighbors, congestion = self.load(subchannels(link.freq, link.center_freq, link.bandwidth), link.bssid)
+            self.load_cache[key] = {'neighbors': neighbors, 'congestion': congestion}
+        return self.load_cache[key]
+
+    def channel_index(self, own_bssid=None):
+        '''
+        {band: {channel: {neighbors, congestion, strongest}}} of every channel seen and every candidate
+        '''
+        entries = self.snapshot()
+        channels = {(bss['band'], bss['channel']) for bss in entries}
+        channels.update((band, channel) for band, candidates in candidate_channels.items() for channel in candidates)
+
+        index = {}
+        for band, channel in sorted(channels, key=lambda item: (float(item[0]), item[1])):
+            neighbors, congestion = self.load([channel_to_freq(channel, band)], own_bssid)
+            signals = [bss['signal'] for bss in entries if bss['band'] == band and bss['channel'] == channel]
+            index.setdefault(band, {})[channel] = {
+                'neighbors': neighbors,
+                'congestion': congestion,
+                'strongest': max(signals) if signals else None,
+            }
+        return index
+
+    def summary(self, own_bssid=None):
+        index = self.channel_index(own_bssid)
+        result = {
+            'scans': self.scans,
+            'scan_failures': self.failures,
+            'neighbors_total': len([bss for bss in self.snapshot() if bss['bssid'] != own_bssid]),
+        }
+        for band, candidates in candidate_channels.items():
+            scores = {channel: index[band][channel]['congestion'] for channel in candidates}
+            band_name = band.replace('.', '')
+            result[f'best_channel_{band_name}g'] = min(scores, key=scores.get)
+        result['scan_index'] = {band: {str(channel): values for channel, values in channels.items()}
+                                for band, channels in index.items()}
+        return result
+
+    def close(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=3)
+
+
+def print_index(index):
+    print(f'{"band":>5} {"channel":>8} {"neighbors":>10} {"congestion":>11} {"strongest":>10}')
+    for band, channels in index.items():
+        for channel, values in channels.items():
+            print(f'{band:>5} {channel:>8} {values["neighbors"]:>10} {values["congestion"]:>11} '
+                  f'{values["strongest"] if values["strongest"] is not None else "":>10}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--interface', metavar='', default=config['interface'], type=str,
+                        help='wireless interface')
+    parser.add_argument('--trigger', action='store_true', default=config['scan_trigger'],
+                        help='trigger a scan instead of reading the last scan results of the kernel, needs root')
+    args = parser.parse_args()
+
+    cache = Scan_cache(args.interface, trigger=args.trigger)
+    cache.scan_once()
+    print_index(cache.channel_index())
@@ -0,0 +1,117 @@
+import math
+import asyncio
+import argparse
+from time import monotonic, sleep
+from array import array
+
+
+def valid_rate(rate):
+    return rate > 0 and math.isfinite(rate)
+
+
+def parse_sample_rate(value):
+    '''
+    samples per second, for argparse
+    '''
+    try:
+        rate = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'sample rate is not a number: {value}')
+    if not valid_rate(rate):
+        raise argparse.ArgumentTypeError(f'sample rate must be > 0 samples per second, got {value}')
+    return rate
+
+
+class Tick_scheduler:
+    '''
+    yield ticks on absolute monotonic deadlines: start + n * period,
+    a late tick never pushes the following ones, ticks already passed are counted as missed
+    '''
+
+    def __init__(self, rate, duration=None):
+        if not valid_rate(rate):
+            raise ValueError(f'sample rate must be > 0 samples per second, got {rate}')
+        self.rate = rate
+        self.period = 1 / rate
+        self.duration = duration
+        self.total_ticks = round(duration * rate) if duration else None
+
+        self.ticks = 0
+        self.missed_ticks = 0
+        self.jitters = array('d')
+        self.start_time = None
+        self.deadline = None
+
+    @property
+    def elapsed(self):
+        return monotonic() - self.start_time if self.start_time else 0.0
+
+    def catch_up(self, tick, now):
+        '''
+        previous work overran whole periods: count the passed deadlines as missed, return the tick to run
+        '''
+        late = now - (self.start_time + tick * self.period)
+        if late < self.period:
+            return tick
+        skipped = int(late / self.period)
+        if self.total_ticks is not None:
+            skipped = min(skipped, self.total_ticks - tick)
+        self.missed_ticks += skipped
+        return tick + skipped
+
+    def mark(self, deadline):
+        self.deadline = deadline
+        self.jitters.append(monotonic() - deadline)
+        self.ticks += 1
+
+    def next_deadline(self, tick):
+        '''
+        (tick, deadline) to wait for after the passed ones were skipped, None when the run is over
+        '''
+        tick = self.catch_up(tick, monotonic())
+        if self.total_ticks is not None and tick >= self.total_ticks:
+            return None
+        return tick, self.start_time + tick * self.period
+
+    def __iter__(self):
+        self.start_time = monotonic()
+        tick = 0
+
+        while (next_tick := self.next_deadline(tick)) is not None:
+            tick, deadline = next_tick
+            wait = deadline - monotonic()
+            if wait > 0:
+                sleep(wait)
+
+            self.mark(deadline)
+            tick += 1
+            yield tick
+
+    async def ticks_async(self):
+        '''
+        same ticks as iterating the scheduler, for an asyncio event loop
+        '''
+        self.start_time = monotonic()
+        tick = 0
+
+        while (next_tick := self.next_deadline(tick)) is not None:
+            tick, deadline = next_tick
+            wait = deadline - monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            self.mark(deadline)
+            tick += 1
+            yield tick
+
+    def reset_jitters(self):
+        # a long run summarizes windows, keep only the current one
+        self.jitters = array('d')
+
+    def jitter_stats(self):
+        if not self.jitters:
+            return {'jitter_ms_avg': None, 'jitter_ms_max': None}
+        return {
+            'jitter_ms_avg': round(sum(self.jitters) / len(self.jitters) * 1000, 3),
+            'jitter_ms_max': round(max(self.jitters) * 1000, 3),
+        }
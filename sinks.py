@@ -0,0 +1,304 @@
+'''
+outputs the records of a run go to, picked per run by a spec of name or name:arg
+
+    influxdb            influxdb v1 through influxdb-python, server and login from credential.py
+    influx_http[:url]   line protocol posted to an influxdb v1 /write url, db_config of credential.py without one
+    jsonl[:file]        json lines, a file per day, {date} in the name is the local date of each write
+    csv[:folder]        a csv per measurement and day
+    stdout[:json]       line protocol (or json) on stdout, e.g. piped into telegraf
+
+the dependency of a sink is imported when it is opened, a sink which can't be opened is left out.
+remote sinks are sent to by the batch writer and their failed batches are spooled,
+local ones are written in line with the log file. With raw_retention_days set, the influx sinks write
+the raw sample points (wifi_test) to a retention policy of that duration and everything else,
+rollups, roams, alerts and scans, to the default one.
+'''
+
+import io
+import sys
+import csv
+import gzip
+import json
+import threading
+from pathlib import Path
+
+from config import config
+from line_protocol import to_line_protocol
+from rotating import Rotating_file
+
+
+# measurements of the raw samples, the only ones written to the raw retention policy
+raw_measurements = ('wifi_test',)
+
+
+class Sink_unavailable(Exception):
+    pass
+
+
+def load_db_config():
+    try:
+        from credential import db_config
+        return {key: db_config[key] for key in ('influxdb_ip', 'influxdb_port', 'influxdb_username',
+                                                'influxdb_password', 'influxdb_dbname')}
+    except (ImportError, KeyError, TypeError) as e:
+        raise Sink_unavailable('credential.py is not found or db_config format incorrect') from e
+
+
+def retention_groups(points):
+    '''
+    [(retention policy, points)] of a batch, None is the default policy of the database
+    '''
+    if not config['raw_retention_days']:
+        return [(None, points)]
+    raw = [point for point in points if point['measurement'] in raw_measurements]
+    kept = [point for point in points if point['measurement'] not in raw_measurements]
+    return [(policy, group) for policy, group in ((config['raw_retention_policy'], raw), (None, kept)) if group]
+
+
+def retention_statements(database):
+    '''
+    create the raw retention policy, alter it when it exists with another duration
+    '''
+    name, days = config['raw_retention_policy'], config['raw_retention_days']
+    return (f'CREATE RETENTION POLICY "{name}" ON "{database}" DURATION {days}d REPLICATION 1',
+            f'ALTER RETENTION POLICY "{name}" ON "{database}" DURATION {days}d')
+
+
+class Influxdb_sink:
+
+    remote = True
+
+    def __init__(self, arg, log_folder):
+        try:
+            from influxdb import InfluxDBClient
+        except ModuleNotFoundError as e:
+            raise Sink_unavailable('module influxdb is not found') from e
+        self.client_class = InfluxDBClient
+        self.db_config = load_db_config()
+        # one client for the whole run, its http session keeps the connection alive
+        self.db_cli = None
+        self.policy_ready = not config['raw_retention_days']
+        # batch writer and spool replayer share the client, one request at a time
+        self.lock = threading.Lock()
+        print(f'==> database used in influxdb: {self.db_config["influxdb_ip"]} / {self.db_config["influxdb_dbname"]}')
+
+    @property
+    def db_params(self):
+        return {
+            'host': self.db_config['influxdb_ip'],
+            'port': self.db_config['influxdb_port'],
+            'username': self.db_config['influxdb_username'],
+            'password': self.db_config['influxdb_password'],
+            'database': self.db_config['influxdb_dbname'],
+            'timeout': config['db_connect_timeout'],
+            'retries': config['db_connect_retries'],
+        }
+
+    def ensure_policy(self):
+        for statement in retention_statements(self.db_config['influxdb_dbname']):
+            try:
+                self.db_cli.query(statement, method='POST')
+                self.policy_ready = True
+                return
+            except Exception as e:
+                error = e
+        print(f'==> raw retention policy not set: {error.__class__} {error}')
+
+    def write(self, points):
+        with self.lock:
+            if self.db_cli is None:
+                self.db_cli = self.client_class(**self.db_params, gzip=True)
+            if not self.policy_ready:
+                self.ensure_policy()
+            for policy, group in retention_groups(points):
+                self.db_cli.write_points(to_line_protocol(group), protocol='line', retention_policy=policy)
+
+    def close(self):
+        if self.db_cli is not None:
+            self.db_cli.close()
+
+
+class Influx_http_sink:
+    '''
+    gzipped line protocol posted with requests, no client library
+    '''
+
+    remote = True
+
+    def __init__(self, arg, log_folder):
+        try:
+            import requests
+        except ModuleNotFoundError as e:
+            raise Sink_unavailable('module requests is not found') from e
+
+        if arg:
+            self.url = arg
+            self.params = {}
+            # retention policies are left to the owner of the url
+            self.policy_ready = True
+        else:
+            db_config = load_db_config()
+            self.url = f'http://{db_config["influxdb_ip"]}:{db_config["influxdb_port"]}/write'
+            self.params = {'db': db_config['influxdb_dbname'],
+                           'u': db_config['influxdb_username'],
+                           'p': db_config['influxdb_password']}
+            self.policy_ready = not config['raw_retention_days']
+        if 'precision=' not in self.url:
+            self.params['precision'] = 'ns'
+
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        print(f'==> influx line protocol over http: {self.url}')
+
+    def ensure_policy(self):
+        query_url = self.url.rsplit('/write', 1)[0] + '/query'
+        auth = {key: value for key, value in self.params.items() if key in ('u', 'p')}
+        for statement in retention_statements(self.params['db']):
+            response = self.session.post(query_url, params={**auth, 'q': statement},
+                                         timeout=config['db_connect_timeout'])
+            # influxdb answers 200 with an error in the body too
+            if response.ok and '"error"' not in response.text:
+                self.policy_ready = True
+                return
+        print(f'==> raw retention policy not set: {response.status_code} {response.text[:200]}')
+
+    def write(self, points):
+        with self.lock:
+            if not self.policy_ready:
+                self.ensure_policy()
+            for policy, group in retention_groups(points):
+                body = gzip.compress('\n'.join(to_line_protocol(group)).encode('utf8'), compresslevel=5)
+                params = {**self.params, 'rp': policy} if policy else self.params
+                response = self.session.post(self.url, params=params, data=body,
+                                             headers={'Content-Encoding': 'gzip',
+                                                      'Content-Type': 'text/plain; charset=utf-8'},
+                                             timeout=config['db_connect_timeout'])
+                response.raise_for_status()
+
+    def close(self):
+        self.session.close()
+
+
+class Jsonl_sink:
+
+    remote = False
+
+    def __init__(self, arg, log_folder):
+        path = Path(arg) if arg else Path(log_folder).joinpath('records_{date}.jsonl')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = Rotating_file(path.parent, path.name,
+                                  max_bytes=config['log_max_bytes'],
+                                  compress=config['log_compress'],
+                                  retention_days=config['log_retention_days'])
+
+    def write(self, points):
+        self.file.write(''.join(f'{json.dumps(point)}\n' for point in points))
+
+    def close(self):
+        self.file.close()
+
+
+def write_csv_rows(writer, rows, headers, file_headers):
+    '''
+    append rows to the current file of a Rotating_file, a new file starts with a line of headers;
+    file_headers {path: columns} keeps the columns of each file, those of a file started by an earlier run
+    are read from its first line
+    '''
+    text = io.StringIO()
+    with writer.lock:
+        f = writer.current()
+        if writer.fresh:
+            file_headers[writer.path] = headers
+            csv.DictWriter(text, fieldnames=headers).writeheader()
+        elif writer.path not in file_headers:
+            with open(writer.path, 'r', encoding='utf_8') as header_file:
+                file_headers[writer.path] = next(csv.reader(header_file), headers)
+        csv.DictWriter(text, fieldnames=file_headers[writer.path], extrasaction='ignore').writerows(rows)
+        f.write(text.getvalue())
+        f.flush()
+        writer.fresh = False
+
+
+class Csv_sink:
+    '''
+    columns are time, tags and fields of the first record of a file, later keys are left out
+    '''
+
+    remote = False
+
+    def __init__(self, arg, log_folder):
+        self.folder = Path(arg) if arg else Path(log_folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.files = {}
+        self.headers = {}
+
+    @staticmethod
+    def to_row(point):
+        row = {'time': point.get('time'), **(point.get('tags') or {}), **point['fields']}
+        return {key: json.dumps(value) if isinstance(value, (dict, list)) else value for key, value in row.items()}
+
+    def write(self, points):
+        rows = {}
+        for point in points:
+            rows.setdefault(point['measurement'], []).append(self.to_row(point))
+
+        for measurement, measurement_rows in rows.items():
+            if measurement not in self.files:
+                self.files[measurement] = Rotating_file(self.folder, f'{measurement}_{{date}}.csv',
+                                                        retention_days=config['log_retention_days'])
+            write_csv_rows(self.files[measurement], measurement_rows, list(measurement_rows[0]), self.headers)
+
+    def close(self):
+        for writer in self.files.values():
+            writer.close()
+
+
+class Stdout_sink:
+
+    remote = False
+
+    def __init__(self, arg, log_folder):
+        if arg not in (None, 'json', 'line'):
+            raise Sink_unavailable(f'unknown stdout format: {arg}')
+        self.as_json = arg == 'json'
+
+    def write(self, points):
+        lines = [json.dumps(point) for point in points] if self.as_json else to_line_protocol(points)
+        sys.stdout.write(''.join(f'{line}\n' for line in lines))
+        sys.stdout.flush()
+
+    def close(self):
+        pass
+
+
+sink_types = {
+    'influxdb': Influxdb_sink,
+    'influx_http': Influx_http_sink,
+    'jsonl': Jsonl_sink,
+    'csv': Csv_sink,
+    'stdout': Stdout_sink,
+}
+
+
+def parse_sink(spec):
+    '''
+    'name' or 'name:arg', for argparse
+    '''
+    name, _, arg = spec.partition(':')
+    if name not in sink_types:
+        raise ValueError(f'unknown sink: {name}')
+    return spec
+
+
+def open_sinks(specs, log_folder):
+    '''
+    {spec: sink} of every spec which could be opened
+    '''
+    sinks = {}
+    for spec in specs:
+        name, _, arg = spec.partition(':')
+        try:
+            sinks[spec] = sink_types[name](arg or None, log_folder)
+        except Sink_unavailable as e:
+            print(f'\n==> {e}, sink {name} is disabled.')
+    return sinks
@@ -0,0 +1,226 @@
+import os
+import json
+import zlib
+import struct
+import pickle
+import threading
+from pathlib import Path
+
+
+class Spool:
+    '''
+    segmented append-only on-disk queue of records for the db,
+    each record is [length][crc32][json payload], reading starts from the acknowledged offset
+    '''
+
+    record_header = struct.Struct('<II')
+    segment_prefix = 'segment_'
+
+    def __init__(self, folder, segment_bytes=16 * 1024 * 1024, fsync=False):
+        self.folder = Path(folder)
+        if not self.folder.exists():
+            self.folder.mkdir(parents=True)
+
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.offset_file = self.folder.joinpath('offset')
+        self.quarantine_file = self.folder.joinpath('quarantine')
+        self.lock = threading.Lock()
+
+        segments = self.segments()
+        self.write_segment = segments[-1] if segments else 1
+        self.recover(self.write_segment)
+        self.write_file = open(self.segment_path(self.write_segment), 'ab')
+
+        self.read_position = self.load_offset()
+
+    def segment_path(self, number):
+        return self.folder.joinpath(f'{self.segment_prefix}{number:08d}')
+
+    def segments(self):
+        return sorted(int(f.name[len(self.segment_prefix):]) for f in self.folder.iterdir()
+                      if f.name.startswith(self.segment_prefix))
+
+    def recover(self, number):
+        # cut a torn record left by a crash in the middle of append
+        path = self.segment_path(number)
+        if not path.exists():
+            return
+        with open(path, 'rb') as f:
+            _, end = self.read_records(f, 0, float('inf'))
+        if end < path.stat().st_size:
+            print(f'==> spool: truncating torn tail of {path.name} at {end} bytes.')
+            with open(path, 'r+b') as f:
+                f.truncate(end)
+
+    def load_offset(self):
+        try:
+            segment, offset = self.offset_file.read_text().split()
+            return int(segment), int(offset)
+        except (FileNotFoundError, ValueError):
+            segments = self.segments()
+            return (segments[0] if segments else self.write_segment), 0
+
+    def read_records(self, f, offset, max_records):
+        records = []
+        f.seek(offset)
+        while len(records) < max_records:
+            header = f.read(self.record_header.size)
+            if len(header) < self.record_header.size:
+                break
+            length, checksum = self.record_header.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                break
+            records.append(json.loads(payload))
+            offset += self.record_header.size + length
+        return records, offset
+
+    def append(self, records):
+        chunks = []
+        for record in records:
+            payload = json.dumps(record).encode('utf8')
+            chunks.append(self.record_header.pack(len(payload), zlib.crc32(payload)))
+            chunks.append(payload)
+
+        with self.lock:
+            self.write_file.write(b''.join(chunks))
+            self.write_file.flush()
+            if self.fsync:
+                os.fsync(self.write_file.fileno())
+
+            if self.write_file.tell() >= self.segment_bytes:
+                self.write_file.close()
+                self.write_segment += 1
+                self.write_file = open(self.segment_path(self.write_segment), 'ab')
+
+    def read(self, max_records):
+        '''
+        return (records, position) after the acknowledged offset, pass position to ack() when sent
+        '''
+        with self.lock:
+            segment, offset = self.read_position
+            while True:
+                path = self.segment_path(segment)
+                records, end = [], offset
+                if path.exists():
+                    with open(path, 'rb') as f:
+                        records, end = self.read_records(f, offset, max_records)
+                if records or segment >= self.write_segment:
+                    return records, (segment, end)
+
+                if path.exists() and end < path.stat().st_size:
+                    print(f'==> spool: skipping corrupted records in {path.name} from {end} bytes.')
+                # this segment is done, go on with the next one
+                segment, offset = segment + 1, 0
+
+    def ack(self, position):
+        with self.lock:
+            self.read_position = position
+            tmp_file = self.offset_file.with_suffix('.tmp')
+            tmp_file.write_text(f'{position[0]} {position[1]}\n')
+            os.replace(tmp_file, self.offset_file)
+
+            for number in self.segments():
+                if number < position[0]:
+                    self.segment_path(number).unlink()
+
+    @property
+    def size(self):
+        '''
+        bytes not yet acknowledged
+        '''
+        segment, offset = self.read_position
+        total = 0
+        for number in self.segments():
+            if number >= segment:
+                total += self.segment_path(number).stat().st_size
+        return max(total - offset, 0)
+
+    def quarantine(self, records):
+        '''
+        set aside records the db refuses, one json per line, for a look by hand
+        '''
+        with self.lock, open(self.quarantine_file, 'a') as f:
+            f.write(''.join(f'{json.dumps(record)}\n' for record in records))
+
+    def import_pickle(self, file):
+        # migrate the send_fail file of older versions
+        with open(file, 'rb') as f:
+            records = pickle.load(f)
+        self.append(records)
+        Path(file).unlink()
+        print(f'==> spool: imported {len(records)} records from {file}.')
+
+    def close(self):
+        with self.lock:
+            self.write_file.close()
+
+
+def is_rejected(error):
+    '''
+    True when the db refused the records themselves (http 4xx, a malformed point),
+    sending them again can never succeed unlike a transport error or a 5xx
+    '''
+    if isinstance(error, (ValueError, TypeError)):
+        return True
+    # requests.HTTPError of Influx_http_sink, InfluxDBClientError of the influxdb client
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None) or getattr(error, 'code', None)
+    return isinstance(status, int) and 400 <= status < 500
+
+
+class Spool_replayer:
+    '''
+    background thread sending the spool to the db in bounded chunks,
+    backs off while the db keeps failing, a chunk the db rejects is quarantined and skipped
+    '''
+
+    def __init__(self, spool, send, chunk_size, interval, max_interval=300, start=True):
+        self.spool = spool
+        self.send = send
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self.max_interval = max_interval
+        self.quarantined = 0
+        self.stop_event = threading.Event()
+
+        self.thread = threading.Thread(target=self.loop, name='spool_replayer', daemon=True)
+        if start:
+            self.thread.start()
+
+    def replay_once(self):
+        records, position = self.spool.read(self.chunk_size)
+        if not records:
+            return False
+        try:
+            self.send(records)
+        except Exception as e:
+            if not is_rejected(e):
+                raise
+            # a poison chunk would block the spool forever, move past it
+            self.spool.quarantine(records)
+            self.spool.ack(position)
+            self.quarantined += len(records)
+            print(f'==> spool: {len(records)} records rejected by db, {e.__class__} {e}, '
+                  f'moved to {self.spool.quarantine_file}.')
+            return True
+        self.spool.ack(position)
+        print(f'==> spool: {len(records)} records replayed, {self.spool.size} bytes left.')
+        return True
+
+    def loop(self):
+        wait = self.interval
+        while not self.stop_event.wait(wait):
+            try:
+                while not self.stop_event.is_set() and self.replay_once():
+                    pass
+                wait = self.interval
+            except Exception as e:
+                print(f'==> spool: replay failed, {e.__class__} {e}')
+                wait = min(wait * 2, self.max_interval)
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=5)
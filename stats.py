@@ -0,0 +1,197 @@
+import math
+import random
+from array import array
+from collections import Counter
+
+# numpy is optional, percentiles fall back to one sort per field
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
+
+from records import split_record
+
+percentiles = (50, 95, 99)
+
+# integer fields reported as a distribution as well
+categorical_fields = ('rx_mcs', 'tx_mcs', 'nss')
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    low = math.floor(k)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (k - low)
+
+
+class P2_quantile:
+    '''
+    streaming quantile estimate of Jain & Chlamtac (P²), five markers instead of the samples
+    '''
+
+    def __init__(self, q):
+        self.q = q
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5]
+        self.increments = [0, q / 2, q, (1 + q) / 2, 1]
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if self.count <= 5:
+            self.heights.append(value)
+            self.heights.sort()
+            return
+
+        h, n = self.heights, self.positions
+        if value < h[0]:
+            h[0] = value
+            k = 0
+        elif value >= h[4]:
+            h[4] = value
+            k = 3
+        else:
+            k = next(i for i in range(4) if h[i] <= value < h[i + 1])
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                # parabolic prediction, linear when it would break the marker order
+                height = h[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1]))
+                if not h[i - 1] < height < h[i + 1]:
+                    height = h[i] + d * (h[i + d] - h[i]) / (n[i + d] - n[i])
+                h[i] = height
+                n[i] += d
+
+    @property
+    def value(self):
+        if not self.heights:
+            return None
+        if self.count <= 5:
+            ordered = self.heights
+            return ordered[min(int(self.q * len(ordered)), len(ordered) - 1)]
+        return self.heights[2]
+
+
+class Field_stats:
+    '''
+    samples of one field in a preallocated typed array, switches to a uniform reservoir
+    after max_samples; count/mean/std/min/max and time-weighted mean stay exact
+    '''
+
+    def __init__(self, capacity, max_samples):
+        self.max_samples = max_samples
+        self.values = array('d', bytes(8 * min(max(capacity, 16), max_samples)))
+        self.stored = 0
+
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+        self.prev = None
+        self.weighted_sum = 0.0
+        self.weighted_secs = 0.0
+
+    def add(self, value, ts):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+        # each value holds until the next sample
+        if self.prev is not None:
+            dt = ts - self.prev[0]
+            self.weighted_sum += self.prev[1] * dt
+            self.weighted_secs += dt
+        self.prev = (ts, value)
+
+        if self.stored < len(self.values):
+            self.values[self.stored] = value
+            self.stored += 1
+        elif self.stored < self.max_samples:
+            self.values.frombytes(bytes(8 * min(len(self.values), self.max_samples - len(self.values))))
+            self.values[self.stored] = value
+            self.stored += 1
+        else:
+            i = random.randrange(self.count)
+            if i < self.stored:
+                self.values[i] = value
+
+    def summary(self):
+        if not self.count:
+            return {}
+
+        samples = self.values[:self.stored]
+        if numpy is not None:
+            quantiles = numpy.percentile(numpy.frombuffer(samples, dtype='<f8'), percentiles).tolist()
+        else:
+            ordered = sorted(samples)
+            quantiles = [_percentile(ordered, p) for p in percentiles]
+
+        result = {
+            'avg': self.mean,
+            'min': self.min,
+            'max': self.max,
+            # population std, same as ping's mdev
+            'std': math.sqrt(self.m2 / self.count),
+            'twa': self.weighted_sum / self.weighted_secs if self.weighted_secs else self.mean,
+        }
+        for p, value in zip(percentiles, quantiles):
+            result[f'p{p}'] = value
+        return {key: round(value, 3) for key, value in result.items()}
+
+
+class Run_stats:
+    '''
+    summary statistics of every numeric field in the sample records of a run
+    '''
+
+    def __init__(self, capacity, max_samples):
+        self.capacity = capacity
+        self.max_samples = max_samples
+        self.fields = {}
+        self.distributions = {name: Counter() for name in categorical_fields}
+        self.count = 0
+
+    def add(self, fields, ts):
+        self.count += 1
+        for name, value in split_record({'fields': fields})[1].items():
+            if value is None:
+                continue
+            if name not in self.fields:
+                self.fields[name] = Field_stats(self.capacity, self.max_samples)
+            self.fields[name].add(value, ts)
+            if name in self.distributions:
+                self.distributions[name][value] += 1
+
+    def field(self, name):
+        return self.fields[name].summary() if name in self.fields else {}
+
+    def summary(self):
+        '''
+        flat {field_stat: value}, plus {field_dist: {value: share}} for categorical fields
+        '''
+        result = {}
+        for name, field_stats in self.fields.items():
+            for stat, value in field_stats.summary().items():
+                result[f'{name}_{stat}'] = value
+        for name, counter in self.distributions.items():
+            total = sum(counter.values())
+            if total:
+                result[f'{name}_dist'] = {str(value): round(count / total, 3)
+                                          for value, count in sorted(counter.items())}
+        return result
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+repo_folder = Path(__file__).resolve().parent.parent
+# flat modules of the repo and the fakes of bench/
+sys.path.insert(0, str(repo_folder))
+sys.path.insert(0, str(repo_folder.joinpath('bench')))
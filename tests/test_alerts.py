@@ -0,0 +1,122 @@
+from time import sleep
+
+import pytest
+
+from fake_webhook import Fake_webhook
+from alerts import Alert_rule, Percentile_rule, Drop_rule, Alert_engine, Alert_notifier, make_rule
+
+
+@pytest.fixture
+def webhook():
+    webhook = Fake_webhook().start()
+    yield webhook
+    webhook.close()
+
+
+def states(rule, samples):
+    '''
+    [(ts, state)] of the changes of state over [(ts, value)]
+    '''
+    return [(ts, state) for ts, value in samples if (state := rule.update(value, ts)) is not None]
+
+
+def test_threshold_holds_for_secs_before_firing():
+    rule = Alert_rule('weak_signal', 'signal', '<', -75, for_secs=10)
+    # a good sample at 5 s starts the hold over
+    samples = [(ts, -80) for ts in range(5)] + [(5, -70)] + [(ts, -80) for ts in range(6, 20)] + [(20, -60)]
+    assert states(rule, samples) == [(16, 'firing'), (20, 'resolved')]
+    assert rule.alert('resolved')['condition'] == 'signal < -75 for 10 s'
+
+
+def test_percentile_over_window():
+    rule = Percentile_rule('slow_ping', 'latency', '>', 50, p=95, window_secs=30, min_samples=5)
+    samples = [(ts, 10.0) for ts in range(10)] + [(ts, 120.0) for ts in range(10, 20)]
+    # the whole window has to move past the slow samples to resolve it
+    samples += [(ts, 10.0) for ts in range(20, 60)]
+    changes = states(rule, samples)
+    assert [state for _, state in changes] == ['firing', 'resolved']
+    firing_ts, resolved_ts = (ts for ts, _ in changes)
+    assert 10 <= firing_ts < 12
+    assert 45 <= resolved_ts <= 51
+    assert rule.last < 50
+
+
+def test_drop_below_run_median():
+    rule = Drop_rule('throughput_drop', 'throughput', ratio=0.5, for_secs=5, min_samples=10)
+    samples = [(ts, 100.0) for ts in range(20)] + [(ts, 40.0) for ts in range(20, 30)]
+    assert states(rule, samples) == [(25, 'firing')]
+    # half the run median, which the drop itself pulls down a little
+    assert 45 < rule.threshold <= 50
+
+
+def test_make_rule_of_config():
+    rule = make_rule({'kind': 'percentile', 'name': 'slow_ping', 'field': 'latency', 'op': '>', 'value': 50})
+    assert isinstance(rule, Percentile_rule)
+    assert isinstance(make_rule({'name': 'weak_signal', 'field': 'signal', 'op': '<', 'value': -75}), Alert_rule)
+
+
+def test_engine_posts_each_kind_to_webhook(webhook):
+    engine = Alert_engine([
+        make_rule({'kind': 'threshold', 'name': 'weak_signal', 'field': 'signal', 'op': '<', 'value': -75,
+                   'for_secs': 2}),
+        make_rule({'kind': 'percentile', 'name': 'slow_ping', 'field': 'latency', 'op': '>', 'value': 50,
+                   'window_secs': 10}),
+        make_rule({'kind': 'drop', 'name': 'throughput_drop', 'field': 'throughput', 'ratio': 0.5, 'for_secs': 2}),
+    ])
+    notifier = Alert_notifier(webhook.url, batch_secs=0.2, min_interval=60)
+    for ts in range(15):
+        fields = {'signal': -60, 'latency': 5.0, 'throughput': 100.0} if ts < 10 else \
+            {'signal': -80, 'latency': 200.0, 'throughput': 10.0}
+        for alert in engine.evaluate(fields, ts):
+            notifier.notify({**alert, 'interface': 'wlan0'})
+    notifier.close(timeout=5)
+
+    assert engine.fired == 3
+    assert sorted((alert['rule'], alert['state']) for alert in webhook.alerts) == [
+        ('slow_ping', 'firing'), ('throughput_drop', 'firing'), ('weak_signal', 'firing')]
+    assert notifier.sent == 3
+    assert notifier.failures == 0
+
+
+def test_notifier_batches_and_collapses(webhook):
+    notifier = Alert_notifier(webhook.url, batch_secs=0.3, min_interval=0)
+    for value in (1, 2, 3):
+        notifier.notify({'interface': 'wlan0', 'rule': 'weak_signal', 'state': 'firing', 'value': value})
+    notifier.notify({'interface': 'wlan1', 'rule': 'weak_signal', 'state': 'firing', 'value': 4})
+    notifier.close(timeout=5)
+
+    # one post, the same interface / rule / state collapsed into its latest alert
+    assert webhook.posts == 1
+    assert [(alert['interface'], alert['value']) for alert in webhook.alerts] == [('wlan0', 3), ('wlan1', 4)]
+
+
+def test_notifier_suppresses_within_min_interval(webhook):
+    notifier = Alert_notifier(webhook.url, batch_secs=0.05, min_interval=1.0)
+
+    def notify(state):
+        notifier.notify({'interface': 'wlan0', 'rule': 'weak_signal', 'state': state})
+        sleep(0.2)
+
+    notify('firing')
+    notify('resolved')
+    # flapping within min_interval: held back, and so is its resolved
+    notify('firing')
+    notify('resolved')
+    sleep(0.8)
+    notify('firing')
+    notifier.close(timeout=5)
+
+    assert [alert['state'] for alert in webhook.alerts] == ['firing', 'resolved', 'firing']
+    assert webhook.alerts[-1]['suppressed'] == 1
+    assert notifier.suppressed == 1
+
+
+def test_slow_webhook_never_blocks_notify():
+    webhook = Fake_webhook(latency=0.5).start()
+    notifier = Alert_notifier(webhook.url, batch_secs=0, min_interval=0, queue_size=2)
+    for index in range(10):
+        notifier.notify({'interface': 'wlan0', 'rule': f'rule_{index}', 'state': 'firing'})
+    # queue full while the first post waits, the rest is dropped instead of waiting
+    assert notifier.dropped >= 7
+    notifier.close(timeout=5)
+    webhook.close()
@@ -0,0 +1,126 @@
+import gzip
+import json
+import threading
+
+import backfill
+from backfill import Checkpoint, iter_chunks, backfill_file, log_files
+
+
+def write_log(path, count, start=0):
+    lines = [json.dumps({'measurement': 'wifi_test', 'time': 1700000000 + n, 'fields': {'n': n}}) + '\n'
+             for n in range(start, start + count)]
+    opener = gzip.open if path.suffix == '.gz' else open
+    with opener(path, 'at') as f:
+        f.write(''.join(lines))
+    return path
+
+
+def numbers(chunk):
+    return [record['fields']['n'] for record in chunk]
+
+
+class Sender:
+    '''
+    stands in for _send_chunk, fails from the fail_at-th chunk on
+    '''
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.chunks = []
+        self.lock = threading.Lock()
+
+    def __call__(self, db_params, chunk):
+        with self.lock:
+            if self.fail_at is not None and len(self.chunks) >= self.fail_at:
+                raise ConnectionError('db is down')
+            self.chunks.append(numbers(chunk))
+        return len(chunk)
+
+
+def test_checkpoint_round_trip(tmp_path):
+    log = write_log(tmp_path.joinpath('log_2024-01-01'), 3)
+    checkpoint = Checkpoint(tmp_path, log)
+    assert checkpoint.load() == 0
+    checkpoint.save(42)
+    assert Checkpoint(tmp_path, log).load() == 42
+
+
+def test_checkpoint_of_rewritten_file_restarts(tmp_path):
+    log = write_log(tmp_path.joinpath('log_2024-01-01'), 3)
+    checkpoint = Checkpoint(tmp_path, log)
+    checkpoint.save(log.stat().st_size + 100)
+    assert checkpoint.load() == 0
+
+
+def test_checkpoint_of_gzipped_log_counts_uncompressed_bytes(tmp_path):
+    log = write_log(tmp_path.joinpath('log_2024-01-01.gz'), 50)
+    chunks = list(iter_chunks(log, 0, 20))
+    end_offset = chunks[-1][1]
+    assert end_offset > log.stat().st_size
+
+    checkpoint = Checkpoint(tmp_path, log)
+    checkpoint.save(chunks[0][1])
+    assert checkpoint.load() == chunks[0][1]
+    assert numbers(next(iter_chunks(log, checkpoint.load(), 100))[0]) == list(range(20, 50))
+
+
+def test_iter_chunks_resumes_from_offset(tmp_path):
+    log = write_log(tmp_path.joinpath('log_2024-01-01'), 7)
+    chunks = list(iter_chunks(log, 0, 3))
+    assert [numbers(chunk) for chunk, _ in chunks] == [[0, 1, 2], [3, 4, 5], [6]]
+    assert chunks[-1][1] == log.stat().st_size
+
+    assert [numbers(chunk) for chunk, _ in iter_chunks(log, chunks[0][1], 3)] == [[3, 4, 5], [6]]
+
+
+def test_failed_backfill_resumes_after_last_sent_chunk(tmp_path, monkeypatch):
+    log = write_log(tmp_path.joinpath('log_2024-01-01'), 10)
+    checkpoints = tmp_path.joinpath('backfill')
+    checkpoints.mkdir()
+
+    sender = Sender(fail_at=2)
+    monkeypatch.setattr(backfill, '_send_chunk', sender)
+    _, sent, ok = backfill_file(log, {}, checkpoints, chunk_size=3, send_threads=1)
+    assert not ok
+    assert sent == 6
+    assert sender.chunks == [[0, 1, 2], [3, 4, 5]]
+
+    sender = Sender()
+    monkeypatch.setattr(backfill, '_send_chunk', sender)
+    _, sent, ok = backfill_file(log, {}, checkpoints, chunk_size=3, send_threads=1)
+    assert ok
+    assert sender.chunks == [[6, 7, 8], [9]]
+    assert Checkpoint(checkpoints, log).load() == log.stat().st_size
+
+    # nothing left on a third run
+    _, sent, ok = backfill_file(log, {}, checkpoints, chunk_size=3, send_threads=1)
+    assert (sent, ok) == (0, True)
+
+
+def test_checkpoint_waits_for_earlier_chunks(tmp_path, monkeypatch):
+    log = write_log(tmp_path.joinpath('log_2024-01-01'), 6)
+    checkpoints = tmp_path.joinpath('backfill')
+    checkpoints.mkdir()
+    first_sent = threading.Event()
+    saved = []
+
+    def send(db_params, chunk):
+        if numbers(chunk)[0] == 0:
+            # the first chunk is the slow one
+            first_sent.wait(2)
+            raise ConnectionError('db is down')
+        first_sent.set()
+        return len(chunk)
+
+    monkeypatch.setattr(backfill, '_send_chunk', send)
+    monkeypatch.setattr(Checkpoint, 'save', lambda self, offset: saved.append(offset))
+    _, sent, ok = backfill_file(log, {}, checkpoints, chunk_size=3, send_threads=2)
+    # the second chunk was sent but the checkpoint never moves past the failed first one
+    assert not ok
+    assert saved == []
+
+
+def test_log_files_of_folder(tmp_path):
+    for name in ('log_2024-01-02', 'log_2024-01-01.gz', 'log_2024-01-03.tmp', 'summary.csv'):
+        tmp_path.joinpath(name).write_text('')
+    assert [file.name for file in log_files(tmp_path)] == ['log_2024-01-01.gz', 'log_2024-01-02']
@@ -0,0 +1,101 @@
+import threading
+from time import sleep, monotonic
+
+import pytest
+
+from batch_writer import Batch_writer
+
+
+class Recorder:
+
+    def __init__(self, delay=0.0, fail=False):
+        self.batches = []
+        self.calls = 0
+        self.delay = delay
+        self.fail = fail
+        self.lock = threading.Lock()
+
+    def __call__(self, batch):
+        self.calls += 1
+        sleep(self.delay)
+        if self.fail:
+            raise ConnectionError('db is down')
+        with self.lock:
+            self.batches.append(list(batch))
+
+
+def test_flush_by_size_then_by_interval():
+    send = Recorder()
+    writer = Batch_writer(send, batch_size=5, flush_interval=0.3, queue_size=100)
+    writer.put_many(range(7))
+    sleep(0.1)
+    # a full batch goes at once, the rest waits for the interval
+    assert send.batches == [[0, 1, 2, 3, 4]]
+    sleep(0.4)
+    assert send.batches == [[0, 1, 2, 3, 4], [5, 6]]
+    writer.close(timeout=2)
+
+
+def test_close_drains_in_batches():
+    send = Recorder()
+    writer = Batch_writer(send, batch_size=4, flush_interval=60, queue_size=100)
+    writer.put_many(range(3))
+    writer.put_many(range(3, 10))
+    writer.close(timeout=2)
+    assert [point for batch in send.batches for point in batch] == list(range(10))
+    assert all(len(batch) <= 4 for batch in send.batches)
+    assert not writer.thread.is_alive()
+
+
+@pytest.mark.parametrize('policy, kept', [('drop_oldest', [2, 3, 4]), ('drop_newest', [0, 1, 2])])
+def test_overflow_policy(policy, kept):
+    writer = Batch_writer(Recorder(), batch_size=10, flush_interval=60, queue_size=3,
+                          overflow_policy=policy, start=False)
+    writer.put_many(range(5))
+    assert writer.dropped == 2
+    assert writer.drain(10) == kept
+
+
+def test_block_policy_waits_for_the_db():
+    send = Recorder(delay=0.2)
+    writer = Batch_writer(send, batch_size=1, flush_interval=0.01, queue_size=1, overflow_policy='block')
+    start = monotonic()
+    writer.put_many(range(4))
+    assert monotonic() - start >= 0.2
+    writer.close(timeout=5)
+    assert writer.dropped == 0
+    assert [point for batch in send.batches for point in batch] == [0, 1, 2, 3]
+
+
+def test_send_error_keeps_the_thread_running():
+    send = Recorder(fail=True)
+    writer = Batch_writer(send, batch_size=2, flush_interval=0.05, queue_size=10)
+    writer.put_many(range(2))
+    deadline = monotonic() + 2
+    # the failed flush is over
+    while (not send.calls or writer.is_flushing) and monotonic() < deadline:
+        sleep(0.01)
+    assert writer.thread.is_alive()
+    send.fail = False
+    writer.put_many(range(2, 4))
+    writer.close(timeout=2)
+    assert send.batches == [[2, 3]]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        Batch_writer(Recorder(), 1, 1, 1, overflow_policy='spill')
+
+
+def test_influx_http_sink_reuses_one_connection():
+    from fake_influxdb import Fake_influxdb
+    from sinks import Influx_http_sink
+
+    db = Fake_influxdb().start()
+    sink = Influx_http_sink(f'http://127.0.0.1:{db.port}/write?db=test', None)
+    for _ in range(3):
+        sink.write([{'measurement': 'wifi_test', 'time': '2026-01-01 00:00:00', 'fields': {'signal': -50}}])
+    sink.close()
+    db.close()
+    assert db.stats()['writes'] == 3
+    assert db.stats()['connections'] == 1
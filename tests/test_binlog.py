@@ -0,0 +1,121 @@
+import json
+import math
+
+from binlog import Binlog_writer, Binlog_reader, json_to_binlog, binlog_to_json, suffix, strings_suffix
+
+
+def sample(n, **fields):
+    return {
+        'measurement': 'wifi_test',
+        'time': f'2024-01-01 00:00:{n:02d}.500000',
+        'fields': {'location': 'lab', 'ssid': 'ap', 'channel': '36', 'signal': -40 - n,
+                   'rx_bitrate': 866.7, 'latency': None, **fields},
+    }
+
+
+def segments(folder, measurement='wifi_test'):
+    return sorted(folder.glob(f'*_{measurement}{suffix}'))
+
+
+def read_all(folder, measurement='wifi_test'):
+    records = []
+    for path in segments(folder, measurement):
+        reader = Binlog_reader(path)
+        records += list(reader)
+        reader.close()
+    return records
+
+
+def test_round_trip(tmp_path):
+    records = [sample(n, bssid=f'aa:bb:cc:00:00:0{n % 2}', roaming=bool(n % 2)) for n in range(5)]
+    writer = Binlog_writer(tmp_path, 'log_2024-01-01')
+    writer.write(records)
+    writer.close()
+
+    assert read_all(tmp_path) == records
+    # one segment for every record although bssid and roaming change
+    assert len(segments(tmp_path)) == 1
+
+
+def test_missing_fields_are_nan_in_the_same_segment(tmp_path):
+    writer = Binlog_writer(tmp_path, 'log_2024-01-01')
+    writer.write([sample(0, throughput=500.0), sample(1)])
+    writer.close()
+
+    assert len(segments(tmp_path)) == 1
+    reader = Binlog_reader(segments(tmp_path)[0])
+    # copied out, a view left on the map keeps it from closing
+    throughput = list(reader.columns()['throughput'])
+    assert throughput[0] == 500.0
+    assert math.isnan(throughput[1])
+    assert list(reader)[1]['fields']['throughput'] is None
+    reader.close()
+
+
+def test_new_field_or_type_evolves_the_schema(tmp_path):
+    writer = Binlog_writer(tmp_path, 'log_2024-01-01')
+    writer.write([sample(0), sample(1, throughput=500)])
+    # an int column widened to float
+    writer.write([sample(2, throughput=512.5)])
+    writer.write([sample(3, throughput=100)])
+    writer.close()
+
+    assert len(segments(tmp_path)) == 3
+    records = read_all(tmp_path)
+    assert [record['fields'].get('throughput') for record in records] == [None, 500, 512.5, 100.0]
+    assert isinstance(records[1]['fields']['throughput'], int)
+    # the later segments keep the columns of the earlier ones
+    reader = Binlog_reader(segments(tmp_path)[-1])
+    assert reader.fields == ['location', 'ssid', 'channel', 'signal', 'rx_bitrate', 'latency', 'throughput']
+    reader.close()
+
+
+def test_measurements_have_their_own_segments(tmp_path):
+    scans = [{'measurement': 'wifi_scan', 'time': '2024-01-01 00:00:00',
+              'fields': {'bssid': f'aa:bb:cc:00:00:{n:02x}', 'ssid': f'ap{n}', 'signal': -50 - n}}
+             for n in range(20)]
+    writer = Binlog_writer(tmp_path, 'log_2024-01-01')
+    writer.write([sample(0)] + scans + [sample(1)])
+    writer.close()
+
+    assert len(segments(tmp_path)) == 1
+    assert len(segments(tmp_path, 'wifi_scan')) == 1
+    assert read_all(tmp_path, 'wifi_scan') == scans
+    strings = segments(tmp_path, 'wifi_scan')[0]
+    assert len(strings.with_name(strings.name + strings_suffix).read_text().splitlines()) == 40
+
+
+def test_torn_last_record_is_ignored(tmp_path):
+    writer = Binlog_writer(tmp_path, 'log_2024-01-01')
+    writer.write([sample(0), sample(1)])
+    writer.close()
+    path = segments(tmp_path)[0]
+    with open(path, 'ab') as f:
+        f.write(b'\x00' * 12)
+
+    reader = Binlog_reader(path)
+    assert len(reader) == 2
+    reader.close()
+
+
+def test_iter_with_offset_resumes(tmp_path):
+    writer = Binlog_writer(tmp_path, 'log_2024-01-01')
+    writer.write([sample(n) for n in range(4)])
+    writer.close()
+
+    reader = Binlog_reader(segments(tmp_path)[0])
+    offsets = [offset for offset, _ in reader.iter_with_offset()]
+    resumed = [record['fields']['signal'] for _, record in reader.iter_with_offset(offsets[1])]
+    assert resumed == [-42, -43]
+    reader.close()
+
+
+def test_json_conversion_round_trip(tmp_path):
+    records = [sample(n, bssid='aa:bb:cc:00:00:01') for n in range(3)]
+    src = tmp_path.joinpath('log_2024-01-01')
+    src.write_text(''.join(f'{json.dumps(record)}\n' for record in records))
+
+    assert json_to_binlog(src) == 3
+    dst = tmp_path.joinpath('back')
+    assert binlog_to_json(segments(tmp_path)[0], dst) == 3
+    assert [json.loads(line) for line in dst.read_text().splitlines()] == records
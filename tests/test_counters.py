@@ -0,0 +1,79 @@
+from link_stats import Station_info
+from counters import Counter_differ, passive_throughput, rate_fields
+
+
+def station(bssid='aa:bb:cc:00:00:01', **counters):
+    values = {'rx_bytes': 0, 'tx_bytes': 0, 'rx_packets': 0, 'tx_packets': 0, 'tx_retries': 0, 'tx_failed': 0,
+              'rx_bitrate': 100.0, 'tx_bitrate': 100.0}
+    values.update(counters)
+    return Station_info(interface='wlo1', bssid=bssid, **values)
+
+
+def test_first_sample_has_no_rates():
+    assert Counter_differ().update(station(), 0) == dict.fromkeys(rate_fields)
+
+
+def test_rates_of_an_interval():
+    differ = Counter_differ()
+    differ.update(station(), 0)
+    rates = differ.update(station(rx_bytes=1_250_000, tx_bytes=250_000, rx_packets=1000, tx_packets=300,
+                                  tx_retries=100, tx_failed=3), 1)
+    assert rates['rx_goodput'] == 10.0
+    assert rates['tx_goodput'] == 2.0
+    assert (rates['rx_pps'], rates['tx_pps']) == (1000.0, 300.0)
+    assert rates['tx_retry_ratio'] == 0.25
+    assert rates['tx_fail_ratio'] == 0.01
+    # 10 + 2 Mbit at 100 Mbit/s
+    assert rates['airtime'] == 0.12
+    assert passive_throughput(rates) == 12.0
+
+
+def test_32_bit_counter_wraps():
+    differ = Counter_differ(wrap_margin=0.01)
+    top = 1 << 32
+    differ.update(station(rx_packets=top - 100), 0)
+    rates = differ.update(station(rx_packets=50), 1)
+    assert rates['rx_pps'] == 150.0
+    assert (differ.wraps, differ.resets) == (1, 0)
+
+
+def test_counter_going_back_far_from_the_top_is_a_reset():
+    differ = Counter_differ(wrap_margin=0.01)
+    differ.update(station(rx_bytes=5_000_000, rx_packets=4000), 0)
+    rates = differ.update(station(rx_bytes=1000, rx_packets=10, tx_bytes=125_000), 1)
+    # unknown for the interval, not a huge or negative rate
+    assert rates['rx_goodput'] is None
+    assert rates['rx_pps'] is None
+    assert rates['airtime'] is None
+    assert rates['tx_goodput'] == 1.0
+    assert differ.resets == 2
+
+    # the next interval counts from the reset values
+    assert differ.update(station(rx_bytes=126_000, rx_packets=10, tx_bytes=125_000), 2)['rx_goodput'] == 1.0
+
+
+def test_new_bssid_starts_over():
+    differ = Counter_differ()
+    differ.update(station(rx_bytes=1_000_000), 0)
+    rates = differ.update(station(bssid='aa:bb:cc:00:00:02', rx_bytes=10), 1)
+    assert rates == dict.fromkeys(rate_fields)
+    assert differ.resets == 0
+    assert differ.update(station(bssid='aa:bb:cc:00:00:02', rx_bytes=125_010), 2)['rx_goodput'] == 1.0
+
+
+def test_reset_and_same_timestamp():
+    differ = Counter_differ()
+    differ.update(station(), 5)
+    # a sample of the same instant has no interval
+    assert differ.update(station(rx_bytes=100), 5)['rx_goodput'] is None
+    differ.reset()
+    assert differ.update(station(rx_bytes=200), 6) == dict.fromkeys(rate_fields)
+
+
+def test_missing_counters():
+    differ = Counter_differ()
+    differ.update(station(tx_retries=None), 0)
+    rates = differ.update(station(tx_packets=100, tx_retries=None), 1)
+    assert rates['tx_pps'] == 100.0
+    assert rates['tx_retry_ratio'] is None
+    assert passive_throughput(dict.fromkeys(rate_fields)) is None
@@ -0,0 +1,38 @@
+import random
+
+from fusion import Sample_stream, fuse_nearest
+
+
+def test_fuse_nearest_takes_the_sample_closest_to_the_middle_of_the_window():
+    stream = Sample_stream('ping')
+    for ts, value in ((0.9, 1), (1.4, 2), (1.6, 3), (2.0, 4)):
+        stream.put((ts, value))
+    assert fuse_nearest(stream, 1.0, 2.0) == 2
+
+
+def test_fuse_nearest_is_none_without_a_sample_within_a_period():
+    stream = Sample_stream('ping')
+    # older than one period before the window
+    stream.put((0.0, 1))
+    assert fuse_nearest(stream, 1.0, 2.0) is None
+    stream.put((2.0, 3))
+    assert fuse_nearest(stream, 1.0, 2.0) == 3
+
+
+def test_fuse_nearest_looks_back_one_period_for_an_empty_window():
+    stream = Sample_stream('ping')
+    stream.put((0.95, 1))
+    assert fuse_nearest(stream, 1.0, 2.0) == 1
+
+
+def test_fuse_nearest_with_jittered_producer():
+    rng = random.Random(1)
+    stream = Sample_stream('ping')
+    # the producer runs at the tick period, each sample up to 40% of a period early or late
+    for k in range(1, 200):
+        stream.put((k + rng.uniform(-0.4, 0.4), k))
+
+    values = [fuse_nearest(stream, tick - 1.0, float(tick)) for tick in range(2, 200)]
+    assert None not in values
+    # never older than the tick before
+    assert all(tick - 2 <= value <= tick + 1 for tick, value in zip(range(2, 200), values))
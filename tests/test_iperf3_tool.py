@@ -0,0 +1,126 @@
+import json
+import queue
+
+import pytest
+
+from conftest import repo_folder
+from iperf3_tool import Iperf3_runner, parse_interval, flatten_interval
+
+json_stream = repo_folder.joinpath('bench', 'fixtures', 'iperf3_json_stream.txt').read_text()
+fixture_mbps = [570.0, 535.0, 436.0, 411.0, 526.0, 483.0, 467.0, 551.0, 556.0, 518.0]
+
+
+def make_runner(**kwargs):
+    options = dict(host='192.168.50.210', port=5201, tos=0, bitrate=0, reverse=False, udp=False, exec_secs=10,
+                   buffer_length=None, queue=queue.Queue(), detail_queue=queue.Queue(), output_mode='json')
+    options.update(kwargs)
+    return Iperf3_runner(**options)
+
+
+def drain(q):
+    items = []
+    while not q.empty():
+        items.append(q.get_nowait())
+    return items
+
+
+def interval_event(mbps, omitted=False, streams=()):
+    total = {'bits_per_second': mbps * 1e6, 'bytes': int(mbps * 125000), 'omitted': omitted, 'sender': True}
+    return {'event': 'interval', 'data': {'streams': list(streams), 'sum': total}}
+
+
+def test_parse_interval():
+    event = json.loads(json_stream.splitlines()[1])
+    record = parse_interval(event['data'])
+    assert record['throughput'] == 570.0
+    assert record['retransmits'] == 2
+    assert record['streams'] == [{'throughput': 570.0, 'retransmits': 2, 'snd_cwnd': 1245972,
+                                  'rtt_ms': 8.286, 'rttvar_ms': 1.15}]
+
+
+def test_flatten_interval():
+    stream = {'throughput': 250.0, 'retransmits': 1, 'snd_cwnd': 1000, 'rtt_ms': 4.0, 'rttvar_ms': None}
+    fields = flatten_interval({'retransmits': 2, 'jitter_ms': None, 'streams': [stream, dict(stream, rtt_ms=6.0)]})
+    assert fields['iperf_retransmits'] == 2
+    assert 'iperf_jitter_ms' not in fields
+    assert fields['iperf_rtt_ms'] == 5.0
+    assert fields['iperf_snd_cwnd'] == 2000
+    # every stream of a parallel test
+    assert fields['iperf_s1_rtt_ms'] == 6.0
+    assert 'iperf_s0_rttvar_ms' not in fields
+
+
+@pytest.mark.parametrize('chunk_size', (1, 7, 4096, len(json_stream)))
+def test_json_stream_split_over_reads(chunk_size):
+    runner = make_runner()
+    buffer = ''
+    for start in range(0, len(json_stream), chunk_size):
+        buffer = runner.feed_json(buffer + json_stream[start:start + chunk_size])
+    assert buffer == ''
+    assert [mbps for _, mbps in drain(runner.q)] == fixture_mbps
+    assert len(drain(runner.detail_q)) == 10
+    assert runner.end_summary['sum_sent']['retransmits'] == 7
+
+
+def test_omitted_interval_skipped_and_zero_kept():
+    runner = make_runner()
+    events = [interval_event(300, omitted=True), interval_event(0), interval_event(250)]
+    runner.feed_json(''.join(json.dumps(event) + '\n' for event in events))
+    assert [mbps for _, mbps in drain(runner.q)] == [0.0, 250.0]
+
+
+def test_text_between_events_is_skipped(capsys):
+    runner = make_runner()
+    rest = runner.feed_json('iperf3: error - unable to connect to server\n' + json.dumps(interval_event(100)) + '\n{"event"')
+    assert rest == '{"event"'
+    assert [mbps for _, mbps in drain(runner.q)] == [100.0]
+    assert 'unable to connect' in capsys.readouterr().out
+
+
+def test_build_cmd():
+    assert make_runner().build_cmd() == \
+        'iperf3 -c 192.168.50.210 -p 5201 -S 0 -b 0 -t 10 -i 1 -f m --forceflush'
+
+
+def bidir_event(ul_mbps, dl_mbps):
+    streams = [{'socket': 5, 'bits_per_second': ul_mbps * 1e6, 'sender': True, 'rtt': 4000, 'snd_cwnd': 1000},
+               {'socket': 7, 'bits_per_second': dl_mbps * 1e6, 'sender': False}]
+    return {'event': 'interval', 'data': {
+        'streams': streams,
+        'sum': {'bits_per_second': ul_mbps * 1e6, 'omitted': False, 'sender': True},
+        'sum_bidir_reverse': {'bits_per_second': dl_mbps * 1e6, 'omitted': False, 'sender': False},
+    }}
+
+
+def test_bidir_json_goes_to_both_queues():
+    runner = make_runner(bidir=True, reverse_queue=queue.Queue(), reverse_detail_queue=queue.Queue())
+    runner.feed_json(json.dumps(bidir_event(300, 500)) + '\n')
+    assert [mbps for _, mbps in drain(runner.q)] == [300.0]
+    assert [mbps for _, mbps in drain(runner.reverse_q)] == [500.0]
+    # each direction keeps its own streams
+    assert drain(runner.detail_q)[0][1]['streams'][0]['rtt_ms'] == 4.0
+    assert drain(runner.reverse_detail_q)[0][1]['streams'][0]['rtt_ms'] is None
+
+
+def test_text_of_parallel_streams_uses_the_sum():
+    runner = make_runner(parallel=2)
+    for line in ('[  5]   0.00-1.00   sec  30.0 MBytes   250 Mbits/sec',
+                 '[  7]   0.00-1.00   sec  30.0 MBytes   251 Mbits/sec',
+                 '[SUM]   0.00-1.00   sec  60.0 MBytes   501 Mbits/sec',
+                 '[SUM]   0.00-10.00  sec   600 MBytes   503 Mbits/sec                  sender'):
+        runner.handle_line(line)
+    assert [mbps for _, mbps in drain(runner.q)] == [501.0]
+
+
+def test_text_of_bidir_splits_directions():
+    runner = make_runner(bidir=True, reverse_queue=queue.Queue())
+    runner.handle_line('[  5][TX-C]   0.00-1.00   sec  35.8 MBytes   300 Mbits/sec')
+    runner.handle_line('[  7][RX-C]   0.00-1.00   sec  59.6 MBytes   500 Mbits/sec')
+    assert [mbps for _, mbps in drain(runner.q)] == [300.0]
+    assert [mbps for _, mbps in drain(runner.reverse_q)] == [500.0]
+
+
+def test_build_cmd_of_bidir_and_parallel():
+    cmd = make_runner(bidir=True, reverse=True, parallel=4).build_cmd()
+    assert ' -P 4' in cmd
+    assert cmd.count('--bidir') == 1 and ' -R' not in cmd
@@ -0,0 +1,76 @@
+import pytest
+
+from conftest import repo_folder
+from iw_parser import parse_station, parse_iw_info, parse_scan, station_keys
+
+fixture_folder = repo_folder.joinpath('bench', 'fixtures', 'iw')
+
+
+def fixture(name):
+    return fixture_folder.joinpath(f'{name}.txt').read_text()
+
+
+# values read off the fixture text by hand
+stations = {
+    'wifi6': {
+        'bssid': '04:42:1a:9c:8d:7e', 'signal': -47, 'signal_avg': -46, 'beacon_signal': -45,
+        'rx_bitrate': 1200.9, 'rx_mcs': 11, 'rx_nss': 2, 'rx_he_gi': 0, 'rx_he_dcm': 0,
+        'tx_bitrate': 1080.6, 'tx_mcs': 10, 'tx_nss': 2, 'tx_he_gi': 0, 'tx_he_dcm': 0,
+        'rx_bytes': 3920183342, 'tx_bytes': 210938221, 'rx_packets': 2719332, 'tx_packets': 903211,
+        'tx_retries': 18233, 'tx_failed': 41, 'expected_throughput': 612.304,
+    },
+    'wifi5': {
+        'bssid': '24:4b:fe:1a:2b:3c', 'signal': -52, 'signal_avg': -51, 'beacon_signal': -50,
+        'rx_bitrate': 866.7, 'rx_mcs': 9, 'rx_nss': 2, 'rx_he_gi': None, 'rx_he_dcm': None,
+        'tx_bitrate': 780.0, 'tx_mcs': 8, 'tx_nss': 2, 'tx_he_gi': None, 'tx_he_dcm': None,
+        'rx_bytes': 1482393321, 'tx_bytes': 98231442, 'rx_packets': 1098231, 'tx_packets': 412093,
+        'tx_retries': 18233, 'tx_failed': 41, 'expected_throughput': 390.625,
+    },
+    '2g': {
+        'bssid': '24:4b:fe:1a:2b:38', 'signal': -61, 'signal_avg': -60, 'beacon_signal': -60,
+        'rx_bitrate': 144.4, 'rx_mcs': 15, 'rx_nss': None, 'rx_he_gi': None, 'rx_he_dcm': None,
+        'tx_bitrate': 130.0, 'tx_mcs': 14, 'tx_nss': None, 'tx_he_gi': None, 'tx_he_dcm': None,
+        'rx_bytes': 58231992, 'tx_bytes': 8123321, 'rx_packets': 92311, 'tx_packets': 30211,
+        'tx_retries': 4102, 'tx_failed': 41, 'expected_throughput': 71.532,
+    },
+}
+
+infos = {
+    'wifi6': {'ssid': 'office-ax', 'channel': '149 (5745 MHz)', 'freq': 5745, 'bandwidth': 80, 'center_freq': 5775},
+    'wifi5': {'ssid': 'office-5g', 'channel': '36 (5180 MHz)', 'freq': 5180, 'bandwidth': 80, 'center_freq': 5210},
+    '2g': {'ssid': 'office-2g', 'channel': '6 (2437 MHz)', 'freq': 2437, 'bandwidth': 20, 'center_freq': 2437},
+}
+
+# `iw link` has no averages, retry counters or expected throughput
+link_only_keys = ('signal_avg', 'beacon_signal', 'tx_retries', 'tx_failed', 'expected_throughput')
+
+
+@pytest.mark.parametrize('scenario', stations)
+def test_parse_station_dump(scenario):
+    assert parse_station(fixture(f'{scenario}_station')) == stations[scenario]
+
+
+@pytest.mark.parametrize('scenario', stations)
+def test_parse_link(scenario):
+    expected = {key: None if key in link_only_keys else value for key, value in stations[scenario].items()}
+    assert parse_station(fixture(f'{scenario}_link')) == expected
+
+
+@pytest.mark.parametrize('scenario', infos)
+def test_parse_iw_info(scenario):
+    assert parse_iw_info(fixture(f'{scenario}_info')) == infos[scenario]
+
+
+def test_disconnected():
+    assert parse_iw_info(fixture('disconnected_info')) == {}
+    assert parse_station(fixture('disconnected_link')) == dict.fromkeys(station_keys)
+    assert parse_station(fixture('disconnected_station')) == dict.fromkeys(station_keys)
+
+
+def test_parse_scan():
+    bsses = parse_scan(fixture('scan'))
+    assert len(bsses) == 9
+    assert bsses[0] == {'bssid': '24:4b:fe:1a:2b:3c', 'ssid': 'office-5g', 'freq': 5180, 'signal': -52.0,
+                        'last_seen_ms': 120}
+    assert bsses[-1] == {'bssid': '5c:e9:31:12:34:56', 'ssid': 'lab-6g', 'freq': 6115, 'signal': -74.0,
+                         'last_seen_ms': 480}
@@ -0,0 +1,185 @@
+import struct
+import socket
+import threading
+from time import sleep, monotonic
+
+import pytest
+
+from conftest import repo_folder
+from iw_parser import parse_station
+from link_stats import (Station_info, Iw_sampler, Nl80211_sampler, Nl80211_socket, parse_attrs, parse_nlmsgs, parse_interface_attrs,
+                        parse_station_attrs, pack_attr, GENL_ID_CTRL, CTRL_ATTR_FAMILY_ID,
+                        NL80211_CMD_GET_INTERFACE, NL80211_CMD_GET_STATION)
+
+fixture_folder = repo_folder.joinpath('bench', 'fixtures')
+scenarios = ('wifi6', 'wifi5', '2g', 'disconnected')
+family_id = 0x1c
+
+
+def nl80211_fixture(scenario, kind):
+    return fixture_folder.joinpath('nl80211', f'{scenario}_{kind}.bin').read_bytes()
+
+
+def iw_fixture(scenario, kind):
+    return fixture_folder.joinpath('iw', f'{scenario}_{kind}.txt').read_text().strip()
+
+
+def with_seq(data, seq):
+    data = bytearray(data)
+    offset = 0
+    while offset + 16 <= len(data):
+        length = struct.unpack_from('=I', data, offset)[0]
+        struct.pack_into('=I', data, offset + 8, seq)
+        offset += (length + 3) & ~3
+    return bytes(data)
+
+
+class Replay_socket:
+    '''
+    answers the requests of Nl80211_sampler with the fixture replies of a scenario
+    '''
+
+    def __init__(self, scenario, lose=()):
+        self.scenario = scenario
+        # commands whose reply never comes
+        self.lose = lose
+        self.pending = []
+        self.timeout = None
+        self.closed = False
+
+    def send(self, data):
+        _, family, _, seq, _ = struct.unpack_from('=IHHII', data)
+        cmd = data[16]
+        if family == GENL_ID_CTRL:
+            family_attr = pack_attr(CTRL_ATTR_FAMILY_ID, struct.pack('=H', family_id))
+            payload = struct.pack('=BBH', 1, 2, 0) + family_attr
+            reply = struct.pack('=IHHII', 16 + len(payload), GENL_ID_CTRL, 0, 0, 0) + payload
+            reply += struct.pack('=IHHIIi', 20, 2, 0, 0, 0, 0)
+        elif cmd == NL80211_CMD_GET_INTERFACE:
+            reply = nl80211_fixture(self.scenario, 'interface')
+        elif cmd == NL80211_CMD_GET_STATION:
+            reply = nl80211_fixture(self.scenario, 'station')
+        if family == GENL_ID_CTRL or cmd not in self.lose:
+            self.pending.append(with_seq(reply, seq))
+        return len(data)
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def recv(self, size):
+        if not self.pending:
+            sleep(self.timeout)
+            raise socket.timeout('timed out')
+        return self.pending.pop(0)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def replay(monkeypatch):
+    monkeypatch.setattr(socket, 'if_nametoindex', lambda interface: 3)
+    return lambda scenario, **kwargs: Nl80211_sampler('wlo1', sock=Replay_socket(scenario, **kwargs), timeout=0.2)
+
+
+@pytest.fixture
+def iw(monkeypatch):
+    def make(scenario):
+        sampler = Iw_sampler('wlo1')
+        kinds = {'info': 'info', 'station dump': 'station', 'link': 'link'}
+        monkeypatch.setattr(sampler, 'run_iw', lambda sub_cmd, timeout: iw_fixture(scenario, kinds[sub_cmd]))
+        return sampler
+    return make
+
+
+def without_timestamp(station):
+    return {name: value for name, value in station.as_dict().items() if name != 'timestamp'}
+
+
+@pytest.mark.parametrize('scenario', scenarios)
+def test_nl80211_sample_matches_iw(scenario, replay, iw):
+    nl80211_station = replay(scenario).sample()
+    iw_station = iw(scenario).sample()
+
+    assert isinstance(nl80211_station, Station_info)
+    assert without_timestamp(nl80211_station) == without_timestamp(iw_station)
+    assert nl80211_station.connected == (scenario != 'disconnected')
+
+
+@pytest.mark.parametrize('scenario', scenarios)
+def test_nl80211_association_matches_iw(scenario, replay, iw):
+    assert replay(scenario).association() == iw(scenario).association()
+
+
+@pytest.mark.parametrize('scenario', ('wifi6', 'wifi5', '2g'))
+def test_parse_station_attrs(scenario):
+    messages = list(parse_nlmsgs(nl80211_fixture(scenario, 'station')))
+    # the station and the done of the dump
+    assert [msg_type for msg_type, _, _ in messages] == [family_id, 3]
+    station = parse_station_attrs(parse_attrs(messages[0][2][4:]))
+
+    assert station == parse_station(iw_fixture(scenario, 'station'))
+
+
+def test_parse_interface_attrs():
+    msg_type, _, payload = next(parse_nlmsgs(nl80211_fixture('wifi6', 'interface')))
+    assert msg_type == family_id
+    assert parse_interface_attrs(parse_attrs(payload[4:])) == {
+        'ssid': 'office-ax', 'channel': '149 (5745 MHz)', 'freq': 5745, 'bandwidth': 80, 'center_freq': 5775}
+
+
+def test_disconnected_interface_has_no_link():
+    _, _, payload = next(parse_nlmsgs(nl80211_fixture('disconnected', 'interface')))
+    assert parse_interface_attrs(parse_attrs(payload[4:])) == {}
+
+
+def test_lost_reply_times_out(replay):
+    sampler = replay('wifi6', lose=(NL80211_CMD_GET_STATION,))
+    start = monotonic()
+    with pytest.raises(OSError, match='no nl80211 reply'):
+        sampler.sample()
+    assert monotonic() - start < 1
+
+
+def test_reply_of_another_request_is_skipped_until_timeout(replay):
+    sampler = replay('wifi6')
+    # a late reply to an earlier request is left on the socket
+    sampler.channel.sock.pending.append(with_seq(nl80211_fixture('wifi6', 'station'), sampler.channel.seq + 5))
+    sampler.channel.sock.lose = (NL80211_CMD_GET_INTERFACE,)
+    with pytest.raises(OSError):
+        sampler.sample()
+
+
+def test_samplers_share_one_socket(replay):
+    channel = Nl80211_socket(Replay_socket('wifi6'), timeout=0.2)
+    samplers = [Nl80211_sampler(interface, channel=channel) for interface in ('wlo1', 'wlo2')]
+    errors = []
+
+    def sample(sampler):
+        for _ in range(20):
+            try:
+                assert sampler.sample().connected
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=sample, args=(sampler,)) for sampler in samplers]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert errors == []
+    # one family lookup, then interface and station requests of every sample on one seq counter
+    assert channel.seq == 1 + 2 * 2 * 20
+
+    # a sampler never closes a socket it did not open
+    samplers[0].close()
+    assert not channel.sock.closed
+    assert samplers[1].sample().connected
+    channel.close()
+    assert channel.sock.closed
+
+
+def test_sampler_closes_its_own_socket(replay):
+    sampler = replay('wifi6')
+    sampler.close()
+    assert sampler.channel.sock.closed
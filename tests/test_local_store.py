@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from local_store import Local_store, parse_channel, to_row
+
+
+def sample(n, location='office', channel='36 (5180 MHz)', **fields):
+    return {
+        'measurement': 'wifi_test',
+        'time': f'2024-01-01 00:00:{n:02d}',
+        'fields': {'location': location, 'ssid': 'ap', 'interface': 'wlo1', 'channel': channel,
+                   'signal': -40 - n, 'latency': 2.0 + n, 'throughput': None, 'rx_goodput': 1.5, **fields},
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = Local_store(tmp_path.joinpath('store.sqlite'))
+    yield store
+    store.close()
+
+
+def test_parse_channel():
+    assert parse_channel('36 (5180 MHz)') == (36, '5')
+    assert parse_channel('6 (2437 MHz)') == (6, '2.4')
+    assert parse_channel('37 (6135 MHz)') == (37, '6')
+    assert parse_channel(None) == (None, None)
+
+
+def test_extra_fields_go_to_json():
+    row = to_row(sample(0), 'run')
+    assert json.loads(row[-1]) == {'rx_goodput': 1.5}
+
+
+def test_query_with_filters(store):
+    store.write([sample(n) for n in range(5)], 'run_a')
+    store.write([sample(n, location='lab', channel='6 (2437 MHz)') for n in range(3)], 'run_b')
+
+    rows = store.query(location='office')
+    assert [row['signal'] for row in rows] == [-40, -41, -42, -43, -44]
+    assert rows[0]['band'] == '5'
+    assert len(store.query(band='2.4')) == 3
+    assert len(store.query(channel=36, limit=2)) == 2
+    with pytest.raises(ValueError):
+        store.query(fields=('rx_goodput',))
+
+
+def test_query_in_buckets(store):
+    store.write([sample(n) for n in range(6)], 'run_a')
+    rows = store.query(fields=('signal',), bucket=3, location='office')
+    assert [row['samples'] for row in rows] == [3, 3]
+    assert (rows[0]['signal_avg'], rows[0]['signal_min'], rows[0]['signal_max']) == (-41, -42, -40)
+
+
+def test_runs_and_compare(store):
+    store.write([sample(n) for n in range(5)], 'run_a')
+    store.end_run('run_a', {'avg_signal': -42})
+    store.write([sample(n, location='lab') for n in range(2)], 'run_b')
+
+    runs = store.runs()
+    assert [run['run_id'] for run in runs] == ['run_a', 'run_b']
+    assert runs[0]['avg_signal'] == -42
+    assert [run['run_id'] for run in store.runs(location='lab')] == ['run_b']
+
+    stats = store.compare(['run_a', 'run_b'], fields=('signal', 'throughput'))
+    assert stats['run_a']['samples'] == 5
+    assert stats['run_a']['signal_p50'] == -42
+    assert stats['run_b']['throughput_avg'] is None
+
+
+def test_import_resumes_from_offset(store, tmp_path):
+    log = tmp_path.joinpath('log_2024-01-01')
+    log.write_text(''.join(f'{json.dumps(sample(n))}\n' for n in range(3)))
+    assert store.import_file(log) == 3
+    assert store.import_file(log) == 0
+
+    with open(log, 'a') as f:
+        f.write(f'{json.dumps(sample(3))}\n')
+    assert store.import_file(log) == 1
+    assert len(store.query()) == 4
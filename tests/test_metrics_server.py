@@ -0,0 +1,90 @@
+import json
+from types import SimpleNamespace
+from time import monotonic
+
+import requests
+
+from metrics_server import Live_metrics, Metrics_server, Console_printer
+from fusion import Sample_stream
+
+
+def make_logger(interface, metrics):
+    return SimpleNamespace(interface=interface, metrics=metrics, samples_taken=metrics.updates,
+                           scheduler=SimpleNamespace(missed_ticks=1), ping_stream=Sample_stream('latency'),
+                           iperf_streams={'ul': Sample_stream('throughput_ul')}, writer=None, spool=None)
+
+
+def test_window_stats():
+    metrics = Live_metrics(sample_rate=1, windows=(10, 60))
+    now = monotonic()
+    metrics.update({'location': 'lab', 'signal': -60, 'latency': None}, now - 30)
+    metrics.update({'location': 'lab', 'signal': -40, 'latency': 4.0}, now - 5)
+    metrics.update({'location': 'lab', 'signal': -50, 'latency': 2.0}, now)
+
+    stats = metrics.window_stats(now)
+    assert stats[10] == {'signal': {'avg': -45.0, 'min': -50, 'max': -40},
+                         'latency': {'avg': 3.0, 'min': 2.0, 'max': 4.0}}
+    assert stats[60]['signal'] == {'avg': -50.0, 'min': -60, 'max': -40}
+    assert 'location' not in stats[60]
+
+
+def test_samples_bounded_by_longest_window():
+    metrics = Live_metrics(sample_rate=10, windows=(1, 5))
+    for i in range(1000):
+        metrics.update({'signal': -40}, i / 10)
+    assert len(metrics.samples) == 51
+
+
+def test_prometheus_and_json():
+    metrics = Live_metrics(sample_rate=1)
+    metrics.update({'ssid': 'lab "ap"', 'signal': -42, 'latency': 3.5}, monotonic())
+    server = Metrics_server([make_logger('wlo1', metrics)], port=0)
+
+    text = server.render()['/metrics'][0].decode()
+    assert '# TYPE wifi_test_samples_total counter' in text
+    assert 'wifi_test_latest{interface="wlo1",field="signal"} -42' in text
+    assert 'wifi_test_window_avg{interface="wlo1",window="10s",field="latency"} 3.5' in text
+    # no writer, no spool: left out instead of reported as None
+    assert 'writer_queue_depth' not in text
+
+    data = json.loads(server.render()['/metrics.json'][0])
+    assert data['jobs'][0]['latest']['ssid'] == 'lab "ap"'
+
+
+def test_render_is_cached_until_a_new_sample():
+    metrics = Live_metrics(sample_rate=1)
+    metrics.update({'signal': -42}, monotonic())
+    server = Metrics_server([make_logger('wlo1', metrics)], port=0, refresh=60)
+
+    bodies = server.render()
+    assert server.render() is bodies
+    metrics.update({'signal': -43}, monotonic())
+    assert server.render() is not bodies
+
+
+def test_served_over_http():
+    metrics = Live_metrics(sample_rate=1)
+    metrics.update({'signal': -42}, monotonic())
+    server = Metrics_server([make_logger('wlo1', metrics)], port=0, host='127.0.0.1').start()
+    try:
+        base = f'http://127.0.0.1:{server.httpd.server_address[1]}'
+        response = requests.get(f'{base}/metrics', timeout=2)
+        assert response.status_code == 200
+        assert response.headers['Content-Type'].startswith('text/plain')
+        assert requests.get(f'{base}/metrics.json', timeout=2).json()['jobs'][0]['interface'] == 'wlo1'
+        assert requests.get(f'{base}/other', timeout=2).status_code == 404
+    finally:
+        server.close()
+
+
+def test_console_printer_modes(capsys):
+    assert Console_printer('all').due()
+    assert not Console_printer('off').due()
+
+    printer = Console_printer('rate', interval=60)
+    assert printer.due()
+    assert not printer.due()
+
+    printer.status('==> records saved.')
+    Console_printer('all').status('==> records sent.')
+    assert capsys.readouterr().out == '==> records sent.\n'
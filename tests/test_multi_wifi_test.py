@@ -0,0 +1,73 @@
+import socket
+
+import pytest
+
+import multi_wifi_test
+from link_stats import Nl80211_socket
+from multi_wifi_test import Wifi_test_orchestrator, parse_job
+from test_link_stats import Replay_socket
+
+
+@pytest.fixture
+def make_orchestrator(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(socket, 'if_nametoindex', lambda interface: 3)
+    monkeypatch.setattr(multi_wifi_test, 'get_nl80211_socket',
+                        lambda backend: Nl80211_socket(Replay_socket('wifi6'), timeout=0.2))
+    jobs = [parse_job('wlo1,192.168.1.1'), parse_job('wlo2,192.168.2.1,192.168.2.10:5202')]
+    return lambda **kwargs: Wifi_test_orchestrator(jobs, duration=1, location='lab', reverse=False,
+                                                   sinks=['jsonl'], console='off', **kwargs)
+
+
+@pytest.fixture
+def orchestrator(make_orchestrator):
+    return make_orchestrator(no_iperf=True)
+
+
+def test_parse_job():
+    assert parse_job('wlo2,192.168.2.1,192.168.2.10:5202') == {
+        'name': 'wlo2,192.168.2.1,192.168.2.10:5202', 'interface': 'wlo2', 'router_ip': '192.168.2.1',
+        'iperf_server_ip': '192.168.2.10', 'iperf_port': 5202}
+    assert parse_job('wlo1,192.168.1.1')['iperf_server_ip'] is None
+
+
+def test_jobs_share_the_link_socket_of_the_orchestrator(orchestrator):
+    channel = orchestrator.link_channel
+    assert [logger.link_sampler.channel for logger in orchestrator.loggers] == [channel, channel]
+    for logger in orchestrator.loggers:
+        assert logger.get_wifi_link_status()
+    # one seq counter: the family lookup, then two requests of each job
+    assert channel.seq == 5
+
+    # a job done with its sampler leaves the socket to the others
+    orchestrator.loggers[1].link_sampler.close()
+    assert not channel.sock.closed
+    assert orchestrator.loggers[0].get_wifi_link_status()
+
+    orchestrator.clean_up()
+    assert channel.sock.closed
+    assert orchestrator.link_channel is None
+
+
+@pytest.mark.parametrize('direction, runners', [
+    ('ul', [(5202, False, False)]),
+    ('dl', [(5202, True, False)]),
+    # the downlink on the next port of the server
+    ('both', [(5202, False, False), (5203, True, False)]),
+    ('bidir', [(5202, False, True)]),
+])
+def test_iperf_runners_of_each_direction(make_orchestrator, direction, runners):
+    orchestrator = make_orchestrator(no_iperf=False, iperf_direction=direction, iperf_parallel=2)
+    # the first job has no iperf server
+    assert orchestrator.loggers[0].no_iperf
+    logger = orchestrator.loggers[1]
+    assert [(runner.port, runner.reverse, runner.bidir) for runner in logger.make_iperf_runners()] == runners
+    assert all(runner.parallel == 2 for runner in logger.make_iperf_runners())
+    orchestrator.clean_up()
+
+
+def test_no_triggered_scans_under_iperf_load(make_orchestrator):
+    # the first job has no iperf server, the second one does
+    orchestrator = make_orchestrator(no_iperf=False, scan=True, scan_trigger=True)
+    assert [logger.scan_cache.trigger for logger in orchestrator.loggers] == [True, False]
+    orchestrator.close_link_channel()
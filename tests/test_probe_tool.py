@@ -0,0 +1,109 @@
+import queue
+import struct
+import argparse
+import statistics
+
+import pytest
+
+from ping_tool import Ping_runner
+from probe_tool import (Prober, Icmp_prober, parse_interval, checksum, payload_struct, min_interval,
+                        ICMP_ECHO_REPLY)
+
+
+class Fake_icmp_socket:
+    '''
+    datagram icmp socket of port (= ident) with replies waiting
+    '''
+
+    def __init__(self, port, replies):
+        self.port = port
+        self.replies = list(replies)
+
+    def getsockname(self):
+        return ('0.0.0.0', self.port)
+
+    def recvmsg(self, size, ancsize, flags):
+        if not self.replies:
+            raise BlockingIOError
+        return self.replies.pop(0), [], 0, ('192.168.50.1', 0)
+
+
+def echo_reply(ident, seq, sent_ns, payload_seq=None):
+    payload = payload_struct.pack(seq if payload_seq is None else payload_seq, sent_ns)
+    header = struct.pack('!BBHHH', ICMP_ECHO_REPLY, 0, 0, ident, seq)
+    return struct.pack('!BBHHH', ICMP_ECHO_REPLY, 0, checksum(header + payload), ident, seq) + payload
+
+
+def make_prober(cls=Prober):
+    return cls('192.168.50.1', 0, 10, 1, queue.Queue())
+
+
+def test_running_rtt_stats_match_ping():
+    prober = make_prober()
+    rtts = [2.764, 5.1, 12.22, 3.6, 5.94]
+    for seq, rtt in enumerate(rtts):
+        prober.pending_seqs.add(seq)
+        prober.sent += 1
+        prober.on_reply(seq, int(rtt * 1e6))
+    stats = prober.stats()
+    assert stats['packets_received'] == 5
+    assert stats['rtt_min'] == 2.764
+    assert stats['rtt_max'] == 12.22
+    assert stats['rtt_avg'] == round(statistics.fmean(rtts), 3)
+    assert stats['rtt_mdev'] == round(statistics.pstdev(rtts), 3)
+    assert not hasattr(prober, 'rtts')
+
+
+def test_duplicates_and_reordered_replies():
+    prober = make_prober()
+    prober.pending_seqs.update({0, 1, 2})
+    prober.sent = 3
+    for seq in (0, 2, 1, 1, 7):
+        prober.on_reply(seq, 1_000_000)
+    stats = prober.stats()
+    assert (stats['packets_received'], stats['duplicates'], stats['reordered']) == (3, 1, 1)
+
+
+def test_parse_interval():
+    assert parse_interval('0.5') == 0.5
+    assert parse_interval(str(min_interval)) == min_interval
+    for value in ('0.001', '0', '-1', 'nan', 'fast'):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_interval(value)
+
+
+def test_probe_interval_is_clamped():
+    runner = Ping_runner('192.168.50.1', 0, 10, 0.001, queue.Queue(), engine='icmp')
+    assert runner.interval == min_interval
+    # builds without the ValueError of a too short interval
+    assert runner.make_prober().interval == min_interval
+    # the ping binary keeps its own limits
+    assert Ping_runner('192.168.50.1', 0, 10, 0.001, queue.Queue()).interval == 0.001
+
+
+def test_icmp_probers_have_distinct_idents():
+    idents = {make_prober(Icmp_prober).ident for _ in range(100)}
+    assert len(idents) == 100
+
+
+def test_icmp_replies_match_ident_and_seq():
+    prober = make_prober(Icmp_prober)
+    prober.address, prober.raw = '192.168.50.1', False
+    prober.sock = Fake_icmp_socket(4242, [
+        echo_reply(4242, 1, 1000),
+        # replies of another prober of the process
+        echo_reply(4243, 2, 1000),
+        # seq of the header and the payload disagree
+        echo_reply(4242, 3, 1000, payload_seq=9),
+        echo_reply(4242, 4, 1000),
+    ])
+    assert [seq for seq, _ in prober.receive()] == [1, 4]
+
+
+def test_raw_icmp_replies_match_own_ident():
+    prober = make_prober(Icmp_prober)
+    prober.address, prober.raw = '192.168.50.1', True
+    ip_header = bytes([0x45]) + bytes(19)
+    prober.sock = Fake_icmp_socket(0, [ip_header + echo_reply(prober.ident ^ 1, 1, 1000),
+                                       ip_header + echo_reply(prober.ident, 2, 1000)])
+    assert [seq for seq, _ in prober.receive()] == [2]
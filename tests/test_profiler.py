@@ -0,0 +1,75 @@
+import json
+import threading
+from time import sleep
+
+from profiler import Stage_profiler, bucket_bounds
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = Stage_profiler()
+    with profiler.stage('link_sample'):
+        pass
+    assert not profiler.events
+    assert profiler.report() == {}
+
+
+def test_report():
+    profiler = Stage_profiler()
+    profiler.enable()
+    for delay in (0, 0, 0.02):
+        with profiler.stage('db_write'):
+            sleep(delay)
+    with profiler.stage('link_sample'):
+        pass
+
+    report = profiler.report()
+    assert set(report) == {'db_write', 'link_sample'}
+    stage = report['db_write']
+    assert stage['count'] == 3
+    assert stage['wall_ms_max'] >= 20
+    assert len(stage['histogram']) == len(bucket_bounds) + 1
+    assert sum(stage['histogram']) == 3
+
+
+def test_events_are_bounded():
+    profiler = Stage_profiler(maxlen=10)
+    profiler.enable()
+    for _ in range(100):
+        with profiler.stage('link_sample'):
+            pass
+    assert profiler.report()['link_sample']['count'] == 10
+
+
+def test_stage_of_a_failed_call_is_kept():
+    profiler = Stage_profiler()
+    profiler.enable()
+    try:
+        with profiler.stage('db_write'):
+            raise ConnectionError('db is down')
+    except ConnectionError:
+        pass
+    assert profiler.report()['db_write']['count'] == 1
+
+
+def test_finish_writes_chrome_trace(tmp_path, capsys):
+    profiler = Stage_profiler()
+    profiler.enable()
+    th = threading.Thread(target=lambda: profiler.stage('iperf_spawn').__enter__().__exit__(), name='iperf')
+    th.start()
+    th.join()
+    with profiler.stage('link_sample'):
+        pass
+
+    trace_file = tmp_path.joinpath('trace.json')
+    profiler.finish(trace_file)
+    trace = json.loads(trace_file.read_text())['traceEvents']
+    assert {event['args']['name'] for event in trace if event['ph'] == 'M'} >= {'iperf'}
+    assert sorted(event['name'] for event in trace if event['ph'] == 'X') == ['iperf_spawn', 'link_sample']
+    assert 'link_sample' in capsys.readouterr().out
+
+
+def test_finish_of_disabled_profiler_is_silent(tmp_path, capsys):
+    trace_file = tmp_path.joinpath('trace.json')
+    Stage_profiler().finish(trace_file)
+    assert not trace_file.exists()
+    assert capsys.readouterr().out == ''
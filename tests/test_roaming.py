@@ -0,0 +1,121 @@
+import subprocess
+
+import pytest
+
+import roaming
+from fusion import Sample_stream
+from roaming import Roam_tracker, traffic_gap, roam_summary
+
+
+class Script_sampler:
+    '''
+    association() answers from a script, an exception in it is raised
+    '''
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.closed = False
+
+    def association(self):
+        answer = self.script.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def make_tracker(monkeypatch):
+    def make(script, streams=None, period=0.1, settle=1):
+        sampler = Script_sampler(script)
+        monkeypatch.setattr(roaming, 'get_link_sampler', lambda interface, backend: sampler)
+        return Roam_tracker('wlo1', 'iw', streams or {}, period, rate=10, settle=settle)
+    return make
+
+
+def stream_of(name, stamps):
+    stream = Sample_stream(name)
+    for ts in stamps:
+        stream.put((ts, 1.0))
+    return stream
+
+
+def test_traffic_gap():
+    stream = stream_of('latency', [0.1, 0.2, 0.9, 1.0])
+    assert traffic_gap(stream, 0, 1.0) == 700.0
+    assert traffic_gap(Sample_stream('latency'), 0, 0.5) == 500.0
+
+
+def test_changed_bssid_is_a_roam(make_tracker):
+    tracker = make_tracker([('aa', -70), ('aa', -72), ('bb', -50)])
+    for now in (0.0, 0.1, 0.2):
+        tracker.poll(now)
+    [event] = tracker.collect(10)
+    assert (event.kind, event.old_bssid, event.new_bssid) == ('roam', 'aa', 'bb')
+    assert (event.signal_before, event.signal_after) == (-72, -50)
+    assert event.link_gap_ms == 100.0
+
+
+def test_loss_then_same_bssid_is_a_reconnect(make_tracker):
+    tracker = make_tracker([('aa', -70), (None, None), (None, None), ('aa', -65)])
+    for now in (0.0, 0.1, 0.2, 0.5):
+        tracker.poll(now)
+    [event] = tracker.collect(10)
+    assert event.kind == 'reconnect'
+    assert event.link_gap_ms == 500.0
+
+
+@pytest.mark.parametrize('error', [
+    OSError(110, 'no nl80211 reply'),
+    subprocess.TimeoutExpired(['iw', 'dev', 'wlo1', 'link'], 1),
+    subprocess.CalledProcessError(1, ['iw', 'dev', 'wlo1', 'link']),
+])
+def test_sampler_errors_are_counted(make_tracker, error):
+    tracker = make_tracker([('aa', -70), error, ('aa', -70)])
+    for now in (0.0, 0.1, 0.2):
+        tracker.poll(now)
+    assert (tracker.polls, tracker.errors) == (2, 1)
+    assert tracker.collect(10) == []
+
+
+def test_event_settles_before_collected(make_tracker):
+    # a sample every 0.1 secs but none in (0.2, 0.9)
+    ping = stream_of('latency', [n / 10 for n in range(-8, 19) if not 2 < n < 9])
+    tracker = make_tracker([('aa', -70), ('bb', -50)], streams={'ping': ping}, period=0.1, settle=1)
+    tracker.poll(0.2)
+    tracker.poll(0.8)
+    assert tracker.collect(1.0) == []
+
+    [event] = tracker.collect(1.8)
+    # one period of the gap is normal
+    assert event.gaps['ping_gap_ms'] == 700.0
+    assert event.gaps['interruption_ms'] == 600.0
+
+
+def test_final_collect_takes_unsettled_events(make_tracker):
+    tracker = make_tracker([('aa', -70), ('bb', -50)])
+    tracker.poll(0.0)
+    tracker.poll(0.1)
+    assert len(tracker.collect(0.2, final=True)) == 1
+
+
+def test_thread_polls_until_closed(make_tracker):
+    tracker = make_tracker([('aa', -70)] * 1000)
+    tracker.start()
+    tracker.stopped.wait(0.3)
+    tracker.close()
+    assert tracker.polls >= 2
+    assert not tracker.thread.is_alive()
+    assert tracker.sampler.closed
+
+
+def test_roam_summary(make_tracker):
+    tracker = make_tracker([('aa', -70), ('bb', -50), (None, None), ('bb', -55)])
+    for now in (0.0, 0.1, 0.2, 0.6):
+        tracker.poll(now)
+    summary = roam_summary(tracker.collect(10))
+    assert (summary['roams'], summary['reconnects']) == (1, 1)
+    assert summary['link_gap_ms_max'] == 500.0
+    assert summary['interruption_ms_max'] is None
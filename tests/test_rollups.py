@@ -0,0 +1,81 @@
+import random
+
+from rollups import Field_rollup, Rollup, Rollups
+from stats import _percentile
+
+
+def sample(signal, ssid='ap', **fields):
+    return {'location': 'lab', 'ssid': ssid, 'channel': '36', 'bssid': 'aa:bb:cc:00:00:01',
+            'signal': signal, 'latency': None, **fields}
+
+
+def test_field_rollup_exact_then_estimated():
+    rng = random.Random(7)
+    values = [rng.uniform(0, 100) for _ in range(2000)]
+    rollup = Field_rollup()
+    for value in values[:Field_rollup.exact_limit]:
+        rollup.add(value)
+    ordered = sorted(values[:Field_rollup.exact_limit])
+    assert rollup.fields('rtt')['rtt_p95'] == round(_percentile(ordered, 95), 3)
+
+    for value in values[Field_rollup.exact_limit:]:
+        rollup.add(value)
+    assert rollup.values is None
+    fields = rollup.fields('rtt')
+    assert fields['rtt_min'] == min(values)
+    assert fields['rtt_max'] == max(values)
+    assert fields['rtt_mean'] == round(sum(values) / len(values), 3)
+    # P² of a uniform sample is close to its true p95
+    assert abs(fields['rtt_p95'] - 95) < 3
+
+
+def test_window_is_closed_by_the_first_sample_after_it():
+    rollup = Rollup('wifi_test_10s', 10)
+    assert rollup.add(sample(-40), 100.0) == []
+    assert rollup.add(sample(-50, throughput=300.0), 109.9) == []
+
+    [record] = rollup.add(sample(-60), 110.0)
+    assert record['measurement'] == 'wifi_test_10s'
+    # stamped in utc at the end of the window
+    assert record['time'] == '1970-01-01 00:01:50'
+    fields = record['fields']
+    assert (fields['location'], fields['ssid'], fields['channel']) == ('lab', 'ap', '36')
+    assert (fields['window_secs'], fields['samples']) == (10, 2)
+    assert (fields['signal_mean'], fields['signal_min'], fields['signal_max']) == (-45.0, -50, -40)
+    assert fields['throughput_mean'] == 300.0
+    # tags and empty fields are not rolled up
+    assert 'bssid_mean' not in fields and 'latency_mean' not in fields
+
+    [record] = rollup.close()
+    assert record['fields']['samples'] == 1
+    assert rollup.close() == []
+
+
+def test_keys_split_a_window_into_series():
+    rollup = Rollup('wifi_test_10s', 10, extra_keys={'interface': 'wlo1', 'job': 'wlo1'})
+    rollup.add(sample(-40, interface='wlo1', job='a'), 100.0)
+    rollup.add(sample(-50, ssid='guest', interface='wlo1', job='a'), 101.0)
+    rollup.add(sample(-60, interface='wlo2', job='b'), 102.0)
+
+    records = rollup.close()
+    assert sorted((r['fields']['ssid'], r['fields']['interface'], r['fields']['job']) for r in records) == [
+        ('ap', 'wlo1', 'a'), ('ap', 'wlo2', 'b'), ('guest', 'wlo1', 'a')]
+    assert all(record['fields']['samples'] == 1 for record in records)
+    # a key is no field of its own
+    assert all('job_mean' not in record['fields'] for record in records)
+
+
+def test_rollups_of_every_window():
+    rollups = Rollups('wifi_test', windows={'10s': 10, '1m': 60})
+    records = []
+    for n in range(120):
+        records += rollups.add(sample(-40 - n % 10), 600.0 + n)
+    records += rollups.close()
+
+    by_measurement = {}
+    for record in records:
+        by_measurement.setdefault(record['measurement'], []).append(record)
+    assert len(by_measurement['wifi_test_10s']) == 12
+    assert len(by_measurement['wifi_test_1m']) == 2
+    assert sum(record['fields']['samples'] for record in by_measurement['wifi_test_1m']) == 120
+    assert all(record['fields']['signal_min'] == -49 for record in by_measurement['wifi_test_10s'])
@@ -0,0 +1,97 @@
+import os
+import gzip
+from time import time, sleep, monotonic
+from datetime import datetime
+
+from rotating import Rotating_file, compress_file
+
+day1 = datetime(2024, 1, 1, 23, 59)
+day2 = datetime(2024, 1, 2, 0, 1)
+
+
+def wait_for(condition, secs=2):
+    deadline = monotonic() + secs
+    while not condition() and monotonic() < deadline:
+        sleep(0.01)
+    return condition()
+
+
+def test_new_day_starts_a_new_file(tmp_path):
+    log = Rotating_file(tmp_path, 'log_{date}')
+    log.write('a\n', now=day1)
+    log.write('b\n', now=day2)
+    log.close()
+    assert tmp_path.joinpath('log_2024-01-01').read_text() == 'a\n'
+    assert tmp_path.joinpath('log_2024-01-02').read_text() == 'b\n'
+
+
+def test_full_file_rolls_over(tmp_path):
+    log = Rotating_file(tmp_path, 'log_{date}', max_bytes=10)
+    for line in ('0123456789\n', 'abcdefghij\n', 'last\n'):
+        log.write(line, now=day1)
+    log.close()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['log_2024-01-01', 'log_2024-01-01.1',
+                                                                'log_2024-01-01.2']
+    assert tmp_path.joinpath('log_2024-01-01.1').read_text() == '0123456789\n'
+    assert tmp_path.joinpath('log_2024-01-01').read_text() == 'last\n'
+
+
+def test_rolled_files_are_compressed(tmp_path):
+    log = Rotating_file(tmp_path, 'log_{date}', max_bytes=10, compress=True)
+    log.write('0123456789\n', now=day1)
+    log.write('next\n', now=day1)
+    rolled = tmp_path.joinpath('log_2024-01-01.1.gz')
+    assert wait_for(rolled.exists)
+    with gzip.open(rolled, 'rt') as f:
+        assert f.read() == '0123456789\n'
+    assert not tmp_path.joinpath('log_2024-01-01.1').exists()
+
+    # a later roll over does not reuse the number of the compressed file
+    log.write('0123456789\n', now=day1)
+    log.write('more\n', now=day1)
+    assert wait_for(tmp_path.joinpath('log_2024-01-01.2.gz').exists)
+    log.close()
+
+
+def test_compress_file(tmp_path):
+    path = tmp_path.joinpath('log_2024-01-01')
+    path.write_text('x' * 1000)
+    compress_file(path)
+    assert not path.exists()
+    with gzip.open(tmp_path.joinpath('log_2024-01-01.gz'), 'rt') as f:
+        assert f.read() == 'x' * 1000
+
+
+def test_old_files_are_pruned_on_rotation(tmp_path):
+    old = tmp_path.joinpath('log_2023-12-01')
+    old.write_text('old\n')
+    os.utime(old, (time() - 40 * 86400, time() - 40 * 86400))
+    recent = tmp_path.joinpath('log_2023-12-31')
+    recent.write_text('recent\n')
+    other = tmp_path.joinpath('summary_2023-12-01')
+    other.write_text('other\n')
+    os.utime(other, (time() - 40 * 86400, time() - 40 * 86400))
+
+    log = Rotating_file(tmp_path, 'log_{date}', retention_days=30)
+    log.write('a\n', now=day1)
+    log.write('b\n', now=day2)
+    log.close()
+    assert not old.exists()
+    assert recent.exists()
+    # other names are left alone
+    assert other.exists()
+
+
+def test_fresh_until_first_write(tmp_path):
+    log = Rotating_file(tmp_path, '{date}_summary.csv')
+    log.current(day1)
+    assert log.fresh
+    log.write('time,signal\n', now=day1)
+    assert not log.fresh
+    log.close()
+
+    # reopened on an existing file, no header due
+    log = Rotating_file(tmp_path, '{date}_summary.csv')
+    log.current(day1)
+    assert not log.fresh
+    log.close()
@@ -0,0 +1,111 @@
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+import scan_cache
+from scan_cache import Scan_cache, overlap, subchannels, channel_to_freq
+from test_iw_parser import fixture
+
+
+@pytest.fixture
+def commands(monkeypatch):
+    '''
+    iw commands run, answered with the scan fixture
+    '''
+    commands = []
+
+    def check_output(cmd, stderr=None, timeout=None):
+        commands.append(cmd)
+        return fixture('scan').encode()
+    monkeypatch.setattr(scan_cache, 'check_output', check_output)
+    return commands
+
+
+def test_dump_by_default(commands):
+    cache = Scan_cache('wlo1')
+    assert len(cache.scan_once()) == 9
+    assert commands == [['nice', '-n', '19', 'iw', 'wlo1', 'scan', 'dump']]
+    assert cache.scans == 1
+
+
+def test_trigger_is_opt_in(commands):
+    Scan_cache('wlo1', trigger=True).scan_once()
+    assert commands == [['nice', '-n', '19', 'iw', 'wlo1', 'scan']]
+
+
+def test_trigger_without_root_falls_back_to_dump(monkeypatch):
+    commands = []
+
+    def check_output(cmd, stderr=None, timeout=None):
+        commands.append(cmd)
+        if cmd[-1] == 'scan':
+            raise subprocess.CalledProcessError(255, cmd, output=b'command failed: Operation not permitted (-1)')
+        return fixture('scan').encode()
+    monkeypatch.setattr(scan_cache, 'check_output', check_output)
+
+    cache = Scan_cache('wlo1', trigger=True)
+    assert len(cache.scan_once()) == 9
+    assert [cmd[-1] for cmd in commands] == ['scan', 'dump']
+    assert not cache.trigger
+
+
+@pytest.mark.parametrize('error', [
+    subprocess.TimeoutExpired(['iw'], 30),
+    subprocess.CalledProcessError(240, ['iw'], output=b'command failed: Device or resource busy (-16)'),
+    FileNotFoundError(2, 'No such file or directory'),
+])
+def test_failed_scan_keeps_the_entries(commands, monkeypatch, error):
+    cache = Scan_cache('wlo1')
+    cache.scan_once()
+
+    def check_output(cmd, stderr=None, timeout=None):
+        raise error
+    monkeypatch.setattr(scan_cache, 'check_output', check_output)
+    assert cache.scan_once() == []
+    assert (cache.scans, cache.failures) == (1, 1)
+    assert len(cache.snapshot()) == 9
+
+
+def test_entries_expire(commands, monkeypatch):
+    cache = Scan_cache('wlo1', ttl=10)
+    cache.scan_once()
+    monkeypatch.setattr(scan_cache, 'monotonic', lambda: 1e9)
+    cache.evict(1e9)
+    assert cache.snapshot() == []
+
+
+def test_overlap_and_subchannels():
+    assert overlap(2412, 2412) == 1
+    assert overlap(2412, 2417) == 0.75
+    assert overlap(5180, 5200) == 0
+    assert subchannels(5180) == [5180]
+    assert subchannels(5180, 5210, 80) == [5180, 5200, 5220, 5240]
+    assert channel_to_freq(6, '2.4') == 2437
+    assert channel_to_freq(36, '5') == 5180
+
+
+def test_link_fields_are_cached_per_generation(commands):
+    cache = Scan_cache('wlo1')
+    link = SimpleNamespace(bssid='24:4b:fe:1a:2b:3c', freq=5180, center_freq=5210, bandwidth=80)
+    assert cache.link_fields(link) == {}
+
+    cache.scan_once()
+    fields = cache.link_fields(link)
+    assert set(fields) == {'neighbors', 'congestion'}
+    # our own AP is no neighbor
+    assert fields == dict(zip(('neighbors', 'congestion'), cache.load([5180, 5200, 5220, 5240], link.bssid)))
+    assert cache.link_fields(link) is fields
+    cache.scan_once()
+    assert cache.link_fields(link) is not fields
+
+
+def test_summary_picks_a_channel_of_each_band(commands):
+    cache = Scan_cache('wlo1')
+    cache.scan_once()
+    summary = cache.summary('24:4b:fe:1a:2b:3c')
+    assert summary['scans'] == 1
+    assert summary['neighbors_total'] == 8
+    assert summary['best_channel_24g'] in (1, 6, 11)
+    assert summary['best_channel_5g'] in scan_cache.candidate_channels['5']
+    assert set(summary['scan_index']) >= {'2.4', '5'}
@@ -0,0 +1,32 @@
+import argparse
+from time import sleep
+
+import pytest
+
+from scheduler import Tick_scheduler, parse_sample_rate
+
+
+@pytest.mark.parametrize('rate', [0, -1, float('nan'), float('inf')])
+def test_rate_must_be_positive(rate):
+    with pytest.raises(ValueError, match='sample rate must be > 0'):
+        Tick_scheduler(rate, duration=1)
+
+
+@pytest.mark.parametrize('value', ['0', '-2', 'abc', 'nan'])
+def test_parse_sample_rate_rejects(value):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_sample_rate(value)
+
+
+def test_parse_sample_rate():
+    assert parse_sample_rate('0.5') == 0.5
+
+
+def test_overrun_ticks_are_missed_not_pushed():
+    scheduler = Tick_scheduler(20, duration=0.5)
+    for tick in scheduler:
+        if tick == 2:
+            # from the deadline at 0.05 s to 0.22 s: the ones at 0.10 and 0.15 s passed
+            sleep(0.17)
+    assert scheduler.ticks + scheduler.missed_ticks == 10
+    assert scheduler.missed_ticks == 2
@@ -0,0 +1,33 @@
+import csv
+
+from rotating import Rotating_file
+from sinks import Csv_sink, write_csv_rows
+
+
+def read_rows(path):
+    with open(path, encoding='utf_8') as f:
+        return list(csv.reader(f))
+
+
+def test_csv_sink_keeps_the_columns_of_the_first_record(tmp_path):
+    sink = Csv_sink(None, tmp_path)
+    sink.write([{'measurement': 'wifi_test', 'time': 't1', 'fields': {'signal': -50, 'latency': 2.0}}])
+    sink.write([{'measurement': 'wifi_test', 'time': 't2', 'fields': {'signal': -51, 'latency': 3.0, 'new': 1}}])
+    sink.close()
+
+    path, = tmp_path.glob('wifi_test_*.csv')
+    assert read_rows(path) == [['time', 'signal', 'latency'], ['t1', '-50', '2.0'], ['t2', '-51', '3.0']]
+
+
+def test_write_csv_rows_appends_to_a_file_of_an_earlier_run(tmp_path):
+    writer = Rotating_file(tmp_path, 'summary_{date}.csv')
+    write_csv_rows(writer, [{'a': 1, 'b': 2}], ['a', 'b'], {})
+    writer.close()
+
+    # a new run, with another order of columns: the ones of the file win
+    writer = Rotating_file(tmp_path, 'summary_{date}.csv')
+    write_csv_rows(writer, [{'b': 4, 'a': 3, 'c': 5}], ['b', 'a', 'c'], {})
+    writer.close()
+
+    path, = tmp_path.glob('summary_*.csv')
+    assert read_rows(path) == [['a', 'b'], ['1', '2'], ['3', '4']]
@@ -0,0 +1,180 @@
+import json
+import pickle
+
+import pytest
+import requests
+
+from spool import Spool, Spool_replayer, is_rejected
+
+
+def records(start, count):
+    return [{'measurement': 'wifi_test', 'fields': {'n': n}} for n in range(start, start + count)]
+
+
+def numbers(batch):
+    return [record['fields']['n'] for record in batch]
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f'{status} error', response=response)
+
+
+def test_read_ack_survives_reopen(tmp_path):
+    spool = Spool(tmp_path)
+    spool.append(records(0, 5))
+    batch, position = spool.read(3)
+    assert numbers(batch) == [0, 1, 2]
+    # not acknowledged, read again from the same place
+    assert numbers(spool.read(3)[0]) == [0, 1, 2]
+    spool.ack(position)
+    spool.close()
+
+    spool = Spool(tmp_path)
+    batch, position = spool.read(10)
+    assert numbers(batch) == [3, 4]
+    spool.ack(position)
+    assert spool.size == 0
+    assert spool.read(10)[0] == []
+    spool.close()
+
+
+def test_segments_roll_and_acked_ones_are_deleted(tmp_path):
+    spool = Spool(tmp_path, segment_bytes=200)
+    for start in range(0, 12, 3):
+        spool.append(records(start, 3))
+    assert len(spool.segments()) > 2
+
+    replayed, acked = [], None
+    while True:
+        batch, position = spool.read(4)
+        if not batch:
+            break
+        replayed += numbers(batch)
+        spool.ack(position)
+        acked = position
+    assert replayed == list(range(12))
+    # segments before the acknowledged one are gone
+    assert spool.segments()[0] == acked[0]
+    assert spool.size == 0
+    spool.close()
+
+
+def test_torn_tail_is_truncated_on_open(tmp_path):
+    spool = Spool(tmp_path)
+    spool.append(records(0, 3))
+    spool.close()
+    path = spool.segment_path(spool.write_segment)
+    size = path.stat().st_size
+    # a crash in the middle of an append
+    with open(path, 'ab') as f:
+        f.write(Spool.record_header.pack(100, 0) + b'{"meas')
+
+    spool = Spool(tmp_path)
+    assert path.stat().st_size == size
+    spool.append(records(3, 1))
+    assert numbers(spool.read(10)[0]) == [0, 1, 2, 3]
+    spool.close()
+
+
+def test_corrupted_record_ends_its_segment(tmp_path):
+    spool = Spool(tmp_path, segment_bytes=100)
+    spool.append(records(0, 2))
+    spool.append(records(2, 2))
+    spool.close()
+    first = spool.segment_path(spool.segments()[0])
+    data = bytearray(first.read_bytes())
+    # flip a byte of the payload of the first record, its crc no longer matches
+    data[Spool.record_header.size + 2] ^= 0xff
+    first.write_bytes(bytes(data))
+
+    spool = Spool(tmp_path, segment_bytes=100)
+    batch, position = spool.read(10)
+    # the rest of the bad segment is skipped, the next one is read
+    assert numbers(batch) == [2, 3]
+    spool.close()
+
+
+def test_import_pickle(tmp_path):
+    send_fail = tmp_path.joinpath('send_fail')
+    send_fail.write_bytes(pickle.dumps(records(0, 2)))
+    spool = Spool(tmp_path.joinpath('spool'))
+    spool.import_pickle(send_fail)
+    assert not send_fail.exists()
+    assert numbers(spool.read(10)[0]) == [0, 1]
+    spool.close()
+
+
+def test_is_rejected():
+    assert is_rejected(http_error(400))
+    assert is_rejected(http_error(413))
+    assert not is_rejected(http_error(500))
+    assert not is_rejected(http_error(503))
+    assert not is_rejected(requests.ConnectionError('refused'))
+    assert not is_rejected(ConnectionError('refused'))
+    assert is_rejected(ValueError('bad point'))
+
+
+def test_replay_sends_in_chunks(tmp_path):
+    spool = Spool(tmp_path)
+    spool.append(records(0, 5))
+    sent = []
+    replayer = Spool_replayer(spool, sent.append, chunk_size=2, interval=60, start=False)
+    while replayer.replay_once():
+        pass
+    assert [numbers(batch) for batch in sent] == [[0, 1], [2, 3], [4]]
+    assert spool.size == 0
+    spool.close()
+
+
+def test_transport_error_keeps_the_chunk(tmp_path):
+    spool = Spool(tmp_path)
+    spool.append(records(0, 2))
+
+    def send(batch):
+        raise requests.ConnectionError('db is down')
+
+    replayer = Spool_replayer(spool, send, chunk_size=10, interval=60, start=False)
+    # raised for the backoff of the loop
+    with pytest.raises(requests.ConnectionError):
+        replayer.replay_once()
+    assert numbers(spool.read(10)[0]) == [0, 1]
+    assert not spool.quarantine_file.exists()
+    spool.close()
+
+
+def test_rejected_chunk_is_quarantined_and_skipped(tmp_path):
+    spool = Spool(tmp_path)
+    spool.append(records(0, 2))
+    spool.append(records(2, 2))
+    sent = []
+
+    def send(batch):
+        if 0 in numbers(batch):
+            raise http_error(400)
+        sent.append(batch)
+
+    replayer = Spool_replayer(spool, send, chunk_size=2, interval=60, start=False)
+    while replayer.replay_once():
+        pass
+    assert [numbers(batch) for batch in sent] == [[2, 3]]
+    assert replayer.quarantined == 2
+    quarantined = [json.loads(line) for line in spool.quarantine_file.read_text().splitlines()]
+    assert numbers(quarantined) == [0, 1]
+    assert spool.size == 0
+    spool.close()
+
+
+def test_loop_replays_in_background(tmp_path):
+    spool = Spool(tmp_path)
+    spool.append(records(0, 3))
+    sent = []
+    replayer = Spool_replayer(spool, sent.append, chunk_size=10, interval=0.05)
+    for _ in range(100):
+        if sent:
+            break
+        replayer.stop_event.wait(0.02)
+    replayer.close()
+    assert [numbers(batch) for batch in sent] == [[0, 1, 2]]
+    spool.close()
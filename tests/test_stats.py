@@ -0,0 +1,67 @@
+import math
+import random
+
+from records import split_record
+from stats import _percentile, P2_quantile, Field_stats, Run_stats
+
+
+def test_split_record():
+    tags, fields = split_record({'fields': {'location': 'lab', 'channel': 36, 'bssid': 'aa:bb', 'roaming': True,
+                                            'signal': -40, 'latency': None}})
+    assert tags == {'location': 'lab', 'channel': 36, 'bssid': 'aa:bb', 'roaming': True}
+    assert fields == {'signal': -40, 'latency': None}
+
+
+def test_percentile_interpolates():
+    assert _percentile([], 50) is None
+    assert _percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+    assert _percentile([1.0, 2.0, 3.0, 4.0], 100) == 4.0
+
+
+def test_p2_quantile_tracks_exact_percentile():
+    rng = random.Random(1)
+    values = [rng.gauss(10, 3) for _ in range(20000)]
+    p95 = P2_quantile(0.95)
+    for value in values:
+        p95.add(value)
+    exact = _percentile(sorted(values), 95)
+    assert abs(p95.value - exact) < 0.1
+
+
+def test_field_stats_summary():
+    stats = Field_stats(capacity=4, max_samples=100)
+    for ts, value in enumerate([2.764, 5.1, 12.22, 3.6]):
+        stats.add(value, ts)
+    summary = stats.summary()
+    mean = (2.764 + 5.1 + 12.22 + 3.6) / 4
+    assert summary['avg'] == round(mean, 3)
+    # population std, as ping's mdev
+    std = math.sqrt(sum((v - mean) ** 2 for v in (2.764, 5.1, 12.22, 3.6)) / 4)
+    assert summary['std'] == round(std, 3)
+    assert (summary['min'], summary['max']) == (2.764, 12.22)
+    # the last value has no duration yet
+    assert summary['twa'] == round((2.764 + 5.1 + 12.22) / 3, 3)
+
+
+def test_field_stats_keeps_at_most_max_samples():
+    stats = Field_stats(capacity=16, max_samples=100)
+    for ts in range(1000):
+        stats.add(float(ts), ts)
+    assert stats.stored == 100
+    assert len(stats.values) == 100
+    assert stats.count == 1000
+    # exact whatever the reservoir keeps
+    assert stats.summary()['avg'] == 499.5
+    assert stats.summary()['max'] == 999
+
+
+def test_run_stats_skips_tags_and_none():
+    stats = Run_stats(capacity=16, max_samples=100)
+    for ts, mcs in enumerate([7, 7, 9, None]):
+        stats.add({'location': 'lab', 'channel': 36, 'signal': -40 - ts, 'rx_mcs': mcs}, ts)
+    summary = stats.summary()
+    assert stats.count == 4
+    assert 'channel_avg' not in summary
+    assert summary['signal_avg'] == -41.5
+    assert summary['rx_mcs_dist'] == {'7': 0.667, '9': 0.333}
+    assert stats.field('latency') == {}